@@ -18,12 +18,18 @@ from handlers.astrological import (
     handle_astrological_callback, 
     handle_astrological_date_callback, 
     handle_cancel_date_input,
-    handle_date_input
+    handle_date_input,
+    DATE_CALLBACK_PREFIX
 )
 from handlers.dream_save import handle_save_dream_callback
 
 # Импорты конфигурации
 from core.config import TELEGRAM_TOKEN, SECRET_TOKEN
+from core.database import get_db
+from core.ai_service import ai_service
+from core.tokens import token_counter
+from core.summarizer import summarizer
+from core.voice_gate import voice_gate
 
 # Настройка логирования
 logging.basicConfig(
@@ -49,11 +55,10 @@ async def main_button_handler(update, context):
     await query.answer()
     
     # Логируем нажатие кнопки
-    from core.database import db
-    db.log_activity(update.effective_user, str(update.effective_chat.id), f"button:{query.data}")
+    get_db().log_activity(update.effective_user, str(update.effective_chat.id), f"button:{query.data}")
     
     # Обновляем последнюю активность пользователя
-    db.update_latest_activity(update.effective_user, str(update.effective_chat.id))
+    get_db().update_latest_activity(update.effective_user, str(update.effective_chat.id))
     
     # Обработка главного меню
     if query.data == "main_menu":
@@ -89,7 +94,7 @@ async def main_button_handler(update, context):
         return
     
     # Обработчик выбора даты для астрологического толкования
-    if query.data.startswith("astrological_date:"):
+    if query.data.startswith(("astrological_date:", DATE_CALLBACK_PREFIX)):
         await handle_astrological_date_callback(update, context, query.data)
         return
     
@@ -149,6 +154,13 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("🚀 Starting webhook server...")
     
+    # Подключаемся к БД в фоне: до готовности /health отвечает "not ready"
+    db_startup = asyncio.create_task(get_db().start(), name="db_startup")
+    # Словарь токенизатора грузится в отдельном потоке, чтобы не блокировать первый запрос
+    tokenizer_warm_up = asyncio.create_task(asyncio.to_thread(token_counter.warm_up), name="tokenizer_warm_up")
+    # Пересказ переписки работает, когда БД готова
+    summarizer.start()
+    
     try:
         # Очищаем Telegram-меню (≡)
         await telegram_app.bot.set_my_commands([])
@@ -183,6 +195,12 @@ async def lifespan(app: FastAPI):
         await telegram_app.stop()
         await telegram_app.shutdown()
         logger.info("✅ Telegram application stopped")
+        
+        db_startup.cancel()
+        tokenizer_warm_up.cancel()
+        await summarizer.stop()
+        await get_db().close()
+        logger.info("✅ Database pool closed")
     except Exception as e:
         logger.error(f"❌ Shutdown error: {e}")
 
@@ -209,6 +227,9 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Проверка здоровья приложения"""
+    if not get_db().ready:
+        raise HTTPException(status_code=503, detail="Database not ready")
+    
     try:
         # Проверяем, что Telegram приложение работает
         bot_info = await telegram_app.bot.get_me()
@@ -223,6 +244,30 @@ async def health_check():
         raise HTTPException(status_code=503, detail="Service unavailable")
 
 
+@app.get("/metrics")
+async def metrics():
+    """Внутренние счетчики приложения (буферы, очереди)"""
+    return {
+        "activity_log": get_db().activity_buffer.stats(),
+        "user_stats": get_db().stats_accumulator.stats(),
+        "dream_counters": {"repaired": get_db().dream_counters_repaired},
+        "pending_dreams_cache": get_db().pending_dreams_cache.stats(),
+        "history_cache": get_db().history_cache.stats(),
+        "profile_cache": get_db().profile_cache.stats(),
+        "openai_chat": ai_service.chat_governor.stats(),
+        "openai_audio": ai_service.audio_governor.stats(),
+        "openai_resilience": ai_service.resilience.stats(),
+        "prompt_cache": ai_service.prompt_cache.stats(),
+        "summary_cache": get_db().summary_cache.stats(),
+        "transcription_cache": get_db().transcription_cache.stats(),
+        "summarizer": summarizer.stats(),
+        "voice_gate": voice_gate.stats(),
+        "voice_chunked_transcriptions": ai_service.chunked_transcriptions,
+        "voice_chunking_failures": ai_service.chunking_failures,
+        "voice_dropped_segments": dict(ai_service.dropped_segments)
+    }
+
+
 @app.post("/webhook")
 async def webhook(request: Request):
     """Webhook эндпоинт для получения обновлений от Telegram"""
@@ -234,6 +279,10 @@ async def webhook(request: Request):
                 logger.warning("Invalid secret token in webhook request")
                 raise HTTPException(status_code=403, detail="Invalid secret token")
         
+        # Пока БД не готова, просим Telegram повторить доставку позже
+        if not get_db().ready:
+            raise HTTPException(status_code=503, detail="Database not ready")
+        
         # Получаем и обрабатываем обновление
         data = await request.json()
         update = Update.de_json(data, telegram_app.bot)
@@ -243,6 +292,8 @@ async def webhook(request: Request):
         
         return {"status": "ok"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Webhook error: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
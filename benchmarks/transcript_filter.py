@@ -0,0 +1,58 @@
+"""
+Поиск подозрительных фраз в расшифровке: прежний цикл, одно общее выражение и PhraseMatcher
+
+Запуск из корня проекта:
+    python -m benchmarks.transcript_filter
+"""
+import os
+import re
+import timeit
+
+os.environ.setdefault("TELEGRAM_TOKEN", "benchmark")
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from core.config import WHISPER_SETTINGS
+from core.transcript_filter import suspicious_phrase_matcher
+
+SAMPLE = (
+    "Мне приснилось, что я иду по старому городу, вокруг темно, и я слышу мелодию "
+    "откуда-то из окна. Мой страх рос, было плохо. Потом я оказался на вокзале "
+    "и долго искал свой поезд, а за мной бежал мой старый пес. "
+)
+
+# Одно выражение на все фразы - проверяет каждую позицию текста
+_ALTERNATION = re.compile(
+    r"(?<!\w)(?:" + "|".join(re.escape(phrase.lower()) for phrase in WHISPER_SETTINGS["suspicious_phrases"]) + r")(?!\w)"
+)
+
+
+def loop_scan(text: str):
+    """Прежний способ: lower() каждой фразы и поиск подстроки при каждом вызове"""
+    text_lower = text.lower()
+    return [phrase for phrase in WHISPER_SETTINGS["suspicious_phrases"] if phrase.lower() in text_lower]
+
+
+def alternation_scan(text: str):
+    return _ALTERNATION.findall(text.lower())
+
+
+def matcher_scan(text: str):
+    return suspicious_phrase_matcher.find_all(text.lower())
+
+
+def main():
+    # ~20 сек, ~2 мин и ~10 мин речи
+    for repeat in (2, 10, 60):
+        text = SAMPLE * repeat
+        number = max(50, 5000 // repeat)
+        loop = min(timeit.repeat(lambda: loop_scan(text), number=number, repeat=5)) / number
+        alternation = min(timeit.repeat(lambda: alternation_scan(text), number=number, repeat=5)) / number
+        matcher = min(timeit.repeat(lambda: matcher_scan(text), number=number, repeat=5)) / number
+        print(
+            f"{len(text):>6} симв.: цикл {loop * 1e6:7.1f} мкс, общее выражение {alternation * 1e6:7.1f} мкс, "
+            f"PhraseMatcher {matcher * 1e6:7.1f} мкс"
+        )
+
+
+if __name__ == "__main__":
+    main()
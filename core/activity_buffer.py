@@ -0,0 +1,130 @@
+"""
+Буфер отложенной записи для user_activity_log
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from core.background import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityBuffer:
+    """
+    Накапливает строки лога активности в памяти и пишет их в БД пачками.
+
+    Обработчики только кладут строку в очередь и не ждут БД. Сброс происходит
+    по интервалу, при достижении batch_size и при остановке приложения.
+    Если очередь заполнена (БД недоступна долгое время), новые строки
+    отбрасываются и учитываются в счетчике dropped.
+
+    Пачка, упавшая не из-за недоступности БД (is_transient), делится
+    пополам, пока ошибочная строка не останется одна: остальные строки
+    записываются, а она повторяется не больше max_row_attempts раз и
+    отбрасывается (счетчик rejected), чтобы не блокировать весь лог.
+    """
+
+    def __init__(self, write_batch: Callable[[List[tuple]], Awaitable], batch_size: int,
+                 flush_interval: float, max_queue: int, max_row_attempts: int = 3,
+                 is_transient: Callable[[Exception], bool] = lambda e: False):
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.max_row_attempts = max_row_attempts
+        self.is_transient = is_transient
+        # Элементы очереди: (строка, число неудачных попыток записи этой строки отдельно)
+        self._rows = deque()
+        self._flush_lock = asyncio.Lock()
+        self._flusher = PeriodicTask("activity_log_flush", flush_interval, self.flush, run_on_stop=True)
+
+        # Счетчики для мониторинга
+        self.enqueued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.failed_flushes = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._rows)
+
+    def add(self, row: tuple):
+        """Добавление строки в очередь (без ожидания БД)"""
+        if len(self._rows) >= self.max_queue:
+            self.dropped += 1
+            return
+
+        self._rows.append((row, 0))
+        self.enqueued += 1
+
+        if len(self._rows) >= self.batch_size:
+            self._flusher.trigger()
+
+    async def flush(self):
+        """Запись всех накопленных строк одной пачкой"""
+        async with self._flush_lock:
+            if not self._rows:
+                return
+
+            batch = list(self._rows)
+            self._rows.clear()
+
+            retry = await self._write(batch)
+            if retry:
+                self.failed_flushes += 1
+                # Возвращаем незаписанное в начало очереди, чтобы повторить при следующем сбросе
+                room = max(0, self.max_queue - len(self._rows))
+                retained = retry[:room]
+                self._rows.extendleft(reversed(retained))
+                self.dropped += len(retry) - len(retained)
+
+    async def _write(self, batch: List[Tuple[tuple, int]]) -> List[Tuple[tuple, int]]:
+        """
+        Запись пачки с поиском ошибочной строки делением пополам
+
+        Returns:
+            Элементы, которые нужно повторить при следующем сбросе
+        """
+        try:
+            await self.write_batch([row for row, _ in batch])
+            self.flushed += len(batch)
+            return []
+        except Exception as e:
+            if self.is_transient(e):
+                # БД недоступна - делить пачку бесполезно
+                logger.error(f"❌ Не удалось записать лог активности ({len(batch)} строк): {e}")
+                return batch
+
+            if len(batch) > 1:
+                middle = len(batch) // 2
+                return await self._write(batch[:middle]) + await self._write(batch[middle:])
+
+            row, attempts = batch[0]
+            attempts += 1
+            if attempts >= self.max_row_attempts:
+                self.rejected += 1
+                logger.error(f"❌ Строка лога активности отброшена после {attempts} попыток: {row!r}: {e}")
+                return []
+            logger.warning(f"⚠️ Строка лога активности не записана (попытка {attempts}): {e}")
+            return [(row, attempts)]
+
+    def start(self):
+        """Запуск фонового сброса"""
+        self._flusher.start()
+
+    async def stop(self):
+        """Остановка фонового сброса с финальной записью очереди"""
+        await self._flusher.stop()
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики буфера для мониторинга"""
+        return {
+            "queue_depth": self.queue_depth,
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "failed_flushes": self.failed_flushes
+        }
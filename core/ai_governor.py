@@ -0,0 +1,206 @@
+"""
+Общий планировщик запросов к OpenAI: лимиты RPM/TPM, очередь с приоритетами
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from core.error_handler import AIOverloadedError
+
+logger = logging.getLogger(__name__)
+
+
+class _Bucket:
+    """Бюджет на минуту, пополняемый равномерно (token bucket)"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, amount: float) -> float:
+        """Через сколько секунд в бюджете наберется amount (0 - уже есть)"""
+        self._refill()
+        # Запрос больше минутного бюджета пропускаем при полном бюджете, иначе он не пройдет никогда
+        missing = min(amount, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount: float):
+        self.level -= amount
+
+    def refund(self, amount: float):
+        """Возврат (или доначисление при отрицательном amount) после фактического расхода"""
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class Ticket:
+    """Разрешение на запрос; used - фактический расход токенов, если он известен"""
+
+    __slots__ = ("lane", "tokens", "used", "_future", "_enqueued_at")
+
+    def __init__(self, lane: str, tokens: int):
+        self.lane = lane
+        self.tokens = tokens
+        self.used: Optional[int] = None
+        self._future: Optional[asyncio.Future] = None
+        self._enqueued_at = time.monotonic()
+
+
+class RequestGovernor:
+    """
+    Планировщик запросов к одному семейству моделей OpenAI.
+
+    Запрос ждет в очереди своей полосы (lane), пока не освободится слот
+    конкурентности и не наберется бюджет запросов/токенов на минуту.
+    Полосы обслуживаются строго по приоритету (меньше - раньше), внутри
+    полосы - по порядку поступления. Очередь каждой полосы ограничена:
+    при переполнении или превышении max_wait запрос сразу отклоняется
+    с AIOverloadedError, а не уходит в OpenAI за ответом 429.
+    """
+
+    def __init__(self, name: str, rpm: int, tpm: Optional[int], max_concurrent: int, lanes: Dict[str, Dict]):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.lanes = lanes
+        self._requests = _Bucket(rpm)
+        self._tokens = _Bucket(tpm) if tpm else None
+        self._queue = []
+        self._seq = itertools.count()
+        self._active = 0
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+
+        # Счетчики для мониторинга по полосам
+        self._queued = {lane: 0 for lane in lanes}
+        self._granted = {lane: 0 for lane in lanes}
+        self._rejected = {lane: 0 for lane in lanes}
+        self._timeouts = {lane: 0 for lane in lanes}
+        self._wait_max = {lane: 0.0 for lane in lanes}
+        self._recent_waits = {lane: deque(maxlen=500) for lane in lanes}
+
+    @asynccontextmanager
+    async def slot(self, lane: str, tokens: int = 0):
+        """
+        Ожидание очереди и удержание слота на время запроса
+
+        Args:
+            lane: Полоса приоритета из настроек
+            tokens: Оценка токенов запроса (промпт + max_tokens)
+        """
+        ticket = await self.acquire(lane, tokens)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    async def acquire(self, lane: str, tokens: int = 0) -> Ticket:
+        """Постановка в очередь и ожидание разрешения на запрос"""
+        settings = self.lanes[lane]
+        if self._queued[lane] >= settings["max_queue"]:
+            self._rejected[lane] += 1
+            raise AIOverloadedError(f"{self.name}: очередь {lane} переполнена")
+
+        ticket = Ticket(lane, tokens)
+        ticket._future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (settings["priority"], next(self._seq), ticket))
+        self._queued[lane] += 1
+        self._pump()
+
+        if not ticket._future.done():
+            try:
+                await asyncio.wait({ticket._future}, timeout=settings["max_wait"])
+            except asyncio.CancelledError:
+                self._abandon(ticket)
+                raise
+
+        if not ticket._future.done():
+            self._abandon(ticket)
+            self._timeouts[lane] += 1
+            raise AIOverloadedError(f"{self.name}: ожидание в очереди {lane} дольше {settings['max_wait']} с")
+
+        return ticket
+
+    def release(self, ticket: Ticket):
+        """Освобождение слота и корректировка бюджета токенов по фактическому расходу"""
+        self._active -= 1
+        if self._tokens and ticket.used is not None:
+            self._tokens.refund(ticket.tokens - ticket.used)
+        self._pump()
+
+    def _abandon(self, ticket: Ticket):
+        """Отказ от ожидания: если разрешение уже выдано, слот возвращается"""
+        if ticket._future.done():
+            self.release(ticket)
+            return
+        ticket._future.cancel()
+        self._queued[ticket.lane] -= 1
+
+    def _pump(self):
+        """Выдача разрешений ожидающим запросам, пока хватает слотов и бюджета"""
+        if self._wakeup:
+            self._wakeup.cancel()
+            self._wakeup = None
+
+        while self._queue and self._active < self.max_concurrent:
+            _, _, ticket = self._queue[0]
+            if ticket._future.done():
+                # Запрос перестал ждать (таймаут, отмена)
+                heapq.heappop(self._queue)
+                continue
+
+            delay = self._requests.delay(1)
+            if self._tokens:
+                delay = max(delay, self._tokens.delay(ticket.tokens))
+            if delay > 0:
+                # Запросы с меньшим приоритетом не обгоняют голову очереди
+                self._wakeup = asyncio.get_running_loop().call_later(delay, self._pump)
+                return
+
+            heapq.heappop(self._queue)
+            self._requests.take(1)
+            if self._tokens:
+                self._tokens.take(ticket.tokens)
+            self._active += 1
+            self._queued[ticket.lane] -= 1
+            self._granted[ticket.lane] += 1
+
+            waited = time.monotonic() - ticket._enqueued_at
+            self._recent_waits[ticket.lane].append(waited)
+            self._wait_max[ticket.lane] = max(self._wait_max[ticket.lane], waited)
+            ticket._future.set_result(None)
+
+    def stats(self) -> Dict:
+        """Счетчики планировщика для мониторинга"""
+        self._requests.delay(0)
+        if self._tokens:
+            self._tokens.delay(0)
+
+        lanes = {}
+        for lane in self.lanes:
+            waits = sorted(self._recent_waits[lane])
+            lanes[lane] = {
+                "queued": self._queued[lane],
+                "granted": self._granted[lane],
+                "rejected": self._rejected[lane],
+                "timeouts": self._timeouts[lane],
+                "wait_p50": round(waits[len(waits) // 2], 3) if waits else 0.0,
+                "wait_p95": round(waits[int(len(waits) * 0.95)], 3) if waits else 0.0,
+                "wait_max": round(self._wait_max[lane], 3)
+            }
+        return {
+            "active": self._active,
+            "requests_budget": int(self._requests.level),
+            "tokens_budget": int(self._tokens.level) if self._tokens else None,
+            "lanes": lanes
+        }
@@ -0,0 +1,172 @@
+"""
+Повторы, дедлайны и дублирующие (hedged) запросы к OpenAI
+"""
+import asyncio
+import logging
+import random
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import openai
+
+from core.error_handler import AIServiceError, AITimeoutError, AIUnavailableError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Ошибки, после которых запрос имеет смысл повторить (429, 5xx, обрыв соединения, таймаут)
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+
+
+class LatencyTracker:
+    """Скользящее окно длительностей успешных запросов"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, p: float, min_samples: int) -> Optional[float]:
+        """Перцентиль длительности или None, пока замеров недостаточно"""
+        if len(self._samples) < min_samples:
+            return None
+        samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+class ResilientCaller:
+    """
+    Выполнение запросов к OpenAI с общим дедлайном, повторами и хеджированием.
+
+    Запрос повторяется при 429/5xx/сетевых ошибках с экспоненциальной
+    паузой и случайным разбросом (Retry-After от OpenAI имеет приоритет),
+    пока не истечет дедлайн операции. Если включено хеджирование и запрос
+    идет дольше p95 предыдущих, параллельно отправляется второй такой же -
+    используется первый успешный ответ. Наружу выходят только
+    AIServiceError и ее подклассы.
+    """
+
+    def __init__(self, settings: Dict):
+        self.settings = settings
+        self._latency: Dict[str, LatencyTracker] = {}
+
+        # Счетчики для мониторинга
+        self.retries = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    async def call(self, operation: str, request: Callable[[float], Awaitable[T]], hedge: bool = True) -> T:
+        """
+        Выполнение запроса в пределах дедлайна операции
+
+        Args:
+            operation: Имя операции (ключ в deadlines, у каждой своя статистика задержек)
+            request: Фабрика запроса; получает оставшееся до дедлайна время для таймаута клиента
+            hedge: Можно ли дублировать запрос (нельзя для потоковых ответов)
+        """
+        loop = asyncio.get_running_loop()
+        deadline = self.settings["deadlines"][operation]
+        expires_at = loop.time() + deadline
+        tracker = self._latency.setdefault(operation, LatencyTracker())
+
+        async def attempt() -> T:
+            started = loop.time()
+            result = await request(max(0.1, expires_at - loop.time()))
+            tracker.add(loop.time() - started)
+            return result
+
+        try:
+            async with asyncio.timeout(deadline):
+                for attempt_number in range(self.settings["max_attempts"]):
+                    try:
+                        if hedge and self.settings["hedge_enabled"]:
+                            return await self._hedged(attempt, tracker)
+                        return await attempt()
+                    except RETRYABLE_ERRORS as e:
+                        if not self._retryable(e) or attempt_number + 1 == self.settings["max_attempts"]:
+                            raise
+                        pause = self._backoff(attempt_number, e)
+                        if loop.time() + pause >= expires_at:
+                            raise
+                        self.retries += 1
+                        logger.warning(f"⚠️ {operation}: {type(e).__name__}, повтор через {pause:.1f} с")
+                        await asyncio.sleep(pause)
+        except TimeoutError as e:
+            self.timeouts += 1
+            raise AITimeoutError(f"{operation}: дедлайн {deadline} с истек") from e
+        except AIServiceError:
+            raise
+        except openai.APITimeoutError as e:
+            self.timeouts += 1
+            raise AITimeoutError(f"{operation}: {e}") from e
+        except openai.OpenAIError as e:
+            self.failures += 1
+            raise AIUnavailableError(f"{operation}: {type(e).__name__}: {e}") from e
+
+    @staticmethod
+    def _retryable(error: Exception) -> bool:
+        # Исчерпанная квота - не временная перегрузка, повтор не поможет
+        return getattr(error, "code", None) != "insufficient_quota"
+
+    def _backoff(self, attempt_number: int, error: Exception) -> float:
+        """Пауза перед повтором: Retry-After от OpenAI или экспонента с полным разбросом"""
+        response = getattr(error, "response", None)
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            try:
+                if retry_after is not None:
+                    return min(float(retry_after), self.settings["backoff_max"])
+            except ValueError:
+                pass
+        ceiling = min(self.settings["backoff_max"], self.settings["backoff_base"] * 2 ** attempt_number)
+        return random.uniform(0, ceiling)
+
+    async def _hedged(self, attempt: Callable[[], Awaitable[T]], tracker: LatencyTracker) -> T:
+        """Запрос с дублем, если первый идет дольше обычного"""
+        delay = tracker.percentile(self.settings["hedge_percentile"], self.settings["hedge_min_samples"])
+        if delay is None:
+            return await attempt()
+
+        primary = asyncio.create_task(attempt())
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=max(delay, self.settings["hedge_min_delay"]))
+            if done:
+                return primary.result()
+
+            self.hedges += 1
+            hedge = asyncio.create_task(attempt())
+            tasks.add(hedge)
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> Dict:
+        """Счетчики для мониторинга"""
+        return {
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "p95": {
+                operation: round(p95, 3)
+                for operation, tracker in self._latency.items()
+                if (p95 := tracker.percentile(0.95, 1)) is not None
+            }
+        }
@@ -3,106 +3,232 @@
 """
 import os
 import io
-import tempfile
+import asyncio
+import openai
 from openai import AsyncOpenAI
-from datetime import datetime, timezone
-from typing import Optional, Dict, List, Tuple
-from core.config import AI_SETTINGS, DEFAULT_SYSTEM_PROMPT, WHISPER_SETTINGS
+import time
+from collections import Counter
+from typing import AsyncIterator, Optional, Dict, List, Tuple
+from core import prompts
+from core.config import (
+    AI_SETTINGS, WHISPER_SETTINGS, OPENAI_GOVERNOR, AI_RESILIENCE, CONVERSATION_SUMMARY, VOICE_CHUNKING
+)
+from core.ai_governor import RequestGovernor
+from core.ai_resilience import ResilientCaller
+from core.error_handler import AIServiceError, AITimeoutError, AIUnavailableError
+from core.tokens import token_counter
+from core.ogg_opus import parse_opus, split_opus, write_opus
+from core.transcript_filter import TranscriptAnalysis, analyze_transcript, filter_segments
+
+
+class AudioUpload(io.RawIOBase):
+    """
+    Файл для загрузки в OpenAI поверх буфера в памяти (без копирования)
+    
+    Имя нужно API для определения формата по расширению, seek/tell -
+    httpx для вычисления Content-Length.
+    """
+    
+    def __init__(self, data: "bytes | bytearray | memoryview", name: str):
+        super().__init__()
+        self._data = memoryview(data).cast("B")
+        self._position = 0
+        self.name = name
+    
+    def readable(self) -> bool:
+        return True
+    
+    def seekable(self) -> bool:
+        return True
+    
+    def readinto(self, buffer) -> int:
+        chunk = self._data[self._position:self._position + len(buffer)]
+        buffer[:len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+    
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._data)
+        self._position = max(0, offset)
+        return self._position
+    
+    def tell(self) -> int:
+        return self._position
+
+
+class PromptCacheStats:
+    """Учет кэширования префикса промпта на стороне OpenAI по типам запросов"""
+    
+    def __init__(self):
+        self._operations: Dict[str, Dict[str, float]] = {}
+    
+    def record(self, operation: str, usage, latency: float):
+        """
+        Учет одного ответа
+        
+        Args:
+            usage: response.usage (prompt_tokens и prompt_tokens_details.cached_tokens)
+            latency: Время ответа (для потока - до первого фрагмента)
+        """
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = (getattr(details, "cached_tokens", None) or 0) if details else 0
+        
+        stats = self._operations.setdefault(operation, {
+            "requests": 0, "prompt_tokens": 0, "cached_tokens": 0,
+            "hit_requests": 0, "hit_latency": 0.0, "miss_latency": 0.0
+        })
+        stats["requests"] += 1
+        stats["prompt_tokens"] += usage.prompt_tokens or 0
+        stats["cached_tokens"] += cached
+        if cached:
+            stats["hit_requests"] += 1
+            stats["hit_latency"] += latency
+        else:
+            stats["miss_latency"] += latency
+    
+    def stats(self) -> Dict[str, Dict]:
+        """Доля закэшированных токенов и средняя задержка с попаданием в кэш и без"""
+        result = {}
+        for operation, stats in self._operations.items():
+            misses = stats["requests"] - stats["hit_requests"]
+            result[operation] = {
+                "requests": stats["requests"],
+                "prompt_tokens": stats["prompt_tokens"],
+                "cached_tokens": stats["cached_tokens"],
+                "cached_ratio": round(stats["cached_tokens"] / stats["prompt_tokens"], 3) if stats["prompt_tokens"] else 0.0,
+                "hit_requests": stats["hit_requests"],
+                "avg_latency_hit": round(stats["hit_latency"] / stats["hit_requests"], 3) if stats["hit_requests"] else None,
+                "avg_latency_miss": round(stats["miss_latency"] / misses, 3) if misses else None
+            }
+        return result
 
 
 class AIService:
     """Сервис для работы с OpenAI API"""
     
     def __init__(self):
-        self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # Повторы делает ResilientCaller: с учетом дедлайна и через планировщик
+        self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+        # Все запросы к OpenAI проходят через общие очереди с лимитами аккаунта
+        self.chat_governor = RequestGovernor("chat", **OPENAI_GOVERNOR["chat"])
+        self.audio_governor = RequestGovernor("audio", **OPENAI_GOVERNOR["audio"])
+        self.resilience = ResilientCaller(AI_RESILIENCE)
+        self.prompt_cache = PromptCacheStats()
+        # Сколько голосовых расшифровано по частям
+        self.chunked_transcriptions = 0
+        self.chunking_failures = 0
+        # Отброшенные сегменты verbose-расшифровок по причинам
+        self.dropped_segments: Counter = Counter()
     
-    def build_prompt(self, profile_info: str = "") -> str:
-        """Построение персонализированного промпта"""
-        today_str = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-        prompt = DEFAULT_SYSTEM_PROMPT
-        prompt += f"\n\n# Current date\nToday is {today_str}."
+    @staticmethod
+    def estimate_tokens(messages: List[Dict], max_tokens: Optional[int] = None) -> int:
+        """Оценка токенов запроса для бюджета TPM (промпт + максимум ответа)"""
+        return token_counter.count_messages(messages) + (max_tokens or AI_SETTINGS["max_tokens"])
+    
+    async def _complete(self, lane: str, messages: List[Dict], max_tokens: Optional[int] = None,
+                        temperature: Optional[float] = None) -> str:
+        """Запрос к GPT через планировщик с повторами (ошибки - AIServiceError)"""
+        max_tokens = max_tokens or AI_SETTINGS["max_tokens"]
+        tokens = self.estimate_tokens(messages, max_tokens)
         
-        if profile_info:
-            prompt += f"\n\n# User context\n{profile_info.strip()}"
+        async def request(timeout: float) -> str:
+            # Каждая попытка заново встает в очередь и учитывает фактический расход токенов
+            async with self.chat_governor.slot(lane, tokens) as ticket:
+                started = time.monotonic()
+                response = await self.client.chat.completions.create(
+                    model=AI_SETTINGS["model"],
+                    messages=messages,
+                    temperature=AI_SETTINGS["temperature"] if temperature is None else temperature,
+                    max_tokens=max_tokens,
+                    timeout=timeout
+                )
+                if response.usage:
+                    ticket.used = response.usage.total_tokens
+                self.prompt_cache.record(lane, response.usage, time.monotonic() - started)
+            
+            content = response.choices[0].message.content
+            if not content:
+                raise AIUnavailableError(f"{lane}: пустой ответ (finish_reason={response.choices[0].finish_reason})")
+            return content
         
-        return prompt
+        return await self.resilience.call(lane, request)
     
-    def format_profile_info(self, profile: Optional[Tuple]) -> str:
-        """Форматирование информации профиля"""
-        if not profile:
-            return ""
-        
-        gender, age_group, lucid = profile
-        profile_parts = []
+    def build_dream_messages(self, dream_text: str, history: List[Dict], profile_info: str = "",
+                             summary: str = "") -> List[Dict]:
+        """Сообщения для запроса толкования сна (история обрезается по бюджету max_input_tokens)"""
+        return prompts.dream_messages(dream_text, history, profile_info, summary, AI_SETTINGS["max_input_tokens"])
+    
+    async def analyze_dream(self, dream_text: str, history: List[Dict], profile_info: str = "", summary: str = "") -> str:
+        """Анализ сна через GPT-4 (ошибки - AIServiceError)"""
+        return await self._complete("dream", self.build_dream_messages(dream_text, history, profile_info, summary))
+    
+    async def stream_dream_analysis(self, dream_text: str, history: List[Dict], profile_info: str = "",
+                                    summary: str = "") -> AsyncIterator[str]:
+        """Анализ сна через GPT-4 в потоковом режиме: фрагменты ответа по мере генерации (ошибки - AIServiceError)"""
+        messages = self.build_dream_messages(dream_text, history, profile_info, summary)
+        tokens = self.estimate_tokens(messages)
+        started = time.monotonic()
         
-        if gender:
-            profile_parts.append(f"User gender: {gender}")
-        if age_group:
-            profile_parts.append(f"User age group: {age_group}")
-        if lucid:
-            profile_parts.append(f"Lucid dream experience: {lucid}")
+        async def request(timeout: float):
+            # Каждая попытка открыть поток заново встает в очередь планировщика
+            ticket = await self.chat_governor.acquire("dream", tokens)
+            try:
+                stream = await self.client.chat.completions.create(
+                    model=AI_SETTINGS["model"],
+                    messages=messages,
+                    temperature=AI_SETTINGS["temperature"],
+                    max_tokens=AI_SETTINGS["max_tokens"],
+                    stream=True,
+                    # Расход токенов приходит последним фрагментом (без choices)
+                    stream_options={"include_usage": True},
+                    timeout=timeout
+                )
+            except BaseException:
+                self.chat_governor.release(ticket)
+                raise
+            return ticket, stream
         
-        return ". ".join(profile_parts) + ("." if profile_parts else "")
-    
-    async def analyze_dream(self, dream_text: str, history: List[Dict], profile_info: str = "") -> str:
-        """Анализ сна через GPT-4"""
+        # Повторяется только открытие потока: уже показанный пользователю текст не переиграть
+        ticket, stream = await self.resilience.call("dream", request, hedge=False)
+        # Слот удерживается до конца генерации и освобождается при закрытии генератора (aclose),
+        # в том числе при ошибке или отмене у вызывающего кода
+        first_chunk_latency = None
         try:
-            prompt = self.build_prompt(profile_info)
-            
-            # Добавляем дату сна в промпт (по умолчанию сегодня)
-            today_str = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-            dream_with_date = f"Сон от {today_str}:\n{dream_text}"
-            
-            response = await self.client.chat.completions.create(
-                model=AI_SETTINGS["model"],
-                messages=[{"role": "system", "content": prompt}] + history + [{"role": "user", "content": dream_with_date}],
-                temperature=AI_SETTINGS["temperature"],
-                max_tokens=AI_SETTINGS["max_tokens"]
-            )
-            
-            return response.choices[0].message.content
-            
-        except Exception as e:
-            return f"❌ Ошибка при анализе сна: {e}"
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first_chunk_latency is None:
+                        first_chunk_latency = time.monotonic() - started
+                    yield chunk.choices[0].delta.content
+                if chunk.usage:
+                    ticket.used = chunk.usage.total_tokens
+                    self.prompt_cache.record("dream_stream", chunk.usage, first_chunk_latency or 0.0)
+        except openai.APITimeoutError as e:
+            raise AITimeoutError(f"dream: обрыв потока по таймауту: {e}") from e
+        except openai.OpenAIError as e:
+            raise AIUnavailableError(f"dream: обрыв потока: {type(e).__name__}: {e}") from e
+        finally:
+            self.chat_governor.release(ticket)
+            await stream.close()
     
-    async def analyze_clarification_question(self, question: str, clarification_prompt: str) -> str:
-        """Анализ уточняющего вопроса через GPT-4"""
-        try:
-            response = await self.client.chat.completions.create(
-                model=AI_SETTINGS["model"],
-                messages=[
-                    {"role": "system", "content": clarification_prompt},
-                    {"role": "user", "content": question}
-                ],
-                temperature=AI_SETTINGS["temperature"],
-                max_tokens=AI_SETTINGS["max_tokens"]
-            )
-            
-            return response.choices[0].message.content
-            
-        except Exception as e:
-            return f"❌ Ошибка при ответе на вопрос: {e}"
+    async def analyze_clarification_question(self, question: str, context_summary: str) -> str:
+        """Анализ уточняющего вопроса через GPT-4 (ошибки - AIServiceError)"""
+        return await self._complete("clarification", prompts.clarification_messages(question, context_summary))
     
     async def analyze_dream_astrologically(self, dream_text: str, previous_interpretation: str, source_type: str, dream_date: str = None) -> str:
-        """Астрологический анализ сна с сохранением контекста и тона"""
-        try:
-            # Создаем специальный промпт для астрологического анализа
-            date_info = f"Дата сна: {dream_date}" if dream_date else "Дата сна: не указана"
-            
-            astrological_prompt = f"""PROMPT = "#Role You are an experienced astrologer; #Task Give ONLY an astrological analysis of the dream, without repeating or retelling any previous interpretation; {date_info} USER'S DREAM: {dream_text}; #Rules Start with 🔮 emoji and immediately begin astrological analysis; use astrological approach: planets, zodiac signs, houses, aspects; link dream symbols with astrological archetypes; if dream date is given, use it; be thorough & supportive; structure analysis with emojis; NO greetings or introductory phrases; #Usercontext End by inviting reflection/response; write in Russian using informal 'ты'."""
-
-            response = await self.client.chat.completions.create(
-                model=AI_SETTINGS["model"],
-                messages=[
-                    {"role": "system", "content": astrological_prompt},
-                    {"role": "user", "content": f"Проанализируй мой сон астрологически: {dream_text}"}
-                ],
-                temperature=AI_SETTINGS["temperature"],
-                max_tokens=AI_SETTINGS["max_tokens"]
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            return f"❌ Ошибка при астрологическом анализе: {e}"
+        """Астрологический анализ сна с сохранением контекста и тона (ошибки - AIServiceError)"""
+        return await self._complete("astrology", prompts.astrology_messages(dream_text, dream_date))
+    
+    async def summarize_conversation(self, previous_summary: str, messages: List[Dict]) -> str:
+        """Обновление пересказа переписки новыми сообщениями (фоновая полоса, ошибки - AIServiceError)"""
+        return await self._complete(
+            "background", prompts.summary_messages(previous_summary, messages),
+            max_tokens=CONVERSATION_SUMMARY["max_tokens"], temperature=0.2
+        )
     
     def extract_message_type(self, ai_response: str) -> str:
         """Извлечение типа сообщения из ответа AI"""
@@ -115,74 +241,141 @@ class AIService:
         else:
             return 'unknown'
     
-    async def transcribe_voice(self, voice_file_content: bytes, file_extension: str = "ogg") -> Optional[str]:
-        """Транскрипция голосового сообщения через Whisper"""
-        temp_file_path = None
+    async def _transcribe(self, audio: "bytes | bytearray | memoryview", filename: str) -> str:
+        """
+        Один запрос к Whisper через планировщик с повторами
         
-        try:
-            # Создаем временный файл
-            with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_extension}") as temp_file:
-                temp_file.write(voice_file_content)
-                temp_file_path = temp_file.name
-            
-            # Транскрибируем через Whisper с улучшенными настройками
-            with open(temp_file_path, "rb") as audio_file:
-                transcript = await self.client.audio.transcriptions.create(
+        В режиме verbose Whisper возвращает сегменты с оценками уверенности,
+        и сегменты-галлюцинации (тишина, зацикливание, титры) отбрасываются
+        по отдельности.
+        """
+        verbose = WHISPER_SETTINGS["verbose"]
+        
+        async def request(timeout: float):
+            async with self.audio_governor.slot("voice"):
+                # Новый буфер на каждую попытку: предыдущая могла дочитать его до конца
+                return await self.client.audio.transcriptions.create(
                     model="whisper-1",
-                    file=audio_file,
+                    file=AudioUpload(audio, filename),
                     language="ru",
                     # Добавляем параметры для лучшего распознавания
-                    response_format="text",
-                    temperature=0.2  # Немного снижаем температуру для более точного распознавания
+                    response_format="verbose_json" if verbose else "text",
+                    temperature=0.2,  # Немного снижаем температуру для более точного распознавания
+                    timeout=timeout
                 )
+        
+        transcript = await self.resilience.call("voice", request)
+        if not verbose:
+            return transcript.strip()
+        
+        if not transcript.segments:
+            return transcript.text.strip()
+        text, dropped = filter_segments(transcript.segments)
+        if dropped:
+            self.dropped_segments.update(reason for reason, _ in dropped)
+            print(f"⚠️ Отброшено сегментов расшифровки: {len(dropped)} из {len(transcript.segments)} {dropped}")
+        return text
+    
+    @staticmethod
+    def _split_voice(audio: "bytes | bytearray | memoryview") -> Optional[List[bytes]]:
+        """Длинное сообщение Ogg/Opus, нарезанное на части, или None, если резать не нужно"""
+        stream = parse_opus(audio)
+        if stream is None or stream.duration < VOICE_CHUNKING["min_duration"]:
+            return None
+        chunks = split_opus(
+            stream, VOICE_CHUNKING["chunk_seconds"], VOICE_CHUNKING["overlap_seconds"], VOICE_CHUNKING["boundary_window"]
+        )
+        if len(chunks) < 2:
+            return None
+        return [write_opus(stream, chunk) for chunk in chunks]
+    
+    @staticmethod
+    def stitch_transcripts(texts: List[str], max_overlap_words: int) -> str:
+        """
+        Склейка расшифровок соседних частей с удалением повтора на стыке
+        
+        Части перекрываются, поэтому конец предыдущей расшифровки обычно
+        повторяется в начале следующей. Ищется самое длинное совпадение
+        (без учета регистра и пунктуации) конца предыдущей части с началом
+        следующей; до двух первых слов следующей части могут быть обрезаны
+        на границе и пропускаются.
+        """
+        def normalize(word: str) -> str:
+            return word.strip(".,!?;:…\"'«»()-—").lower()
+        
+        words: List[str] = []
+        for text in texts:
+            current = text.split()
+            tail = [normalize(word) for word in words[-max_overlap_words:]]
+            head = [normalize(word) for word in current[:max_overlap_words + 2]]
+            drop = 0
+            for skip in range(3):
+                for size in range(min(len(tail), len(head) - skip), 0, -1):
+                    # Совпадение в одно слово надежно только для длинного слова в самом начале
+                    if size == 1 and (skip or len(head[0]) < 5):
+                        break
+                    if tail[-size:] == head[skip:skip + size]:
+                        drop = skip + size
+                        break
+                if drop:
+                    break
+            words.extend(current[drop:])
+        return " ".join(words)
+    
+    async def transcribe_voice(self, audio: "bytes | bytearray | memoryview", file_extension: str = "ogg") -> Optional[str]:
+        """
+        Транскрипция голосового сообщения через Whisper
+        
+        Файл загружается прямо из памяти, без копирования и временных файлов.
+        Длинные сообщения Ogg/Opus режутся по паузам на перекрывающиеся
+        части, которые расшифровываются параллельно.
+        
+        Returns:
+            Текст или None, если распознать не удалось; недоступность сервиса - AIServiceError
+        """
+        if len(audio) > WHISPER_SETTINGS["max_upload_bytes"]:
+            print(f"❌ Голосовое сообщение слишком большое для транскрипции: {len(audio)} байт")
+            return None
+        
+        try:
+            chunks = None
+            if file_extension == "ogg" and VOICE_CHUNKING["enabled"]:
+                try:
+                    # Разбор и сборка страниц с CRC - в отдельном потоке, чтобы не блокировать обработку других апдейтов
+                    chunks = await asyncio.to_thread(self._split_voice, audio)
+                except Exception as e:
+                    # Нарезка - только ускорение: файл целиком Whisper все равно примет
+                    self.chunking_failures += 1
+                    print(f"⚠️ Не удалось нарезать голосовое сообщение, расшифровываем целиком: {e}")
+            
+            if not chunks:
+                return await self._transcribe(audio, f"voice.{file_extension}")
+            
+            try:
+                # Ошибка одной части отменяет остальные
+                async with asyncio.TaskGroup() as tg:
+                    tasks = [tg.create_task(self._transcribe(chunk, f"voice_{i}.ogg")) for i, chunk in enumerate(chunks)]
+            except ExceptionGroup as group:
+                raise group.exceptions[0]
+            
+            self.chunked_transcriptions += 1
+            return self.stitch_transcripts([task.result() for task in tasks], VOICE_CHUNKING["max_overlap_words"])
                 
-                return transcript.strip()
-                
+        except AIServiceError:
+            raise
         except Exception as e:
             print(f"❌ Ошибка транскрипции: {e}")
             return None
-            
-        finally:
-            # Удаляем временный файл
-            if temp_file_path:
-                try:
-                    os.unlink(temp_file_path)
-                except:
-                    pass
     
-    def is_transcription_suspicious(self, transcribed_text: str, voice_duration: float) -> Tuple[bool, str]:
+    def is_transcription_suspicious(self, transcribed_text: str, voice_duration: float,
+                                    analysis: TranscriptAnalysis = None) -> Tuple[bool, str]:
         """Проверка транскрипции на подозрительность (галлюцинации Whisper)"""
-        if not transcribed_text:
-            return True, "empty_text"
-        
-        text_lower = transcribed_text.lower()
-        words = text_lower.split()
-        
-        # 1. Проверка на подозрительные фразы (только для явных случаев)
-        suspicious_phrases = WHISPER_SETTINGS["suspicious_phrases"]
-        for phrase in suspicious_phrases:
-            if phrase.lower() in text_lower:
-                # Для коротких аудио отклоняем сразу, для длинных - только явные случаи
-                if voice_duration < 3 or phrase in ["редактор субтитров", "подписывайтесь на канал", "ставьте лайки"]:
-                    return True, f"suspicious_phrase: {phrase}"
-        
-        # 2. Слишком мало слов для длинного аудио (смягчаем проверку)
-        if voice_duration > 6 and len(words) < voice_duration / 3:  # Было /2, стало /3
-            return True, f"too_short_text: {len(words)} words for {voice_duration}s"
-        
-        # 3. Только междометия (смягчаем - разрешаем больше междометий)
-        interjections = {"ммм", "хмм", "эм", "ага", "угу", "ой", "ах", "ох", "эх", "ух"}
-        if len(words) <= 2 and all(word in interjections for word in words) and voice_duration > 3:
-            return True, "only_interjections"
-        
-        # 4. Повторяющиеся символы (смягчаем - разрешаем короткие)
-        for word in words:
-            if len(word) > 5 and len(set(word)) == 1:  # Было >3, стало >5
-                return True, f"repetitive_chars: {word}"
-        
-        return False, ""
+        if analysis is None:
+            analysis = analyze_transcript(transcribed_text, voice_duration)
+        return analysis.verdict()
     
-    def should_reject_voice_message(self, transcribed_text: str, voice_duration: float) -> Tuple[bool, str]:
+    def should_reject_voice_message(self, transcribed_text: str, voice_duration: float,
+                                    analysis: TranscriptAnalysis = None) -> Tuple[bool, str]:
         """Определение, следует ли отклонить голосовое сообщение"""
         
         # Фильтруем очень короткие сообщения (вероятно случайные)
@@ -190,7 +383,7 @@ class AIService:
             return True, f"too_short_duration: {voice_duration}s"
         
         # Проверяем на подозрительность
-        is_suspicious, reason = self.is_transcription_suspicious(transcribed_text, voice_duration)
+        is_suspicious, reason = self.is_transcription_suspicious(transcribed_text, voice_duration, analysis)
         
         if is_suspicious:
             # Для коротких аудио и фразовых совпадений отклоняем сразу
@@ -202,51 +395,26 @@ class AIService:
         
         return False, ""
     
-    def test_voice_settings(self, transcribed_text: str, voice_duration: float) -> Dict[str, any]:
+    def test_voice_settings(self, transcribed_text: str, voice_duration: float,
+                            analysis: TranscriptAnalysis = None) -> Dict[str, any]:
         """Тестовая функция для проверки настроек распознавания голоса"""
+        if analysis is None:
+            analysis = analyze_transcript(transcribed_text, voice_duration)
         result = {
             "duration": voice_duration,
             "text": transcribed_text,
-            "words_count": len(transcribed_text.split()) if transcribed_text else 0,
-            "checks": {}
+            "words_count": len(analysis.words),
+            "checks": {"empty_text": analysis.empty_text}
         }
         
-        # Проверяем каждое условие отдельно
-        if not transcribed_text:
-            result["checks"]["empty_text"] = True
-        else:
-            result["checks"]["empty_text"] = False
-            
-            text_lower = transcribed_text.lower()
-            words = text_lower.split()
-            
-            # Проверка на подозрительные фразы
-            suspicious_phrases = WHISPER_SETTINGS["suspicious_phrases"]
-            found_suspicious = []
-            for phrase in suspicious_phrases:
-                if phrase.lower() in text_lower:
-                    found_suspicious.append(phrase)
-            result["checks"]["suspicious_phrases"] = found_suspicious
-            
-            # Проверка на количество слов
-            if voice_duration > 6 and len(words) < voice_duration / 3:
-                result["checks"]["too_short_text"] = True
-            else:
-                result["checks"]["too_short_text"] = False
-            
-            # Проверка на междометия
-            interjections = {"ммм", "хмм", "эм", "ага", "угу", "ой", "ах", "ох", "эх", "ух"}
-            if len(words) <= 2 and all(word in interjections for word in words) and voice_duration > 3:
-                result["checks"]["only_interjections"] = True
-            else:
-                result["checks"]["only_interjections"] = False
-            
-            # Проверка на повторяющиеся символы
-            repetitive_chars = []
-            for word in words:
-                if len(word) > 5 and len(set(word)) == 1:
-                    repetitive_chars.append(word)
-            result["checks"]["repetitive_chars"] = repetitive_chars
+        # Результаты каждой проверки отдельно
+        if not analysis.empty_text:
+            result["checks"].update({
+                "suspicious_phrases": analysis.suspicious_phrases,
+                "too_short_text": analysis.too_short_text,
+                "only_interjections": analysis.only_interjections,
+                "repetitive_chars": analysis.repetitive_chars
+            })
         
         return result
 
@@ -0,0 +1,68 @@
+"""
+Фоновые периодические задачи (сброс буферов, обслуживание БД)
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """Периодический запуск корутины в фоне с возможностью досрочного пробуждения"""
+
+    def __init__(self, name: str, interval: float, func: Callable[[], Awaitable], run_on_stop: bool = False):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.run_on_stop = run_on_stop
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Запуск фоновой задачи в текущем event loop"""
+        if self.running:
+            return
+        self._stopping = False
+        self._wakeup.clear()
+        self._task = asyncio.create_task(self._run(), name=self.name)
+
+    def trigger(self):
+        """Досрочный запуск, не дожидаясь интервала"""
+        self._wakeup.set()
+
+    async def stop(self):
+        """Остановка задачи (текущий запуск дорабатывает до конца)"""
+        if self._task:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+        # Финальный запуск, например, чтобы сбросить буфер перед выключением
+        if self.run_on_stop:
+            await self.run_once()
+
+    async def run_once(self):
+        """Однократный запуск с логированием ошибок"""
+        try:
+            await self.func()
+        except Exception as e:
+            logger.error(f"❌ Фоновая задача {self.name} завершилась с ошибкой: {e}")
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            if self._stopping:
+                break
+            await self.run_once()
@@ -0,0 +1,70 @@
+"""
+Небольшой LRU-кэш в памяти процесса
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """
+    LRU-кэш с ограничением по числу записей и временем жизни записи.
+
+    Кэш локален для процесса: при нескольких репликах каждая держит свою
+    копию, поэтому ttl должен быть коротким, а запись в БД идет через кэш
+    (write-through), а не вместо нее.
+    """
+
+    def __init__(self, max_size: int, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+        # Счетчики для мониторинга
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Значение по ключу (просроченные записи считаются отсутствующими)"""
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._items[key]
+            self.misses += 1
+            return default
+
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        """Запись значения с вытеснением самых давно использованных записей"""
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        self._items[key] = (value, expires_at)
+        self._items.move_to_end(key)
+
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Удаление записи"""
+        item = self._items.pop(key, None)
+        return item[0] if item else default
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики кэша для мониторинга"""
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
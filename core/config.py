@@ -18,12 +18,153 @@ DATABASE_CONFIG = {
     "dbname": os.getenv("PGDATABASE")
 }
 
+# Пул соединений (psycopg_pool)
+DATABASE_POOL = {
+    "min_size": int(os.getenv("PG_POOL_MIN_SIZE", 2)),
+    "max_size": int(os.getenv("PG_POOL_MAX_SIZE", 10)),
+    "timeout": float(os.getenv("PG_POOL_TIMEOUT", 10)),  # Ожидание свободного соединения, сек
+    "max_idle": 300,  # Закрывать простаивающие соединения сверх min_size через 5 минут
+    "reconnect_timeout": 300,  # Сколько пытаться переподключиться, прежде чем сдаться
+    "startup_retry_initial": 1.0,  # Первая пауза между попытками подключения при старте, сек
+    "startup_retry_max": 30.0  # Максимальная пауза между попытками, сек
+}
+
+# Буфер лога активности (user_activity_log пишется пачками)
+ACTIVITY_LOG = {
+    "batch_size": 200,  # Сбрасывать досрочно при накоплении стольких строк
+    "flush_interval": 2.0,  # Сбрасывать не реже, чем раз в N секунд
+    "max_queue": 10000,  # Сверх этого строки отбрасываются (счетчик dropped)
+    "max_row_attempts": 3,  # Строка, которую БД отвергает, после стольких попыток отбрасывается (счетчик rejected)
+    "backfill_batch": 5000,  # Строк старого (несекционированного) лога, переносимых за одну транзакцию
+    "backfill_interval": 1.0  # Пауза между порциями переноса, сек
+}
+
+# Партиции user_activity_log (помесячные) и срок хранения
+ACTIVITY_LOG_RETENTION = {
+    "months_ahead": 2,  # Сколько будущих месяцев держать созданными заранее
+    "retention_months": int(os.getenv("ACTIVITY_LOG_RETENTION_MONTHS", 3)),  # Хранить сырые логи за N прошлых месяцев
+    "maintenance_interval": 6 * 3600  # Как часто создавать/удалять партиции, сек
+}
+
+# Агрегатор счетчиков user_stats (один upsert на чат за интервал)
+USER_STATS = {
+    "flush_interval": 5.0,  # Как часто записывать накопленные счетчики, сек
+    "max_pending_chats": 500  # Сбрасывать досрочно при накоплении стольких чатов
+}
+
+# Кэш истории переписки в памяти (последние max_history * 2 сообщений на чат)
+HISTORY_CACHE = {
+    "max_chats": 5000,  # Сколько чатов держать в памяти
+    "max_chars": 20_000_000,  # Суммарный объем текста сообщений в кэше, символов
+    "ttl": 300  # Буфер чата перечитывается из БД через N сек после загрузки (записи других реплик)
+}
+
+# Кэш профилей (готовая строка профиля для промпта)
+PROFILE_CACHE = {
+    "max_size": 5000,  # Сколько профилей держать в памяти
+    "ttl": 300  # Время жизни записи, сек (сброс при сохранении профиля - только в своей реплике)
+}
+
+# === ВРЕМЕННЫЕ ДАННЫЕ СНОВ ===
+PENDING_DREAMS = {
+    "ttl_hours": 48,  # Сколько хранить несохраненное толкование (кнопки "Сохранить"/"Астрология")
+    "sweep_interval": 3600,  # Как часто удалять просроченные записи, сек
+    "cache_size": 1000,  # Записей в кэше процесса
+    "cache_ttl": 600  # Время жизни записи в кэше, сек
+}
+
+# === ПЕРЕСКАЗ ПЕРЕПИСКИ ===
+# Старая часть переписки сворачивается в пересказ, в GPT идут пересказ и последние сообщения.
+# keep_recent + refresh_every не должно превышать размер кэша истории (max_history * 2)
+CONVERSATION_SUMMARY = {
+    "enabled": os.getenv("CONVERSATION_SUMMARY_ENABLED", "true").lower() == "true",
+    "keep_recent": 8,  # Последние сообщения всегда передаются как есть
+    "refresh_every": 10,  # Пересказ обновляется после стольких новых сообщений
+    "batch_size": 40,  # Максимум сообщений, сворачиваемых за один запрос
+    "message_chars": 1500,  # Сообщение обрезается до стольких символов перед пересказом
+    "max_tokens": 600,  # Максимальная длина пересказа
+    "interval": 60,  # Как часто проверять чаты с новыми сообщениями, сек
+    "max_chats_per_run": 50,  # Чатов за один проход
+    "cache_size": 5000,  # Пересказов в кэше процесса
+    "cache_ttl": 600  # Время жизни записи в кэше, сек
+}
+
+# === КЭШ РАСШИФРОВОК ГОЛОСОВЫХ ===
+# Ключ - file_unique_id: пересланное или повторно отправленное сообщение не скачивается и не расшифровывается
+TRANSCRIPTION_CACHE = {
+    "cache_size": 2000,  # Записей в кэше процесса
+    "cache_ttl": 3600,  # Время жизни записи в кэше процесса, сек
+    "db_enabled": os.getenv("TRANSCRIPTION_CACHE_DB", "true").lower() == "true",  # Общий для реплик уровень в Postgres
+    "ttl_hours": 24 * 7,  # Сколько хранить расшифровку в БД
+    "sweep_interval": 3600  # Как часто удалять просроченные записи, сек
+}
+
+# === СЧЕТЧИКИ СНОВ ===
+DREAM_COUNTERS = {
+    "reconcile_interval": 3600.0,  # Как часто сверять счетчики с таблицей dreams, сек
+    "reconcile_batch": 500  # Счетчиков в одной транзакции сверки
+}
+
 # === AI МОДЕЛЬ НАСТРОЙКИ ===
 AI_SETTINGS = {
     "model": "gpt-4o",
     "temperature": 0.45,
     "max_tokens": 1400,
-    "max_history": 10
+    "max_history": 10,
+    "max_input_tokens": int(os.getenv("AI_MAX_INPUT_TOKENS", "6000"))  # Бюджет промпта: история добавляется, пока в него помещается
+}
+
+# Планировщик запросов к OpenAI: лимиты аккаунта и полосы приоритета
+# priority - меньше обслуживается раньше; max_queue - сколько запросов полосы может ждать;
+# max_wait - сколько секунд запрос ждет в очереди, прежде чем пользователь получит отказ
+OPENAI_GOVERNOR = {
+    "chat": {
+        "rpm": int(os.getenv("OPENAI_CHAT_RPM", "450")),  # С запасом от лимита аккаунта
+        "tpm": int(os.getenv("OPENAI_CHAT_TPM", "270000")),
+        "max_concurrent": int(os.getenv("OPENAI_CHAT_CONCURRENCY", "32")),
+        "lanes": {
+            "dream": {"priority": 0, "max_queue": 200, "max_wait": 30},
+            "clarification": {"priority": 1, "max_queue": 100, "max_wait": 30},
+            "astrology": {"priority": 2, "max_queue": 100, "max_wait": 45},
+            "background": {"priority": 3, "max_queue": 50, "max_wait": 300}
+        }
+    },
+    "audio": {
+        "rpm": int(os.getenv("OPENAI_AUDIO_RPM", "45")),
+        "tpm": None,  # Whisper ограничен только по числу запросов
+        "max_concurrent": int(os.getenv("OPENAI_AUDIO_CONCURRENCY", "8")),
+        "lanes": {
+            "voice": {"priority": 0, "max_queue": 100, "max_wait": 30}
+        }
+    }
+}
+
+# Повторы и дедлайны запросов к OpenAI
+AI_RESILIENCE = {
+    "max_attempts": 4,  # Попыток на один запрос (включая первую)
+    "backoff_base": 0.5,  # Базовая пауза перед повтором, удваивается с каждой попыткой (секунды)
+    "backoff_max": 8.0,  # Максимальная пауза перед повтором (секунды)
+    "deadlines": {  # Общий дедлайн операции с учетом очереди и повторов (секунды)
+        "dream": 90,
+        "clarification": 60,
+        "astrology": 90,
+        "background": 300,
+        "voice": 60
+    },
+    # Дублирующий запрос, если первый идет дольше hedge_percentile предыдущих (удваивает расход на хвосте)
+    "hedge_enabled": os.getenv("AI_HEDGING_ENABLED", "false").lower() == "true",
+    "hedge_percentile": 0.95,
+    "hedge_min_samples": 50,  # Пока замеров меньше, запросы не дублируются
+    "hedge_min_delay": 3.0  # Не дублировать раньше чем через N секунд
+}
+
+# Потоковый вывод толкования (постепенное редактирование сообщения)
+STREAMING = {
+    "enabled": os.getenv("STREAMING_ENABLED", "true").lower() == "true",
+    "edit_interval": 1.0,  # Не чаще одной правки сообщения в чате за N секунд (лимиты Telegram)
+    "first_edit_chars": 20,  # Первая правка - как только набралось столько символов
+    "min_chars_delta": 40,  # Следующие правки - только при приросте текста на столько символов
+    "cursor": " ▍"  # Индикатор продолжения генерации
 }
 
 # === ПУТИ К ФАЙЛАМ ===
@@ -58,9 +199,34 @@ if not ADMIN_CHAT_ID:
 ADMIN_CHAT_IDS = [ADMIN_CHAT_ID] if ADMIN_CHAT_ID else []
 
 # === WHISPER НАСТРОЙКИ ===
+# Отсев голосовых сообщений до транскрипции (минимальная длительность и размер - в WHISPER_SETTINGS)
+VOICE_GATE = {
+    "enabled": os.getenv("VOICE_GATE_ENABLED", "true").lower() == "true",
+    "speech_bitrate": 10000,  # Пакет Opus с битрейтом выше считается речью, бит/с (тишина - единицы кбит/с)
+    "min_speech_seconds": 0.6,  # Меньше речи - сообщение считается тишиной
+    "min_speech_ratio": 0.05  # Доля речи от длительности, ниже которой сообщение - тишина
+}
+
+# Параллельная транскрипция длинных голосовых сообщений по частям
+VOICE_CHUNKING = {
+    "enabled": os.getenv("VOICE_CHUNKING_ENABLED", "true").lower() == "true",
+    "min_duration": 45,  # Сообщения короче отправляются в Whisper целиком, сек
+    "chunk_seconds": 25,  # Целевая длина части, сек
+    "boundary_window": 5.0,  # Граница ищется в самом тихом месте в пределах +-N сек от целевой точки
+    "overlap_seconds": 1.5,  # Перекрытие соседних частей, сек
+    "max_overlap_words": 12  # Сколько слов на стыке сравнивать при удалении повтора
+}
+
 WHISPER_SETTINGS = {
+    "max_upload_bytes": 20 * 1024 * 1024,  # Больше не скачиваем и не отправляем (лимит Whisper - 25 МБ)
     "min_duration": 1,  # Уменьшаем минимальную длительность с 2 до 1 секунды
     "max_duration_for_phrase_filter": 3,  # Уменьшаем с 5 до 3 секунд для более мягкой фильтрации
+    # Расшифровка по сегментам (verbose_json): галлюцинации отбрасываются по отдельности, а не всем сообщением
+    "verbose": os.getenv("WHISPER_VERBOSE", "true").lower() == "true",
+    "max_no_speech_prob": 0.6,  # Сегмент - тишина, если вероятность отсутствия речи выше...
+    "no_speech_max_logprob": -1.0,  # ...и модель при этом не уверена в тексте (как в самом Whisper)
+    "min_avg_logprob": -1.5,  # Сегмент с меньшей средней log-вероятностью токенов отбрасывается
+    "max_compression_ratio": 2.4,  # Сжимаемость текста выше - зацикленный повтор
     "suspicious_phrases": [
         # YouTube/видео артефакты (оставляем только самые явные)
         "редактор субтитров", "подписывайтесь на канал", "ставьте лайки", "всем пока",
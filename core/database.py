@@ -1,279 +1,255 @@
 """
 Модуль для работы с базой данных PostgreSQL
 """
-import psycopg2
-import psycopg2.extras
-from datetime import datetime, timezone
+import asyncio
+import random
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timezone, timedelta
 from typing import List, Tuple, Optional, Dict, Any
-from core.config import DATABASE_CONFIG
+import psycopg
+from psycopg_pool import AsyncConnectionPool
+from core.config import (
+    DATABASE_CONFIG, DATABASE_POOL, ACTIVITY_LOG, USER_STATS, DREAM_COUNTERS, ACTIVITY_LOG_RETENTION, PENDING_DREAMS,
+    HISTORY_CACHE, PROFILE_CACHE, AI_SETTINGS, CONVERSATION_SUMMARY, TRANSCRIPTION_CACHE
+)
+from core.activity_buffer import ActivityBuffer
+from core.stats_accumulator import StatsAccumulator
+from core.background import PeriodicTask
+from core.cache import LRUCache
+from core.history_cache import ConversationHistoryCache
+from core.tokens import token_counter
+from core.models import MessageFormatter
+from core.migrations import (
+    run_migrations, create_activity_partitions, add_months, current_month, ACTIVITY_PARTITION_RE
+)
 
 
 class DatabaseManager:
     """Менеджер для работы с базой данных"""
     
     def __init__(self):
-        self.conn = None
-        self._connect()
-        self._init_tables()
-    
-    def _connect(self):
-        """Подключение к базе данных"""
-        try:
-            self.conn = psycopg2.connect(**DATABASE_CONFIG)
-            self.conn.autocommit = True
-            print("✅ Подключение к базе данных установлено")
-        except Exception as e:
-            print(f"❌ Ошибка подключения к БД: {e}")
-            raise
-    
-    def _init_tables(self):
-        """Инициализация таблиц"""
-        self.init_user_stats_table()
-        self.init_messages_table()
-        self.init_user_profile_table()
-        self.init_user_activity_log_table()
-        self.init_dreams_table()
-        self.init_pending_dreams_table()
-        self._migrate_database()
-    
-    def init_user_stats_table(self):
-        """Создание таблицы статистики пользователей"""
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS user_stats (
-                    chat_id VARCHAR(20) PRIMARY KEY,
-                    username VARCHAR(100),
-                    messages_sent INTEGER DEFAULT 0,
-                    audio_sent INTEGER DEFAULT 0,
-                    symbols_sent INTEGER DEFAULT 0,
-                    starts_count INTEGER DEFAULT 0,
-                    dreams_saved INTEGER DEFAULT 0,
-                    latest_activity TIMESTAMP DEFAULT NOW(),
-                    updated_at TIMESTAMP DEFAULT NOW()
-                )
-            """)
-    
-    def init_messages_table(self):
-        """Создание таблицы сообщений"""
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS messages (
-                    id SERIAL PRIMARY KEY,
-                    chat_id VARCHAR(20) NOT NULL,
-                    role VARCHAR(20) NOT NULL,
-                    content TEXT NOT NULL,
-                    timestamp TIMESTAMP DEFAULT NOW()
-                )
-            """)
-            # Индекс для быстрого поиска истории
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_messages_chat_id_timestamp 
-                ON messages (chat_id, timestamp DESC)
-            """)
-    
-    def init_user_profile_table(self):
-        """Создание таблицы профилей пользователей"""
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS user_profile (
-                    chat_id VARCHAR(20) PRIMARY KEY,
-                    username VARCHAR(100),
-                    gender VARCHAR(20),
-                    age_group VARCHAR(20),
-                    lucid_dreaming VARCHAR(20),
-                    updated_at TIMESTAMP DEFAULT NOW()
-                )
-            """)
-    
-    def init_user_activity_log_table(self):
-        """Создание таблицы логов активности"""
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS user_activity_log (
-                    id SERIAL PRIMARY KEY,
-                    user_id BIGINT,
-                    username VARCHAR(100),
-                    chat_id VARCHAR(20),
-                    action VARCHAR(50),
-                    content TEXT,
-                    timestamp TIMESTAMP DEFAULT NOW()
-                )
-            """)
-    
-    def init_dreams_table(self):
-        """Создание таблицы снов"""
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS dreams (
-                    id SERIAL PRIMARY KEY,
-                    chat_id VARCHAR(20) NOT NULL,
-                    dream_text TEXT NOT NULL,
-                    interpretation TEXT NOT NULL,
-                    astrological_interpretation TEXT,
-                    source_type VARCHAR(25) NOT NULL DEFAULT 'text',
-                    created_at TIMESTAMP DEFAULT NOW(),
-                    dream_date DATE DEFAULT CURRENT_DATE,
-                    tags TEXT[] DEFAULT '{}'
-                )
-            """)
-            # Индекс для быстрого поиска снов пользователя
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_dreams_chat_id_date 
-                ON dreams (chat_id, created_at DESC)
-            """)
-    
-    def init_pending_dreams_table(self):
-        """Создание таблицы временных данных снов"""
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS pending_dreams (
-                    id SERIAL PRIMARY KEY,
-                    chat_id VARCHAR(20) NOT NULL,
-                    dream_text TEXT NOT NULL,
-                    interpretation TEXT NOT NULL,
-                    source_type VARCHAR(25) NOT NULL,
-                    astrological_interpretation TEXT,
-                    created_at TIMESTAMP DEFAULT NOW(),
-                    updated_at TIMESTAMP DEFAULT NOW()
-                )
-            """)
-            # Индекс для быстрого поиска временных данных
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_pending_dreams_chat_id 
-                ON pending_dreams (chat_id)
-            """)
+        # Пул создается закрытым: соединения открываются в connect() внутри event loop
+        self.pool = AsyncConnectionPool(
+            kwargs={**DATABASE_CONFIG, "autocommit": True},
+            min_size=DATABASE_POOL["min_size"],
+            max_size=DATABASE_POOL["max_size"],
+            timeout=DATABASE_POOL["timeout"],
+            max_idle=DATABASE_POOL["max_idle"],
+            reconnect_timeout=DATABASE_POOL["reconnect_timeout"],
+            check=AsyncConnectionPool.check_connection,
+            name="bot-oracle",
+            open=False
+        )
+        
+        # Лог активности пишется пачками в фоне
+        self.activity_buffer = ActivityBuffer(
+            self.write_activity_batch,
+            batch_size=ACTIVITY_LOG["batch_size"],
+            flush_interval=ACTIVITY_LOG["flush_interval"],
+            max_queue=ACTIVITY_LOG["max_queue"],
+            max_row_attempts=ACTIVITY_LOG["max_row_attempts"],
+            # Нет соединения - пачку повторяем целиком, а не ищем в ней ошибочную строку
+            is_transient=lambda e: isinstance(e, (psycopg.OperationalError, psycopg.InterfaceError))
+        )
+        
+        # Счетчики user_stats копятся в памяти и пишутся одним upsert на чат
+        self.stats_accumulator = StatsAccumulator(
+            self.write_stats_batch,
+            flush_interval=USER_STATS["flush_interval"],
+            max_pending_chats=USER_STATS["max_pending_chats"]
+        )
+        
+        # Сверка денормализованных счетчиков снов с таблицей dreams
+        self.dream_counters_reconciler = PeriodicTask(
+            "dream_counters_reconcile",
+            DREAM_COUNTERS["reconcile_interval"],
+            self.reconcile_dream_counters
+        )
+        self.dream_counters_repaired = 0
+        
+        # Создание будущих партиций лога активности, свертка и удаление старых
+        self.activity_log_maintenance = PeriodicTask(
+            "activity_log_maintenance",
+            ACTIVITY_LOG_RETENTION["maintenance_interval"],
+            self.maintain_activity_log
+        )
+        
+        # Перенос строк из несекционированного лога, оставшегося после миграции 4
+        self.activity_log_backfill = PeriodicTask(
+            "activity_log_backfill",
+            ACTIVITY_LOG["backfill_interval"],
+            self.backfill_activity_log
+        )
+        self.activity_backfill_pending = True
+        
+        # Последние сообщения чатов для контекста GPT
+        self.history_cache = ConversationHistoryCache(
+            messages_per_chat=AI_SETTINGS["max_history"] * 2,
+            max_chats=HISTORY_CACHE["max_chats"],
+            max_chars=HISTORY_CACHE["max_chars"],
+            ttl=HISTORY_CACHE["ttl"],
+            count_tokens=token_counter.count_exact
+        )
+        
+        # Готовые строки профилей для промпта (сбрасываются при сохранении профиля в этой реплике,
+        # изменения через другие реплики видны по истечении ttl)
+        self.profile_cache = LRUCache(PROFILE_CACHE["max_size"], PROFILE_CACHE["ttl"])
+        
+        # Пересказы старой части переписки: (текст, id последнего пересказанного сообщения)
+        self.summary_cache = LRUCache(CONVERSATION_SUMMARY["cache_size"], CONVERSATION_SUMMARY["cache_ttl"])
+        # Сколько сообщений записано в чат с последней проверки пересказа
+        self._unsummarized: Dict[str, int] = {}
+        
+        # Временные данные снов: кэш чтения и удаление просроченных записей
+        self.pending_dreams_cache = LRUCache(PENDING_DREAMS["cache_size"], PENDING_DREAMS["cache_ttl"])
+        self.pending_dreams_sweeper = PeriodicTask(
+            "pending_dreams_sweep",
+            PENDING_DREAMS["sweep_interval"],
+            self.sweep_pending_dreams
+        )
+        
+        # Расшифровки голосовых: (текст, причина отказа) по file_unique_id
+        self.transcription_cache = LRUCache(TRANSCRIPTION_CACHE["cache_size"], TRANSCRIPTION_CACHE["cache_ttl"])
+        self.transcriptions_sweeper = PeriodicTask(
+            "voice_transcriptions_sweep",
+            TRANSCRIPTION_CACHE["sweep_interval"],
+            self.sweep_transcriptions
+        )
+        
+        # БД готова к работе: пул открыт и схема мигрирована
+        self.ready = False
+    
+    async def connect(self):
+        """Открытие пула соединений и миграция схемы БД"""
+        # Пул открывается без ожидания: соединения устанавливаются в фоне и
+        # переустанавливаются самим пулом, а ошибку дает первый запрос
+        await self.pool.open()
+        version = await run_migrations(self.pool)
+        print(f"✅ База данных готова (версия схемы {version})")
+        
+        self.activity_buffer.start()
+        self.stats_accumulator.start()
+        self.dream_counters_reconciler.start()
+        self.activity_log_maintenance.start()
+        self.activity_log_backfill.start()
+        self.pending_dreams_sweeper.start()
+        if TRANSCRIPTION_CACHE["db_enabled"]:
+            self.transcriptions_sweeper.start()
+        # Партиции на будущие месяцы создаются в фоне, не задерживая старт
+        self.activity_log_maintenance.trigger()
+        self.ready = True
+    
+    async def start(self):
+        """
+        Подключение к БД с повторами и экспоненциальной задержкой
+        
+        Запускается в фоне при старте приложения: пока БД недоступна,
+        процесс работает и отвечает "not ready", а не падает.
+        """
+        delay = DATABASE_POOL["startup_retry_initial"]
+        attempt = 1
+        while not self.ready:
+            try:
+                await self.connect()
+            except Exception as e:
+                print(f"❌ Ошибка подключения к БД (попытка {attempt}), повтор через {delay:.0f} сек: {e}")
+                await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+                delay = min(delay * 2, DATABASE_POOL["startup_retry_max"])
+                attempt += 1
+    
+    @asynccontextmanager
+    async def _cursor(self):
+        """Курсор на соединении, взятом из пула"""
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cur:
+                yield cur
     
     # === ПОЛЬЗОВАТЕЛИ И СТАТИСТИКА ===
     
     def log_activity(self, user, chat_id: str, action: str, content: str = ""):
-        """Логирование активности пользователя"""
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO user_activity_log (user_id, username, chat_id, action, content)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (
-                user.id,
-                f"@{user.username}" if user.username else None,
-                chat_id,
-                action,
-                content[:1000]
-            ))
+        """Логирование активности пользователя (в буфер, без ожидания БД)"""
+        # Значения обрезаются по ширине столбцов: одна длинная строка не должна ронять COPY всей пачки
+        self.activity_buffer.add((
+            user.id,
+            f"@{user.username}"[:100] if user.username else None,
+            chat_id[:20],
+            action[:50],
+            content[:1000],
+            datetime.now(timezone.utc)
+        ))
+    
+    async def write_activity_batch(self, rows: List[tuple]):
+        """Пакетная запись строк лога активности через COPY"""
+        async with self._cursor() as cur:
+            async with cur.copy("""
+                COPY user_activity_log (user_id, username, chat_id, action, content, timestamp)
+                FROM STDIN
+            """) as copy:
+                for row in rows:
+                    await copy.write_row(row)
     
     def update_user_stats(self, user, chat_id: str, message_text: str):
         """Обновление статистики пользователя для текстовых сообщений"""
         username = f"@{user.username}" if user.username else None
-        
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO user_stats (chat_id, username, messages_sent, symbols_sent, latest_activity, updated_at)
-                VALUES (%s, %s, 1, %s, now(), now())
-                ON CONFLICT (chat_id) DO UPDATE
-                SET 
-                    messages_sent = user_stats.messages_sent + 1,
-                    symbols_sent = user_stats.symbols_sent + %s,
-                    username = COALESCE(EXCLUDED.username, user_stats.username),
-                    latest_activity = now(),
-                    updated_at = now()
-            """, (
-                chat_id,
-                username,
-                len(message_text),
-                len(message_text)
-            ))
+        self.stats_accumulator.add(chat_id, username, messages_sent=1, symbols_sent=len(message_text))
     
     def update_user_stats_audio(self, user, chat_id: str, transcribed_text: str):
         """Обновление статистики пользователя для голосовых сообщений"""
         username = f"@{user.username}" if user.username else None
-        
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO user_stats (chat_id, username, audio_sent, symbols_sent, latest_activity, updated_at)
-                VALUES (%s, %s, 1, %s, now(), now())
-                ON CONFLICT (chat_id) DO UPDATE
-                SET 
-                    audio_sent = user_stats.audio_sent + 1,
-                    symbols_sent = user_stats.symbols_sent + %s,
-                    username = COALESCE(EXCLUDED.username, user_stats.username),
-                    latest_activity = now(),
-                    updated_at = now()
-            """, (
-                chat_id,
-                username,
-                len(transcribed_text),
-                len(transcribed_text)
-            ))
+        self.stats_accumulator.add(chat_id, username, audio_sent=1, symbols_sent=len(transcribed_text))
     
     def increment_start_count(self, user, chat_id: str):
         """Увеличение счетчика стартов"""
         username = f"@{user.username}" if user.username else None
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO user_stats (chat_id, username, starts_count, latest_activity, updated_at)
-                VALUES (%s, %s, 1, now(), now())
-                ON CONFLICT (chat_id) DO UPDATE
-                SET 
-                    starts_count = user_stats.starts_count + 1,
-                    username = COALESCE(EXCLUDED.username, user_stats.username),
-                    latest_activity = now(),
-                    updated_at = now()
-            """, (
-                chat_id,
-                username
-            ))
+        self.stats_accumulator.add(chat_id, username, starts_count=1)
     
     def increment_dreams_saved(self, user, chat_id: str):
         """Увеличение счетчика сохраненных снов"""
         username = f"@{user.username}" if user.username else None
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO user_stats (chat_id, username, dreams_saved, latest_activity, updated_at)
-                VALUES (%s, %s, 1, now(), now())
-                ON CONFLICT (chat_id) DO UPDATE
-                SET 
-                    dreams_saved = user_stats.dreams_saved + 1,
-                    username = COALESCE(EXCLUDED.username, user_stats.username),
-                    latest_activity = now(),
-                    updated_at = now()
-            """, (
-                chat_id,
-                username
-            ))
+        self.stats_accumulator.add(chat_id, username, dreams_saved=1)
     
     def update_latest_activity(self, user, chat_id: str):
         """Обновление времени последней активности пользователя"""
         username = f"@{user.username}" if user.username else None
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO user_stats (chat_id, username, latest_activity, updated_at)
-                VALUES (%s, %s, now(), now())
+        self.stats_accumulator.add(chat_id, username)
+    
+    async def write_stats_batch(self, rows: List[tuple]):
+        """Запись накопленных дельт статистики: один upsert на чат"""
+        async with self._cursor() as cur:
+            await cur.executemany("""
+                INSERT INTO user_stats (chat_id, username, messages_sent, audio_sent, symbols_sent,
+                                        starts_count, dreams_saved, latest_activity, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, now())
                 ON CONFLICT (chat_id) DO UPDATE
                 SET 
+                    messages_sent = user_stats.messages_sent + EXCLUDED.messages_sent,
+                    audio_sent = user_stats.audio_sent + EXCLUDED.audio_sent,
+                    symbols_sent = user_stats.symbols_sent + EXCLUDED.symbols_sent,
+                    starts_count = user_stats.starts_count + EXCLUDED.starts_count,
+                    dreams_saved = user_stats.dreams_saved + EXCLUDED.dreams_saved,
                     username = COALESCE(EXCLUDED.username, user_stats.username),
-                    latest_activity = now(),
+                    latest_activity = GREATEST(user_stats.latest_activity, EXCLUDED.latest_activity),
                     updated_at = now()
-            """, (
-                chat_id,
-                username
-            ))
+            """, rows)
     
-    def get_all_users(self) -> List[str]:
+    async def get_all_users(self) -> List[str]:
         """Получить список всех пользователей"""
-        with self.conn.cursor() as cur:
-            cur.execute("""
+        async with self._cursor() as cur:
+            await cur.execute("""
                 SELECT chat_id
                 FROM user_stats
                 WHERE chat_id IS NOT NULL
                 GROUP BY chat_id
                 ORDER BY MAX(updated_at) DESC
             """)
-            users = cur.fetchall()
+            users = await cur.fetchall()
             return [str(user[0]) for user in users]
     
-    def get_user_stats_summary(self) -> Dict[str, Any]:
+    async def get_user_stats_summary(self) -> Dict[str, Any]:
         """Получить сводную статистику пользователей"""
-        with self.conn.cursor() as cur:
+        async with self._cursor() as cur:
             # Общие статистики
-            cur.execute("""
+            await cur.execute("""
                 SELECT 
                     COUNT(*) as total_users,
                     SUM(messages_sent) as total_messages,
@@ -283,7 +259,7 @@ class DatabaseManager:
                     COUNT(*) FILTER (WHERE latest_activity >= NOW() - INTERVAL '7 days') as active_week
                 FROM user_stats
             """)
-            stats = cur.fetchone()
+            stats = await cur.fetchone()
             
             return {
                 'total_users': stats[0] or 0,
@@ -294,10 +270,10 @@ class DatabaseManager:
                 'active_week': stats[5] or 0
             }
     
-    def get_user_stats_details(self, limit: int = 20) -> List[Tuple]:
+    async def get_user_stats_details(self, limit: int = 20) -> List[Tuple]:
         """Получить детальную статистику пользователей"""
-        with self.conn.cursor() as cur:
-            cur.execute("""
+        async with self._cursor() as cur:
+            await cur.execute("""
                 SELECT 
                     chat_id,
                     username,
@@ -310,34 +286,242 @@ class DatabaseManager:
                 ORDER BY latest_activity DESC
                 LIMIT %s
             """, (limit,))
-            return cur.fetchall()
+            return await cur.fetchall()
     
     # === СООБЩЕНИЯ ===
     
-    def save_message(self, chat_id: str, role: str, content: str):
-        """Сохранение сообщения"""
-        with self.conn.cursor() as cur:
-            cur.execute("""
+    # Последние сообщения чата (новые первыми)
+    _SELECT_HISTORY = """
+        SELECT id, role, content FROM messages
+        WHERE chat_id = %s ORDER BY timestamp DESC LIMIT %s
+    """
+    
+    # Профиль для контекста GPT
+    _SELECT_PROFILE = """
+        SELECT gender, age_group, lucid_dreaming FROM user_profile
+        WHERE chat_id = %s
+    """
+    
+    # Пересказ старой части переписки
+    _SELECT_SUMMARY = """
+        SELECT summary, last_message_id FROM conversation_summaries
+        WHERE chat_id = %s
+    """
+    
+    async def save_message(self, chat_id: str, role: str, content: str):
+        """Сохранение сообщения (и дописывание его в кэш истории)"""
+        async with self._cursor() as cur:
+            await cur.execute("""
                 INSERT INTO messages (chat_id, role, content, timestamp)
                 VALUES (%s, %s, %s, %s)
+                RETURNING id
             """, (chat_id, role, content, datetime.now(timezone.utc)))
-    
-    def get_message_history(self, chat_id: str, limit: int = 10) -> List[Dict[str, str]]:
-        """Получение истории сообщений"""
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                SELECT role, content FROM messages
-                WHERE chat_id = %s ORDER BY timestamp DESC LIMIT %s
-            """, (chat_id, limit * 2))
-            rows = cur.fetchall()
-            return [{"role": r, "content": c} for r, c in reversed(rows)]
+            message_id = (await cur.fetchone())[0]
+        self.history_cache.append(chat_id, role, content, message_id)
+        self._note_new_messages(chat_id, 1)
+    
+    async def get_message_history(self, chat_id: str, limit: int = 10) -> List[Dict[str, str]]:
+        """Получение истории сообщений (из кэша, при промахе - из БД)"""
+        cached = self.history_cache.get(chat_id, limit * 2)
+        if cached is not None:
+            return cached
+        
+        self.history_cache.begin_load(chat_id)
+        history = None
+        try:
+            async with self._cursor() as cur:
+                await cur.execute(self._SELECT_HISTORY, (chat_id, self._history_fetch_size(limit)))
+                history = [{"role": r, "content": c, "id": i} for i, r, c in reversed(await cur.fetchall())]
+        finally:
+            self.history_cache.finish_load(chat_id, history)
+        return history[-limit * 2:] if limit > 0 else []
+    
+    def _history_fetch_size(self, limit: int) -> int:
+        """Сколько сообщений читать из БД: не меньше, чем помещается в кэш чата"""
+        return max(limit * 2, self.history_cache.messages_per_chat)
+    
+    # === КОНВЕЙЕР ТОЛКОВАНИЯ СНА ===
+    
+    async def load_dream_context(self, chat_id: str, history_limit: int = 10) -> Tuple[List[Dict[str, str]], str, str]:
+        """
+        Загрузка контекста для GPT: история сообщений, строка профиля и пересказ переписки
+        
+        Все части обычно берутся из кэшей; то, чего в кэше нет, читается
+        из БД за один round trip (pipeline mode). Сообщения, уже вошедшие
+        в пересказ, из истории исключаются.
+        """
+        history = self.history_cache.get(chat_id, history_limit * 2)
+        profile_info = self.profile_cache.get(chat_id)
+        summary = self.summary_cache.get(chat_id) if CONVERSATION_SUMMARY["enabled"] else ("", 0)
+        if history is not None and profile_info is not None and summary is not None:
+            return self._after_summary(history, summary), profile_info, summary[0]
+        
+        load_history = history is None
+        if load_history:
+            self.history_cache.begin_load(chat_id)
+        loaded = None
+        try:
+            async with self.pool.connection() as conn:
+                async with conn.pipeline():
+                    if load_history:
+                        history_cur = await conn.execute(
+                            self._SELECT_HISTORY, (chat_id, self._history_fetch_size(history_limit))
+                        )
+                    if profile_info is None:
+                        profile_cur = await conn.execute(self._SELECT_PROFILE, (chat_id,))
+                    if summary is None:
+                        summary_cur = await conn.execute(self._SELECT_SUMMARY, (chat_id,))
+                
+                if load_history:
+                    rows = await history_cur.fetchall()
+                    loaded = [{"role": r, "content": c, "id": i} for i, r, c in reversed(rows)]
+                    history = loaded[-history_limit * 2:] if history_limit > 0 else []
+                if profile_info is None:
+                    profile_info = MessageFormatter.format_profile_info(await profile_cur.fetchone())
+                    self.profile_cache.put(chat_id, profile_info)
+                if summary is None:
+                    row = await summary_cur.fetchone()
+                    summary = (row[0], row[1]) if row else ("", 0)
+                    self.summary_cache.put(chat_id, summary)
+        finally:
+            if load_history:
+                self.history_cache.finish_load(chat_id, loaded)
+        
+        return self._after_summary(history, summary), profile_info, summary[0]
+    
+    @staticmethod
+    def _after_summary(history: List[Dict], summary: Tuple[str, int]) -> List[Dict]:
+        """Сообщения истории, еще не вошедшие в пересказ"""
+        last_message_id = summary[1]
+        if not last_message_id:
+            return history
+        return [message for message in history if message.get("id", last_message_id + 1) > last_message_id]
+    
+    async def commit_dream_interpretation(self, chat_id: str, reply: str, dream_text: Optional[str] = None,
+                                          source_type: Optional[str] = None, user_message: Optional[str] = None,
+                                          message_id: Optional[int] = None):
+        """
+        Сохранение результата толкования за один round trip (pipeline mode):
+        ответ ассистента и, если передан dream_text, временные данные сна для дневника,
+        привязанные к сообщению с толкованием message_id
+        """
+        now = datetime.now(timezone.utc)
+        if dream_text is not None:
+            # Кэш заполняется до записи в БД: кнопки толкования работают сразу
+            self._cache_pending_dream(chat_id, message_id, dream_text, reply, source_type)
+        async with self.pool.connection() as conn:
+            async with conn.pipeline():
+                async with conn.transaction():
+                    if user_message is not None:
+                        user_cur = await conn.execute("""
+                            INSERT INTO messages (chat_id, role, content, timestamp)
+                            VALUES (%s, %s, %s, %s)
+                            RETURNING id
+                        """, (chat_id, "user", user_message, now))
+                    # Ответ должен идти в истории строго после вопроса
+                    reply_cur = await conn.execute("""
+                        INSERT INTO messages (chat_id, role, content, timestamp)
+                        VALUES (%s, %s, %s, %s)
+                        RETURNING id
+                    """, (chat_id, "assistant", reply, now + timedelta(microseconds=1)))
+                    
+                    if dream_text is not None:
+                        await conn.execute(self._UPSERT_PENDING_DREAM, (chat_id, message_id, dream_text, reply, source_type))
+            
+            # Результаты читаются, пока соединение не вернулось в пул
+            user_message_id = (await user_cur.fetchone())[0] if user_message is not None else None
+            reply_id = (await reply_cur.fetchone())[0]
+        
+        if user_message is not None:
+            self.history_cache.append(chat_id, "user", user_message, user_message_id)
+        self.history_cache.append(chat_id, "assistant", reply, reply_id)
+        self._note_new_messages(chat_id, 2 if user_message is not None else 1)
+    
+    # === ПЕРЕСКАЗ ПЕРЕПИСКИ ===
+    
+    def _note_new_messages(self, chat_id: str, count: int):
+        """Учет новых сообщений чата для фонового пересказа"""
+        if not CONVERSATION_SUMMARY["enabled"]:
+            return
+        if chat_id not in self._unsummarized and len(self._unsummarized) >= HISTORY_CACHE["max_chats"]:
+            # Счетчики давно неактивных чатов не нужны: их пересказ дождется новых сообщений
+            self._unsummarized = {
+                k: v for k, v in self._unsummarized.items() if v >= CONVERSATION_SUMMARY["refresh_every"]
+            }
+        self._unsummarized[chat_id] = self._unsummarized.get(chat_id, 0) + count
+    
+    def summary_due_chats(self, limit: int) -> List[str]:
+        """Чаты, в которые с последней проверки записано не меньше refresh_every сообщений"""
+        due = [
+            chat_id for chat_id, count in self._unsummarized.items()
+            if count >= CONVERSATION_SUMMARY["refresh_every"]
+        ][:limit]
+        for chat_id in due:
+            del self._unsummarized[chat_id]
+        return due
+    
+    def requeue_summary(self, chat_id: str):
+        """Повторная постановка чата в очередь пересказа (осталась несвернутая часть)"""
+        self._unsummarized[chat_id] = CONVERSATION_SUMMARY["refresh_every"]
+    
+    async def get_unsummarized_messages(self, chat_id: str, keep_recent: int, limit: int) -> Tuple[str, List[Dict]]:
+        """
+        Текущий пересказ и сообщения, которые пора в него свернуть
+        
+        Сворачиваются самые старые сообщения после уже пересказанных,
+        кроме keep_recent последних: они передаются в GPT как есть.
+        """
+        async with self.pool.connection() as conn:
+            async with conn.pipeline():
+                summary_cur = await conn.execute(self._SELECT_SUMMARY, (chat_id,))
+                messages_cur = await conn.execute("""
+                    WITH recent AS (
+                        SELECT id FROM messages
+                        WHERE chat_id = %s
+                        ORDER BY timestamp DESC
+                        LIMIT %s
+                    )
+                    SELECT id, role, content FROM messages
+                    WHERE chat_id = %s
+                      AND id > COALESCE(
+                          (SELECT last_message_id FROM conversation_summaries WHERE chat_id = %s), 0
+                      )
+                      AND id < (SELECT MIN(id) FROM recent)
+                    ORDER BY id
+                    LIMIT %s
+                """, (chat_id, keep_recent, chat_id, chat_id, limit))
+            
+            row = await summary_cur.fetchone()
+            messages = [{"id": i, "role": r, "content": c} for i, r, c in await messages_cur.fetchall()]
+        return (row[0] if row else ""), messages
+    
+    async def save_conversation_summary(self, chat_id: str, summary: str, last_message_id: int) -> bool:
+        """Сохранение пересказа; более старый пересказ (с другой реплики) не перезаписывает новый"""
+        async with self._cursor() as cur:
+            await cur.execute("""
+                INSERT INTO conversation_summaries (chat_id, summary, last_message_id, updated_at)
+                VALUES (%s, %s, %s, NOW())
+                ON CONFLICT (chat_id) DO UPDATE SET
+                    summary = EXCLUDED.summary,
+                    last_message_id = EXCLUDED.last_message_id,
+                    updated_at = NOW()
+                WHERE conversation_summaries.last_message_id < EXCLUDED.last_message_id
+                RETURNING chat_id
+            """, (chat_id, summary, last_message_id))
+            saved = await cur.fetchone() is not None
+        
+        if saved:
+            self.summary_cache.put(chat_id, (summary, last_message_id))
+        else:
+            self.summary_cache.pop(chat_id)
+        return saved
     
     # === ПРОФИЛИ ПОЛЬЗОВАТЕЛЕЙ ===
     
-    def save_user_profile(self, chat_id: str, username: str, gender: str, age_group: str, lucid_dreaming: str):
+    async def save_user_profile(self, chat_id: str, username: str, gender: str, age_group: str, lucid_dreaming: str):
         """Сохранение профиля пользователя"""
-        with self.conn.cursor() as cur:
-            cur.execute("""
+        async with self._cursor() as cur:
+            await cur.execute("""
                 INSERT INTO user_profile (chat_id, username, gender, age_group, lucid_dreaming, updated_at)
                 VALUES (%s, %s, %s, %s, %s, now())
                 ON CONFLICT (chat_id) DO UPDATE
@@ -346,256 +530,494 @@ class DatabaseManager:
                     lucid_dreaming = EXCLUDED.lucid_dreaming,
                     updated_at = now()
             """, (chat_id, username, gender, age_group, lucid_dreaming))
+        self.profile_cache.pop(chat_id)
     
-    def get_user_profile(self, chat_id: str) -> Optional[Tuple]:
+    async def get_user_profile(self, chat_id: str) -> Optional[Tuple]:
         """Получение профиля пользователя"""
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                SELECT gender, age_group, lucid_dreaming FROM user_profile
-                WHERE chat_id = %s
-            """, (chat_id,))
-            return cur.fetchone()
+        async with self._cursor() as cur:
+            await cur.execute(self._SELECT_PROFILE, (chat_id,))
+            return await cur.fetchone()
     
     # === ДНЕВНИК СНОВ ===
     
-    def save_dream(self, chat_id: str, dream_text: str, interpretation: str, 
+    async def save_dream(self, chat_id: str, dream_text: str, interpretation: str, 
                    source_type: str = 'text', dream_date: str = None, 
                    astrological_interpretation: str = None) -> bool:
-        """Сохранение сна в дневник"""
+        """Сохранение сна в дневник (вместе с увеличением счетчика снов)"""
         try:
-            with self.conn.cursor() as cur:
-                if dream_date:
-                    cur.execute("""
+            async with self._cursor() as cur:
+                # Сон и счетчик меняются одним запросом, то есть атомарно
+                await cur.execute("""
+                    WITH ins AS (
                         INSERT INTO dreams (chat_id, dream_text, interpretation, astrological_interpretation, source_type, dream_date)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                    """, (chat_id, dream_text, interpretation, astrological_interpretation, source_type, dream_date))
-                else:
-                    cur.execute("""
-                        INSERT INTO dreams (chat_id, dream_text, interpretation, astrological_interpretation, source_type)
-                        VALUES (%s, %s, %s, %s, %s)
-                    """, (chat_id, dream_text, interpretation, astrological_interpretation, source_type))
+                        VALUES (%s, %s, %s, %s, %s, COALESCE(%s::date, CURRENT_DATE))
+                        RETURNING chat_id
+                    )
+                    INSERT INTO dream_counters (chat_id, dreams_count)
+                    SELECT chat_id, 1 FROM ins
+                    ON CONFLICT (chat_id) DO UPDATE SET
+                        dreams_count = dream_counters.dreams_count + 1,
+                        updated_at = NOW()
+                """, (chat_id, dream_text, interpretation, astrological_interpretation, source_type, dream_date))
                 return True
         except Exception as e:
             print(f"❌ Ошибка сохранения сна: {e}")
             return False
     
-    def get_user_dreams(self, chat_id: str, limit: int = 10, offset: int = 0) -> List[Tuple]:
-        """Получение снов пользователя с пагинацией"""
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                SELECT id, dream_text, interpretation, astrological_interpretation, source_type, created_at, dream_date
-                FROM dreams
-                WHERE chat_id = %s
-                ORDER BY created_at DESC
-                LIMIT %s OFFSET %s
-            """, (chat_id, limit, offset))
-            return cur.fetchall()
-    
-    def count_user_dreams(self, chat_id: str) -> int:
-        """Подсчет количества снов пользователя"""
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                SELECT COUNT(*) FROM dreams WHERE chat_id = %s
+    async def get_user_dream_previews(self, chat_id: str, limit: int = 10, cursor: Optional[Tuple[datetime, int]] = None,
+                                      direction: str = "next", preview_length: int = 35) -> Tuple[List[Tuple], bool]:
+        """
+        Превью снов для страницы дневника с keyset-пагинацией по (created_at, id)
+        
+        Args:
+            cursor: (created_at, id) граничного сна соседней страницы; None - первая страница
+            direction: "next" - сны старше курсора, "prev" - сны новее курсора
+            preview_length: сколько символов текста сна нужно для превью
+        
+        Returns:
+            Строки (id, created_at, source_type, dream_text_prefix) от новых к старым
+            и флаг, есть ли еще сны дальше в направлении direction
+        """
+        # Берем на символ больше, чтобы форматтер превью понял, что текст обрезан
+        columns = "id, created_at, source_type, LEFT(dream_text, %s)"
+        
+        async with self._cursor() as cur:
+            if cursor is None:
+                await cur.execute(f"""
+                    SELECT {columns} FROM dreams
+                    WHERE chat_id = %s
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT %s
+                """, (preview_length + 1, chat_id, limit + 1))
+            elif direction == "prev":
+                await cur.execute(f"""
+                    SELECT {columns} FROM dreams
+                    WHERE chat_id = %s AND (created_at, id) > (%s, %s)
+                    ORDER BY created_at ASC, id ASC
+                    LIMIT %s
+                """, (preview_length + 1, chat_id, cursor[0], cursor[1], limit + 1))
+            else:
+                await cur.execute(f"""
+                    SELECT {columns} FROM dreams
+                    WHERE chat_id = %s AND (created_at, id) < (%s, %s)
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT %s
+                """, (preview_length + 1, chat_id, cursor[0], cursor[1], limit + 1))
+            rows = await cur.fetchall()
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if cursor is not None and direction == "prev":
+            rows.reverse()
+        return rows, has_more
+    
+    async def count_user_dreams(self, chat_id: str) -> int:
+        """Количество снов пользователя (из счетчика dream_counters)"""
+        async with self._cursor() as cur:
+            await cur.execute("""
+                SELECT dreams_count FROM dream_counters WHERE chat_id = %s
             """, (chat_id,))
-            return cur.fetchone()[0]
+            result = await cur.fetchone()
+            return result[0] if result else 0
     
-    def get_dream_by_id(self, chat_id: str, dream_id: int) -> Optional[Tuple]:
+    async def get_dream_by_id(self, chat_id: str, dream_id: int) -> Optional[Tuple]:
         """Получение конкретного сна по ID"""
-        with self.conn.cursor() as cur:
-            cur.execute("""
+        async with self._cursor() as cur:
+            await cur.execute("""
                 SELECT id, dream_text, interpretation, astrological_interpretation, source_type, created_at, dream_date
                 FROM dreams
                 WHERE chat_id = %s AND id = %s
             """, (chat_id, dream_id))
-            return cur.fetchone()
+            return await cur.fetchone()
     
-    def delete_dream(self, chat_id: str, dream_id: int) -> bool:
-        """Удаление сна"""
+    async def delete_dream(self, chat_id: str, dream_id: int) -> bool:
+        """Удаление сна (вместе с уменьшением счетчика снов)"""
         try:
-            with self.conn.cursor() as cur:
-                cur.execute("""
-                    DELETE FROM dreams
-                    WHERE chat_id = %s AND id = %s
+            async with self._cursor() as cur:
+                await cur.execute("""
+                    WITH del AS (
+                        DELETE FROM dreams
+                        WHERE chat_id = %s AND id = %s
+                        RETURNING chat_id
+                    ), upd AS (
+                        UPDATE dream_counters
+                        SET dreams_count = GREATEST(dreams_count - 1, 0), updated_at = NOW()
+                        WHERE chat_id IN (SELECT chat_id FROM del)
+                    )
+                    SELECT COUNT(*) FROM del
                 """, (chat_id, dream_id))
-                return cur.rowcount > 0
+                return (await cur.fetchone())[0] > 0
         except Exception as e:
             print(f"❌ Ошибка удаления сна: {e}")
             return False
     
+    async def reconcile_dream_counters(self):
+        """
+        Сверка счетчиков снов с фактическим COUNT(*) и исправление расхождений
+        
+        Счетчики сверяются порциями по reconcile_batch, каждая - в своей
+        короткой транзакции. Строки порции блокируются до подсчета: сохранения
+        и удаления снов, начатые раньше, успевают завершиться и попадают в
+        подсчет, а начатые позже ждут блокировку и применяют свое изменение
+        уже поверх сверки. Строки, занятые идущим сохранением (SKIP LOCKED),
+        сверяются в следующий раз - сверка не задерживает сохранения снов.
+        """
+        batch_size = DREAM_COUNTERS["reconcile_batch"]
+        repaired = 0
+        last_chat_id = ""
+        while True:
+            async with self.pool.connection() as conn:
+                async with conn.transaction():
+                    async with conn.cursor() as cur:
+                        await cur.execute("""
+                            SELECT chat_id FROM dream_counters
+                            WHERE chat_id > %s
+                            ORDER BY chat_id
+                            LIMIT %s
+                            FOR UPDATE SKIP LOCKED
+                        """, (last_chat_id, batch_size))
+                        chat_ids = [row[0] for row in await cur.fetchall()]
+                        if chat_ids:
+                            await cur.execute("""
+                                UPDATE dream_counters c
+                                SET dreams_count = actual.dreams_count, updated_at = NOW()
+                                FROM (
+                                    SELECT ids.chat_id, COUNT(d.id) AS dreams_count
+                                    FROM unnest(%s::varchar[]) AS ids(chat_id)
+                                    LEFT JOIN dreams d ON d.chat_id = ids.chat_id
+                                    GROUP BY ids.chat_id
+                                ) actual
+                                WHERE c.chat_id = actual.chat_id
+                                  AND c.dreams_count <> actual.dreams_count
+                            """, (chat_ids,))
+                            repaired += cur.rowcount
+            
+            if len(chat_ids) < batch_size:
+                break
+            last_chat_id = chat_ids[-1]
+        
+        # Сны без строки счетчика; если ее только что создало сохранение сна, она не трогается
+        async with self._cursor() as cur:
+            await cur.execute("""
+                INSERT INTO dream_counters (chat_id, dreams_count)
+                SELECT d.chat_id, COUNT(*)
+                FROM dreams d
+                WHERE NOT EXISTS (SELECT 1 FROM dream_counters c WHERE c.chat_id = d.chat_id)
+                GROUP BY d.chat_id
+                ON CONFLICT (chat_id) DO NOTHING
+            """)
+            repaired += cur.rowcount
+        
+        if repaired > 0:
+            self.dream_counters_repaired += repaired
+            print(f"⚠️ Исправлены счетчики снов: {repaired}")
+    
+    # === ОБСЛУЖИВАНИЕ ЛОГА АКТИВНОСТИ ===
+    
+    async def rollup_expired_activity_partitions(self) -> int:
+        """
+        Свертка партиций старше срока хранения в user_activity_daily и их удаление
+        
+        Returns:
+            Количество удаленных партиций
+        """
+        cutoff = add_months(current_month(), -ACTIVITY_LOG_RETENTION["retention_months"])
+        
+        async with self._cursor() as cur:
+            await cur.execute("""
+                SELECT c.relname FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = 'user_activity_log'::regclass
+            """)
+            partitions = [row[0] for row in await cur.fetchall()]
+        
+        expired = []
+        for name in partitions:
+            match = ACTIVITY_PARTITION_RE.match(name)
+            if match and date(int(match.group(1)), int(match.group(2)), 1) < cutoff:
+                expired.append(name)
+        
+        for name in sorted(expired):
+            # Свертка и удаление в одной транзакции: сводка не теряется при сбое
+            async with self.pool.connection() as conn:
+                async with conn.transaction():
+                    async with conn.cursor() as cur:
+                        await cur.execute(f"""
+                            INSERT INTO user_activity_daily (day, action, events, unique_users)
+                            SELECT timestamp::date, COALESCE(action, ''), COUNT(*), COUNT(DISTINCT user_id)
+                            FROM {name}
+                            GROUP BY 1, 2
+                            ON CONFLICT (day, action) DO UPDATE SET
+                                events = EXCLUDED.events,
+                                unique_users = EXCLUDED.unique_users
+                        """)
+                        await cur.execute(f"DROP TABLE {name}")
+            print(f"✅ Партиция {name} свернута в user_activity_daily и удалена")
+        
+        return len(expired)
+    
+    async def maintain_activity_log(self):
+        """Периодическое обслуживание лога активности"""
+        this_month = current_month()
+        async with self.pool.connection() as conn:
+            await create_activity_partitions(
+                conn, this_month, add_months(this_month, ACTIVITY_LOG_RETENTION["months_ahead"])
+            )
+        # Пока старые строки переносятся, их партиции не сворачиваем: иначе строки попали бы в партицию по умолчанию
+        if not self.activity_backfill_pending:
+            await self.rollup_expired_activity_partitions()
+    
+    async def backfill_activity_log(self):
+        """
+        Перенос порции строк из user_activity_log_legacy в секционированный лог
+        
+        Порция удаляется из старой таблицы и вставляется в новую одним
+        запросом, поэтому перенос можно прервать и продолжить с любой реплики.
+        Когда старая таблица пустеет, она удаляется.
+        """
+        if not self.activity_backfill_pending:
+            return
+        
+        async with self._cursor() as cur:
+            await cur.execute("SELECT to_regclass('user_activity_log_legacy')")
+            if (await cur.fetchone())[0] is None:
+                self.activity_backfill_pending = False
+                return
+            
+            await cur.execute("""
+                WITH moved AS (
+                    DELETE FROM user_activity_log_legacy
+                    WHERE id IN (
+                        SELECT id FROM user_activity_log_legacy
+                        ORDER BY id
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING user_id, username, chat_id, action, content, timestamp
+                )
+                INSERT INTO user_activity_log (user_id, username, chat_id, action, content, timestamp)
+                SELECT user_id, username, chat_id, action, content, COALESCE(timestamp, NOW())
+                FROM moved
+            """, (ACTIVITY_LOG["backfill_batch"],))
+            if cur.rowcount > 0:
+                return
+            
+            # Строки, занятые переносом на другой реплике, тоже видны: таблицу удаляем, только когда она пуста
+            await cur.execute("SELECT EXISTS (SELECT 1 FROM user_activity_log_legacy)")
+            if (await cur.fetchone())[0]:
+                return
+            await cur.execute("DROP TABLE IF EXISTS user_activity_log_legacy")
+        
+        self.activity_backfill_pending = False
+        print("✅ Старый лог активности перенесен в секционированную таблицу")
+    
     # === ВРЕМЕННЫЕ ДАННЫЕ СНОВ ===
     
-    def save_pending_dream(self, chat_id: str, dream_text: str, interpretation: str, source_type: str) -> bool:
+    # Одна запись на сообщение с толкованием: повторное толкование в том же сообщении ее перезаписывает
+    _UPSERT_PENDING_DREAM = """
+        INSERT INTO pending_dreams (chat_id, message_id, dream_text, interpretation, source_type, created_at)
+        VALUES (%s, %s, %s, %s, %s, now())
+        ON CONFLICT (chat_id, message_id) DO UPDATE SET
+            dream_text = EXCLUDED.dream_text,
+            interpretation = EXCLUDED.interpretation,
+            source_type = EXCLUDED.source_type,
+            astrological_interpretation = NULL,
+            created_at = now(),
+            updated_at = now()
+    """
+    
+    def _cache_pending_dream(self, chat_id: str, message_id: int, dream_text: str, interpretation: str,
+                             source_type: str, astrological_interpretation: Optional[str] = None):
+        """Запись временных данных сна в кэш процесса"""
+        self.pending_dreams_cache.put((chat_id, message_id), {
+            'dream_text': dream_text,
+            'interpretation': interpretation,
+            'source_type': source_type,
+            'astrological_interpretation': astrological_interpretation,
+            'message_id': message_id
+        })
+    
+    async def save_pending_dream(self, chat_id: str, message_id: int, dream_text: str, interpretation: str,
+                                 source_type: str) -> bool:
         """Сохранение временных данных сна для последующего сохранения в дневник"""
+        self._cache_pending_dream(chat_id, message_id, dream_text, interpretation, source_type)
         try:
-            with self.conn.cursor() as cur:
-                # Сначала удаляем старые временные данные для этого пользователя
-                cur.execute("""
-                    DELETE FROM pending_dreams WHERE chat_id = %s
-                """, (chat_id,))
-                
-                # Сохраняем новые временные данные
-                cur.execute("""
-                    INSERT INTO pending_dreams (chat_id, dream_text, interpretation, source_type, created_at)
-                    VALUES (%s, %s, %s, %s, now())
-                """, (chat_id, dream_text, interpretation, source_type))
+            async with self._cursor() as cur:
+                await cur.execute(self._UPSERT_PENDING_DREAM, (chat_id, message_id, dream_text, interpretation, source_type))
                 return True
         except Exception as e:
+            self.pending_dreams_cache.pop((chat_id, message_id))
             print(f"❌ Ошибка сохранения временных данных сна: {e}")
             return False
     
-    def get_pending_dream(self, chat_id: str) -> Optional[Dict[str, Any]]:
-        """Получение временных данных сна"""
+    async def get_pending_dream(self, chat_id: str, message_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Получение временных данных сна по сообщению с толкованием
+        
+        Без message_id (кнопки старого формата) возвращается последняя запись чата.
+        """
+        if message_id is not None:
+            cached = self.pending_dreams_cache.get((chat_id, message_id))
+            if cached:
+                return cached
+        
         try:
-            with self.conn.cursor() as cur:
-                cur.execute("""
-                    SELECT dream_text, interpretation, source_type, astrological_interpretation, created_at
-                    FROM pending_dreams 
-                    WHERE chat_id = %s
-                    ORDER BY created_at DESC 
-                    LIMIT 1
-                """, (chat_id,))
-                result = cur.fetchone()
+            async with self._cursor() as cur:
+                if message_id is not None:
+                    # Записи без message_id остались от старых версий бота
+                    await cur.execute("""
+                        SELECT dream_text, interpretation, source_type, astrological_interpretation, message_id
+                        FROM pending_dreams
+                        WHERE chat_id = %s AND (message_id = %s OR message_id IS NULL)
+                        ORDER BY message_id NULLS LAST, created_at DESC
+                        LIMIT 1
+                    """, (chat_id, message_id))
+                else:
+                    await cur.execute("""
+                        SELECT dream_text, interpretation, source_type, astrological_interpretation, message_id
+                        FROM pending_dreams 
+                        WHERE chat_id = %s
+                        ORDER BY created_at DESC 
+                        LIMIT 1
+                    """, (chat_id,))
+                result = await cur.fetchone()
                 
                 if result:
-                    return {
+                    pending_dream = {
                         'dream_text': result[0],
                         'interpretation': result[1],
                         'source_type': result[2],
                         'astrological_interpretation': result[3],
-                        'created_at': result[4]
+                        'message_id': result[4]
                     }
+                    if result[4] is not None:
+                        self.pending_dreams_cache.put((chat_id, result[4]), pending_dream)
+                    return pending_dream
                 return None
         except Exception as e:
             print(f"❌ Ошибка получения временных данных сна: {e}")
             return None
     
-    def update_pending_dream_astrological(self, chat_id: str, astrological_interpretation: str) -> bool:
+    async def update_pending_dream_astrological(self, chat_id: str, message_id: Optional[int],
+                                                astrological_interpretation: str) -> bool:
         """Обновление временных данных сна астрологическим толкованием"""
         try:
-            with self.conn.cursor() as cur:
-                cur.execute("""
+            async with self._cursor() as cur:
+                await cur.execute("""
                     UPDATE pending_dreams 
                     SET astrological_interpretation = %s, updated_at = now()
-                    WHERE chat_id = %s
-                """, (astrological_interpretation, chat_id))
-                return cur.rowcount > 0
+                    WHERE chat_id = %s AND message_id IS NOT DISTINCT FROM %s
+                """, (astrological_interpretation, chat_id, message_id))
+                updated = cur.rowcount > 0
         except Exception as e:
+            self.pending_dreams_cache.pop((chat_id, message_id))
             print(f"❌ Ошибка обновления астрологического толкования: {e}")
             return False
+        
+        cached = self.pending_dreams_cache.get((chat_id, message_id))
+        if cached:
+            cached['astrological_interpretation'] = astrological_interpretation
+        return updated
     
-    def delete_pending_dream(self, chat_id: str) -> bool:
+    async def delete_pending_dream(self, chat_id: str, message_id: Optional[int]) -> bool:
         """Удаление временных данных сна"""
+        self.pending_dreams_cache.pop((chat_id, message_id))
         try:
-            with self.conn.cursor() as cur:
-                cur.execute("""
-                    DELETE FROM pending_dreams WHERE chat_id = %s
-                """, (chat_id,))
+            async with self._cursor() as cur:
+                await cur.execute("""
+                    DELETE FROM pending_dreams WHERE chat_id = %s AND message_id IS NOT DISTINCT FROM %s
+                """, (chat_id, message_id))
                 return True
         except Exception as e:
             print(f"❌ Ошибка удаления временных данных сна: {e}")
             return False
     
-    def _migrate_database(self):
-        """Миграция базы данных"""
+    async def sweep_pending_dreams(self):
+        """Удаление временных данных снов старше ttl_hours"""
+        async with self._cursor() as cur:
+            await cur.execute("""
+                DELETE FROM pending_dreams WHERE created_at < now() - %s * interval '1 hour'
+            """, (PENDING_DREAMS["ttl_hours"],))
+            if cur.rowcount > 0:
+                print(f"✅ Удалено просроченных временных данных снов: {cur.rowcount}")
+    
+    # === РАСШИФРОВКИ ГОЛОСОВЫХ ===
+    
+    async def get_transcription(self, file_unique_id: str) -> Optional[Tuple[Optional[str], Optional[str]]]:
+        """
+        Ранее полученная расшифровка голосового сообщения
+        
+        Returns:
+            (текст, причина отказа) или None, если сообщение еще не расшифровывалось;
+            ошибка БД считается промахом
+        """
+        cached = self.transcription_cache.get(file_unique_id)
+        if cached is not None or not TRANSCRIPTION_CACHE["db_enabled"]:
+            return cached
+        
         try:
-            with self.conn.cursor() as cur:
-                # Проверяем текущий размер поля source_type
-                cur.execute("""
-                    SELECT column_name, character_maximum_length 
-                    FROM information_schema.columns 
-                    WHERE table_name = 'dreams' AND column_name = 'source_type'
-                """)
-                result = cur.fetchone()
-                
-                if result and result[1] == 10:
-                    # Увеличиваем размер поля с VARCHAR(10) до VARCHAR(25)
-                    cur.execute("""
-                        ALTER TABLE dreams 
-                        ALTER COLUMN source_type TYPE VARCHAR(25)
-                    """)
-                    print("✅ Миграция БД: поле source_type увеличено до VARCHAR(25)")
-                else:
-                    print("✅ Миграция БД: поле source_type уже имеет нужный размер")
-                
-                # Проверяем наличие поля astrological_interpretation
-                cur.execute("""
-                    SELECT column_name 
-                    FROM information_schema.columns 
-                    WHERE table_name = 'dreams' AND column_name = 'astrological_interpretation'
-                """)
-                result = cur.fetchone()
-                
-                if not result:
-                    # Добавляем поле astrological_interpretation
-                    cur.execute("""
-                        ALTER TABLE dreams 
-                        ADD COLUMN astrological_interpretation TEXT
-                    """)
-                    print("✅ Миграция БД: добавлено поле astrological_interpretation")
-                else:
-                    print("✅ Миграция БД: поле astrological_interpretation уже существует")
-                
-                # Миграция user_stats - добавляем новые поля
-                # Проверяем наличие поля audio_sent
-                cur.execute("""
-                    SELECT column_name 
-                    FROM information_schema.columns 
-                    WHERE table_name = 'user_stats' AND column_name = 'audio_sent'
-                """)
-                result = cur.fetchone()
-                
-                if not result:
-                    cur.execute("""
-                        ALTER TABLE user_stats 
-                        ADD COLUMN audio_sent INTEGER DEFAULT 0
-                    """)
-                    print("✅ Миграция БД: добавлено поле audio_sent")
-                else:
-                    print("✅ Миграция БД: поле audio_sent уже существует")
-                
-                # Проверяем наличие поля dreams_saved
-                cur.execute("""
-                    SELECT column_name 
-                    FROM information_schema.columns 
-                    WHERE table_name = 'user_stats' AND column_name = 'dreams_saved'
-                """)
-                result = cur.fetchone()
-                
-                if not result:
-                    cur.execute("""
-                        ALTER TABLE user_stats 
-                        ADD COLUMN dreams_saved INTEGER DEFAULT 0
-                    """)
-                    print("✅ Миграция БД: добавлено поле dreams_saved")
-                else:
-                    print("✅ Миграция БД: поле dreams_saved уже существует")
-                
-                # Проверяем наличие поля latest_activity
-                cur.execute("""
-                    SELECT column_name 
-                    FROM information_schema.columns 
-                    WHERE table_name = 'user_stats' AND column_name = 'latest_activity'
-                """)
-                result = cur.fetchone()
-                
-                if not result:
-                    cur.execute("""
-                        ALTER TABLE user_stats 
-                        ADD COLUMN latest_activity TIMESTAMP DEFAULT NOW()
-                    """)
-                    print("✅ Миграция БД: добавлено поле latest_activity")
-                else:
-                    print("✅ Миграция БД: поле latest_activity уже существует")
-                    
+            async with self._cursor() as cur:
+                await cur.execute("""
+                    SELECT transcript, rejection FROM voice_transcriptions
+                    WHERE file_unique_id = %s AND created_at > now() - %s * interval '1 hour'
+                """, (file_unique_id, TRANSCRIPTION_CACHE["ttl_hours"]))
+                row = await cur.fetchone()
         except Exception as e:
-            print(f"⚠️ Ошибка миграции БД: {e}")
-            # Продолжаем работу, так как это не критично
-    
-    def close(self):
-        """Закрытие соединения с БД"""
-        if self.conn:
-            self.conn.close()
+            print(f"❌ Ошибка чтения кэша расшифровок: {e}")
+            return None
+        
+        if row is None:
+            return None
+        self.transcription_cache.put(file_unique_id, (row[0], row[1]))
+        return row[0], row[1]
+    
+    async def save_transcription(self, file_unique_id: str, transcript: Optional[str], rejection: Optional[str]):
+        """Сохранение расшифровки и вердикта по голосовому сообщению"""
+        # Причина обрезается под колонку один раз: из памяти и из БД читается одно и то же
+        rejection = rejection[:200] if rejection else None
+        self.transcription_cache.put(file_unique_id, (transcript, rejection))
+        if not TRANSCRIPTION_CACHE["db_enabled"]:
+            return
+        
+        async with self._cursor() as cur:
+            await cur.execute("""
+                INSERT INTO voice_transcriptions (file_unique_id, transcript, rejection, created_at)
+                VALUES (%s, %s, %s, NOW())
+                ON CONFLICT (file_unique_id) DO UPDATE SET
+                    transcript = EXCLUDED.transcript,
+                    rejection = EXCLUDED.rejection,
+                    created_at = EXCLUDED.created_at
+            """, (file_unique_id, transcript, rejection))
+    
+    async def sweep_transcriptions(self):
+        """Удаление расшифровок старше ttl_hours"""
+        async with self._cursor() as cur:
+            await cur.execute("""
+                DELETE FROM voice_transcriptions WHERE created_at < now() - %s * interval '1 hour'
+            """, (TRANSCRIPTION_CACHE["ttl_hours"],))
+            if cur.rowcount > 0:
+                print(f"✅ Удалено просроченных расшифровок: {cur.rowcount}")
+    
+    async def close(self):
+        """Сброс буферов и закрытие пула соединений с БД"""
+        self.ready = False
+        await self.activity_buffer.stop()
+        await self.stats_accumulator.stop()
+        await self.dream_counters_reconciler.stop()
+        await self.activity_log_maintenance.stop()
+        await self.activity_log_backfill.stop()
+        await self.pending_dreams_sweeper.stop()
+        await self.transcriptions_sweeper.stop()
+        await self.pool.close()
+
+
+# Глобальный экземпляр менеджера БД создается при первом обращении
+_db: Optional[DatabaseManager] = None
 
 
-# Глобальный экземпляр менеджера БД
-db = DatabaseManager()
+def get_db() -> DatabaseManager:
+    """Ленивый доступ к менеджеру БД (импорт модуля не трогает БД)"""
+    global _db
+    if _db is None:
+        _db = DatabaseManager()
+    return _db
@@ -29,6 +29,27 @@ class AIServiceError(BotError):
         super().__init__(message, "❌ Ошибка анализа сна. Попробуйте еще раз.")
 
 
+class AIOverloadedError(AIServiceError):
+    """Запрос к AI отклонен планировщиком: очередь переполнена или ожидание слишком долгое"""
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.user_message = "⏳ Сейчас очень много запросов. Попробуйте еще раз через минуту."
+
+
+class AITimeoutError(AIServiceError):
+    """Ответ AI не получен до дедлайна операции"""
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.user_message = "⏳ Ответ готовится слишком долго. Попробуйте еще раз."
+
+
+class AIUnavailableError(AIServiceError):
+    """OpenAI вернул ошибку, и повторы не помогли"""
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.user_message = "❌ Сервис толкований временно недоступен. Попробуйте через пару минут."
+
+
 class ValidationError(BotError):
     """Ошибки валидации данных"""
     def __init__(self, message: str, user_message: str = None):
@@ -112,7 +133,8 @@ async def _log_to_database(error_type: str, error_message: str, update):
         if not update:
             return
             
-        from core.database import db
+        from core.database import get_db
+        db = get_db()
         
         user = update.effective_user
         chat_id = str(update.effective_chat.id)
@@ -142,9 +164,9 @@ def safe_callback_data_split(callback_data: str, expected_parts: int = 2) -> lis
         raise ValidationError(f"Failed to parse callback_data: {callback_data}")
 
 
-async def validate_pending_dream(db, chat_id: str):
+async def validate_pending_dream(db, chat_id: str, message_id: int = None):
     """Валидация существования pending_dream"""
-    pending_dream = db.get_pending_dream(chat_id)
+    pending_dream = await db.get_pending_dream(chat_id, message_id)
     if not pending_dream:
         raise ValidationError(
             f"No pending dream found for chat_id: {chat_id}",
@@ -0,0 +1,130 @@
+"""
+Кэш истории переписки в памяти процесса (write-through)
+"""
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional
+
+
+class ConversationHistoryCache:
+    """
+    Последние сообщения каждого чата в кольцевом буфере.
+    
+    Если задан count_tokens, при попадании в буфер у сообщения
+    один раз считается число токенов (поле tokens); None от count_tokens
+    значит, что точного числа пока нет, и поле не заполняется.
+
+    Буфер чата заполняется из БД при первом чтении, после чего новые
+    сообщения дописываются в него при сохранении в БД. Чаты вытесняются
+    по LRU при превышении числа чатов или суммарного объема текста.
+
+    Сообщения, записанные другими репликами, в буфер не попадают, поэтому
+    буфер живет не дольше ttl секунд с загрузки из БД, после чего история
+    перечитывается.
+    """
+
+    def __init__(self, messages_per_chat: int, max_chats: int, max_chars: int, ttl: float,
+                 count_tokens: Optional[Callable[[Dict], Optional[int]]] = None):
+        self.messages_per_chat = messages_per_chat
+        self.max_chats = max_chats
+        self.max_chars = max_chars
+        self.ttl = ttl
+        self.count_tokens = count_tokens
+        self._chats: "OrderedDict[str, deque]" = OrderedDict()
+        # Время загрузки буфера чата из БД (time.monotonic)
+        self._loaded_at: Dict[str, float] = {}
+        self._chars = 0
+        # Чаты, загружаемые из БД: True, если во время загрузки была запись
+        self._loading: Dict[str, bool] = {}
+
+        # Счетчики для мониторинга
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, chat_id: str, limit: int) -> Optional[List[Dict[str, str]]]:
+        """Последние limit сообщений чата или None, если чата нет в кэше"""
+        buffer = self._chats.get(chat_id)
+        if buffer is not None and time.monotonic() - self._loaded_at[chat_id] > self.ttl:
+            self._drop(chat_id)
+            self.expirations += 1
+            buffer = None
+        if buffer is None or limit > self.messages_per_chat:
+            self.misses += 1
+            return None
+
+        self._chats.move_to_end(chat_id)
+        self.hits += 1
+        messages = list(buffer)
+        return [dict(message) for message in messages[max(0, len(messages) - limit):]]
+
+    def begin_load(self, chat_id: str):
+        """Отметка о начале чтения истории чата из БД"""
+        self._loading.setdefault(chat_id, False)
+
+    def finish_load(self, chat_id: str, messages: Optional[List[Dict[str, str]]]):
+        """
+        Заполнение буфера прочитанной из БД историей (None - чтение не удалось)
+
+        Если пока шло чтение в чат было записано сообщение, прочитанная
+        история может его не содержать - такой результат в кэш не кладется.
+        """
+        dirty = self._loading.pop(chat_id, True)
+        if dirty or messages is None or chat_id in self._chats:
+            return
+
+        buffer = deque(maxlen=self.messages_per_chat)
+        self._chats[chat_id] = buffer
+        self._loaded_at[chat_id] = time.monotonic()
+        for message in messages:
+            self._push(buffer, message)
+        self._evict()
+
+    def append(self, chat_id: str, role: str, content: str, message_id: Optional[int] = None):
+        """Дописывание сохраненного в БД сообщения (message_id - messages.id) в буфер чата"""
+        buffer = self._chats.get(chat_id)
+        if buffer is None:
+            # Чат не в кэше: его история загрузится из БД при следующем чтении
+            if chat_id in self._loading:
+                self._loading[chat_id] = True
+            return
+
+        message = {"role": role, "content": content}
+        if message_id is not None:
+            message["id"] = message_id
+        self._push(buffer, message)
+        self._chats.move_to_end(chat_id)
+        self._evict()
+
+    def _push(self, buffer: deque, message: Dict):
+        if self.count_tokens and "tokens" not in message:
+            tokens = self.count_tokens(message)
+            if tokens is not None:
+                message["tokens"] = tokens
+        if len(buffer) == buffer.maxlen:
+            self._chars -= len(buffer[0]["content"])
+        buffer.append(message)
+        self._chars += len(message["content"])
+
+    def _evict(self):
+        """Вытеснение давно не использованных чатов сверх лимитов"""
+        while self._chats and (len(self._chats) > self.max_chats or self._chars > self.max_chars):
+            self._drop(next(iter(self._chats)))
+            self.evictions += 1
+
+    def _drop(self, chat_id: str):
+        buffer = self._chats.pop(chat_id)
+        del self._loaded_at[chat_id]
+        self._chars -= sum(len(message["content"]) for message in buffer)
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики кэша для мониторинга"""
+        return {
+            "chats": len(self._chats),
+            "chars": self._chars,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
@@ -0,0 +1,327 @@
+"""
+Версионированные миграции схемы БД
+"""
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from typing import Awaitable, Callable, List
+
+from psycopg import errors
+from psycopg_pool import AsyncConnectionPool
+
+# Ключ advisory-блокировки: миграции выполняет только одна реплика одновременно
+MIGRATIONS_LOCK_ID = 7406451801
+
+# Партиции лога активности: user_activity_log_pГГГГММ
+ACTIVITY_PARTITION_PREFIX = "user_activity_log_p"
+ACTIVITY_PARTITION_RE = re.compile(rf"^{ACTIVITY_PARTITION_PREFIX}(\d{{4}})(\d{{2}})$")
+
+
+def add_months(month: date, months: int) -> date:
+    """Первое число месяца, отстоящего от month на months месяцев"""
+    years, month_index = divmod(month.month - 1 + months, 12)
+    return date(month.year + years, month_index + 1, 1)
+
+
+def current_month() -> date:
+    """Первое число текущего месяца (UTC)"""
+    return datetime.now(timezone.utc).date().replace(day=1)
+
+
+async def create_activity_partitions(conn, first_month: date, last_month: date):
+    """Создание помесячных партиций user_activity_log с first_month по last_month включительно"""
+    month = first_month
+    while month <= last_month:
+        next_month = add_months(month, 1)
+        await conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {ACTIVITY_PARTITION_PREFIX}{month:%Y%m}
+            PARTITION OF user_activity_log
+            FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month.isoformat()}')
+        """)
+        month = next_month
+
+
+@dataclass
+class Migration:
+    """Шаг миграции: применяется один раз в отдельной транзакции"""
+    version: int
+    description: str
+    apply: Callable[..., Awaitable]
+
+
+async def _baseline_schema(conn):
+    """Исходные таблицы бота и прежние проверки _migrate_database"""
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_stats (
+            chat_id VARCHAR(20) PRIMARY KEY,
+            username VARCHAR(100),
+            messages_sent INTEGER DEFAULT 0,
+            audio_sent INTEGER DEFAULT 0,
+            symbols_sent INTEGER DEFAULT 0,
+            starts_count INTEGER DEFAULT 0,
+            dreams_saved INTEGER DEFAULT 0,
+            latest_activity TIMESTAMP DEFAULT NOW(),
+            updated_at TIMESTAMP DEFAULT NOW()
+        )
+    """)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS messages (
+            id SERIAL PRIMARY KEY,
+            chat_id VARCHAR(20) NOT NULL,
+            role VARCHAR(20) NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT NOW()
+        )
+    """)
+    # Индекс для быстрого поиска истории
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_messages_chat_id_timestamp
+        ON messages (chat_id, timestamp DESC)
+    """)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_profile (
+            chat_id VARCHAR(20) PRIMARY KEY,
+            username VARCHAR(100),
+            gender VARCHAR(20),
+            age_group VARCHAR(20),
+            lucid_dreaming VARCHAR(20),
+            updated_at TIMESTAMP DEFAULT NOW()
+        )
+    """)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_activity_log (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT,
+            username VARCHAR(100),
+            chat_id VARCHAR(20),
+            action VARCHAR(50),
+            content TEXT,
+            timestamp TIMESTAMP DEFAULT NOW()
+        )
+    """)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS dreams (
+            id SERIAL PRIMARY KEY,
+            chat_id VARCHAR(20) NOT NULL,
+            dream_text TEXT NOT NULL,
+            interpretation TEXT NOT NULL,
+            astrological_interpretation TEXT,
+            source_type VARCHAR(25) NOT NULL DEFAULT 'text',
+            created_at TIMESTAMP DEFAULT NOW(),
+            dream_date DATE DEFAULT CURRENT_DATE,
+            tags TEXT[] DEFAULT '{}'
+        )
+    """)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS pending_dreams (
+            id SERIAL PRIMARY KEY,
+            chat_id VARCHAR(20) NOT NULL,
+            dream_text TEXT NOT NULL,
+            interpretation TEXT NOT NULL,
+            source_type VARCHAR(25) NOT NULL,
+            astrological_interpretation TEXT,
+            created_at TIMESTAMP DEFAULT NOW(),
+            updated_at TIMESTAMP DEFAULT NOW()
+        )
+    """)
+    # Индекс для быстрого поиска временных данных
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_pending_dreams_chat_id
+        ON pending_dreams (chat_id)
+    """)
+
+    # Базы, созданные старыми версиями бота, могут не иметь этих изменений
+    await conn.execute("ALTER TABLE dreams ALTER COLUMN source_type TYPE VARCHAR(25)")
+    await conn.execute("ALTER TABLE dreams ADD COLUMN IF NOT EXISTS astrological_interpretation TEXT")
+    await conn.execute("ALTER TABLE user_stats ADD COLUMN IF NOT EXISTS audio_sent INTEGER DEFAULT 0")
+    await conn.execute("ALTER TABLE user_stats ADD COLUMN IF NOT EXISTS dreams_saved INTEGER DEFAULT 0")
+    await conn.execute("ALTER TABLE user_stats ADD COLUMN IF NOT EXISTS latest_activity TIMESTAMP DEFAULT NOW()")
+
+
+async def _dreams_keyset_index(conn):
+    """Индекс для keyset-пагинации дневника по (created_at, id)"""
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_dreams_chat_id_created_id
+        ON dreams (chat_id, created_at DESC, id DESC)
+    """)
+    # Старый индекс покрывается новым
+    await conn.execute("DROP INDEX IF EXISTS idx_dreams_chat_id_date")
+
+
+async def _dream_counters(conn):
+    """Денормализованный счетчик снов с первичным заполнением"""
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS dream_counters (
+            chat_id VARCHAR(20) PRIMARY KEY,
+            dreams_count INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT NOW()
+        )
+    """)
+    await conn.execute("""
+        INSERT INTO dream_counters (chat_id, dreams_count)
+        SELECT chat_id, COUNT(*) FROM dreams GROUP BY chat_id
+        ON CONFLICT (chat_id) DO NOTHING
+    """)
+
+
+async def _partition_activity_log(conn):
+    """
+    Секционирование user_activity_log по месяцам
+
+    Лог только дописывается и читается целыми партициями при свертке,
+    поэтому индексов на нем нет. Строки вне созданных партиций попадают
+    в партицию по умолчанию. Старая таблица остается как
+    user_activity_log_legacy до завершения фонового переноса.
+    """
+    cur = await conn.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('user_activity_log')")
+    result = await cur.fetchone()
+    if result and result[0] == 'p':
+        # Таблица уже секционирована
+        return
+
+    await conn.execute("ALTER TABLE user_activity_log RENAME TO user_activity_log_legacy")
+    await conn.execute("ALTER SEQUENCE IF EXISTS user_activity_log_id_seq RENAME TO user_activity_log_legacy_id_seq")
+
+    await conn.execute("""
+        CREATE TABLE user_activity_log (
+            id BIGSERIAL,
+            user_id BIGINT,
+            username VARCHAR(100),
+            chat_id VARCHAR(20),
+            action VARCHAR(50),
+            content TEXT,
+            timestamp TIMESTAMP NOT NULL DEFAULT NOW()
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    await conn.execute("""
+        CREATE TABLE user_activity_log_default
+        PARTITION OF user_activity_log DEFAULT
+    """)
+    # Ежедневная сводка по удаленным партициям
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_activity_daily (
+            day DATE NOT NULL,
+            action VARCHAR(50) NOT NULL,
+            events INTEGER NOT NULL,
+            unique_users INTEGER NOT NULL,
+            PRIMARY KEY (day, action)
+        )
+    """)
+
+    # Партиции за весь период старых данных (лишние удалит обслуживание по сроку хранения);
+    # самая старая запись - первая по первичному ключу, без полного просмотра таблицы
+    cur = await conn.execute("SELECT timestamp FROM user_activity_log_legacy ORDER BY id LIMIT 1")
+    row = await cur.fetchone()
+    first_month = row[0].date().replace(day=1) if row and row[0] else current_month()
+    await create_activity_partitions(conn, min(first_month, current_month()), current_month())
+
+    # Сами строки переносятся в фоне порциями (DatabaseManager.backfill_activity_log):
+    # копирование большой таблицы здесь держало бы блокировку миграций и задерживало старт
+
+
+async def _pending_dreams_by_message(conn):
+    """Временные данные сна хранятся по (chat_id, message_id сообщения с толкованием)"""
+    await conn.execute("ALTER TABLE pending_dreams ADD COLUMN IF NOT EXISTS message_id BIGINT")
+    await conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_pending_dreams_chat_message
+        ON pending_dreams (chat_id, message_id)
+    """)
+    # Поиск по chat_id покрывается новым индексом
+    await conn.execute("DROP INDEX IF EXISTS idx_pending_dreams_chat_id")
+
+
+async def _conversation_summaries(conn):
+    """Пересказ старой части переписки: покрывает сообщения с id <= last_message_id"""
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_summaries (
+            chat_id VARCHAR(20) PRIMARY KEY,
+            summary TEXT NOT NULL,
+            last_message_id INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT NOW()
+        )
+    """)
+
+
+async def _voice_transcriptions(conn):
+    """Расшифровки и вердикты по голосовым сообщениям (file_unique_id Telegram)"""
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS voice_transcriptions (
+            file_unique_id VARCHAR(64) PRIMARY KEY,
+            transcript TEXT,
+            rejection VARCHAR(200),
+            created_at TIMESTAMP DEFAULT NOW()
+        )
+    """)
+    # Для удаления просроченных записей
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_voice_transcriptions_created_at
+        ON voice_transcriptions (created_at)
+    """)
+
+
+# Порядок применения. Новые шаги добавляются только в конец, примененные не меняются
+MIGRATIONS: List[Migration] = [
+    Migration(1, "Базовая схема", _baseline_schema),
+    Migration(2, "Индекс дневника для keyset-пагинации", _dreams_keyset_index),
+    Migration(3, "Счетчики снов", _dream_counters),
+    Migration(4, "Секционирование user_activity_log по месяцам", _partition_activity_log),
+    Migration(5, "pending_dreams по сообщению с толкованием", _pending_dreams_by_message),
+    Migration(6, "Пересказы переписки", _conversation_summaries),
+    Migration(7, "Кэш расшифровок голосовых сообщений", _voice_transcriptions),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+async def _current_version(conn) -> int:
+    """Текущая версия схемы (0, если таблицы schema_version еще нет)"""
+    try:
+        cur = await conn.execute("SELECT MAX(version) FROM schema_version")
+    except errors.UndefinedTable:
+        return 0
+    return (await cur.fetchone())[0] or 0
+
+
+async def run_migrations(pool: AsyncConnectionPool) -> int:
+    """
+    Приведение схемы БД к последней версии
+
+    Если схема актуальна, выполняется один запрос версии. Иначе берется
+    advisory-блокировка (остальные реплики ждут ее), версия перечитывается
+    и недостающие шаги применяются по порядку, каждый в своей транзакции.
+
+    Returns:
+        Версия схемы после миграций
+    """
+    async with pool.connection() as conn:
+        version = await _current_version(conn)
+        if version >= LATEST_VERSION:
+            return version
+
+        await conn.execute("SELECT pg_advisory_lock(%s)", (MIGRATIONS_LOCK_ID,))
+        try:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at TIMESTAMP DEFAULT NOW()
+                )
+            """)
+            # Пока ждали блокировку, другая реплика могла уже все применить
+            version = await _current_version(conn)
+
+            for migration in MIGRATIONS:
+                if migration.version <= version:
+                    continue
+                async with conn.transaction():
+                    await migration.apply(conn)
+                    await conn.execute(
+                        "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                        (migration.version, migration.description)
+                    )
+                version = migration.version
+                print(f"✅ Миграция БД {migration.version}: {migration.description}")
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(%s)", (MIGRATIONS_LOCK_ID,))
+
+    return version
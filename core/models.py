@@ -2,8 +2,8 @@
 Модели данных и вспомогательные классы
 """
 from dataclasses import dataclass
-from datetime import datetime
-from typing import Optional, List
+from datetime import datetime, timedelta
+from typing import Optional, List, Tuple
 
 
 @dataclass
@@ -95,6 +95,21 @@ class PaginationHelper:
             "has_prev": has_prev,
             "has_next": has_next
         }
+    
+    # Курсор кодируется в callback_data как "<микросекунды от эпохи>:<id>"
+    _CURSOR_EPOCH = datetime(1970, 1, 1)
+    
+    @staticmethod
+    def encode_cursor(created_at: datetime, item_id: int) -> str:
+        """Кодирование курсора keyset-пагинации для callback_data"""
+        micros = (created_at.replace(tzinfo=None) - PaginationHelper._CURSOR_EPOCH) // timedelta(microseconds=1)
+        return f"{micros}:{item_id}"
+    
+    @staticmethod
+    def decode_cursor(micros: str, item_id: str) -> Tuple[datetime, int]:
+        """Декодирование курсора keyset-пагинации из частей callback_data"""
+        created_at = PaginationHelper._CURSOR_EPOCH + timedelta(microseconds=int(micros))
+        return created_at, int(item_id)
 
 
 class MessageFormatter:
@@ -117,6 +132,24 @@ class MessageFormatter:
         """Форматирование даты и времени для отображения"""
         return dt.strftime("%d.%m.%Y в %H:%M")
     
+    @staticmethod
+    def format_profile_info(profile: Optional[Tuple]) -> str:
+        """Форматирование профиля пользователя для промпта GPT"""
+        if not profile:
+            return ""
+        
+        gender, age_group, lucid = profile
+        profile_parts = []
+        
+        if gender:
+            profile_parts.append(f"User gender: {gender}")
+        if age_group:
+            profile_parts.append(f"User age group: {age_group}")
+        if lucid:
+            profile_parts.append(f"Lucid dream experience: {lucid}")
+        
+        return ". ".join(profile_parts) + ("." if profile_parts else "")
+    
     @staticmethod
     def truncate_message(text: str, max_length: int = 4000) -> str:
         """Обрезка сообщения до допустимой длины"""
@@ -0,0 +1,276 @@
+"""
+Разбор голосовых сообщений Telegram (Ogg/Opus) без декодирования звука
+
+Используются только контейнер Ogg (RFC 3533) и TOC-байт пакетов Opus
+(RFC 6716, раздел 3.1): из них известны длительность каждого пакета и
+его размер. Opus в голосовых сообщениях кодируется с переменным
+битрейтом, поэтому тишина и фоновый шум дают пакеты в несколько байт,
+а речь - в десятки. Битрейт пакета служит дешевой оценкой энергии
+сигнала там, где декодер libopus недоступен.
+"""
+import struct
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
+
+OGG_CAPTURE = b"OggS"
+# capture pattern, version, header type, granule, serial, sequence, crc, число сегментов
+_PAGE_HEADER = struct.Struct("<4sBBqIIIB")
+
+# Длительность кадра (мс) по номеру конфигурации TOC
+_SILK_FRAME_MS = (10, 20, 40, 60)
+_HYBRID_FRAME_MS = (10, 20)
+_CELT_FRAME_MS = (2.5, 5, 10, 20)
+
+
+@dataclass
+class OggPage:
+    """Страница Ogg: заголовок и сегменты полезной нагрузки"""
+    header_type: int
+    granule: int
+    serial: int
+    sequence: int
+    segments: List[int]
+    body: memoryview
+
+
+@dataclass
+class OpusPacket:
+    """Аудиопакет Opus: данные, длительность и гранула страницы, на которой он закончился"""
+    data: bytes
+    duration: float
+    granule: int
+
+    @property
+    def bitrate(self) -> float:
+        """Битрейт пакета, бит/с"""
+        return len(self.data) * 8 / self.duration if self.duration else 0.0
+
+
+@dataclass
+class OpusStream:
+    """Разобранный поток: заголовочные пакеты и аудиопакеты"""
+    head: bytes
+    tags: bytes
+    serial: int
+    packets: List[OpusPacket]
+
+    @property
+    def duration(self) -> float:
+        return sum(packet.duration for packet in self.packets)
+
+
+def iter_pages(data) -> Iterator[OggPage]:
+    """Страницы Ogg по порядку (разбор останавливается на первой поврежденной)"""
+    view = memoryview(data).cast("B")
+    offset = 0
+    while offset + _PAGE_HEADER.size <= len(view):
+        capture, version, header_type, granule, serial, sequence, _crc, count = _PAGE_HEADER.unpack_from(view, offset)
+        if capture != OGG_CAPTURE or version != 0:
+            return
+        table_start = offset + _PAGE_HEADER.size
+        segments = list(view[table_start:table_start + count])
+        body_start = table_start + count
+        body_end = body_start + sum(segments)
+        if len(segments) != count or body_end > len(view):
+            return
+        yield OggPage(header_type, granule, serial, sequence, segments, view[body_start:body_end])
+        offset = body_end
+
+
+def opus_packet_duration(packet: bytes) -> float:
+    """Длительность пакета Opus в секундах по TOC-байту (0 - пакет некорректен)"""
+    if not packet:
+        return 0.0
+    toc = packet[0]
+    config = toc >> 3
+    if config < 12:
+        frame_ms = _SILK_FRAME_MS[config % 4]
+    elif config < 16:
+        frame_ms = _HYBRID_FRAME_MS[config % 2]
+    else:
+        frame_ms = _CELT_FRAME_MS[config % 4]
+
+    code = toc & 0x03
+    if code == 0:
+        frames = 1
+    elif code in (1, 2):
+        frames = 2
+    else:
+        if len(packet) < 2:
+            return 0.0
+        frames = packet[1] & 0x3F
+    return frames * frame_ms / 1000
+
+
+def parse_opus(data) -> Optional[OpusStream]:
+    """
+    Разбор Ogg/Opus на пакеты
+
+    Returns:
+        Поток или None, если данные не Ogg/Opus
+    """
+    head = tags = None
+    serial = None
+    packets: List[OpusPacket] = []
+    pending: List[bytes] = []
+
+    for page in iter_pages(data):
+        if serial is None:
+            serial = page.serial
+        elif page.serial != serial:
+            # Голосовые сообщения содержат один логический поток
+            continue
+
+        position = 0
+        for size in page.segments:
+            pending.append(bytes(page.body[position:position + size]))
+            position += size
+            if size == 255:
+                # Пакет продолжается в следующем сегменте (возможно, на следующей странице)
+                continue
+
+            packet = b"".join(pending)
+            pending = []
+            if head is None:
+                if not packet.startswith(b"OpusHead"):
+                    return None
+                head = packet
+            elif tags is None:
+                tags = packet
+            else:
+                duration = opus_packet_duration(packet)
+                if duration:
+                    packets.append(OpusPacket(packet, duration, page.granule))
+
+    if head is None or tags is None:
+        return None
+    return OpusStream(head, tags, serial, packets)
+
+
+# === СБОРКА OGG ===
+
+# Частота гранул Opus: позиции в Ogg всегда в отсчетах 48 кГц
+OPUS_GRANULE_RATE = 48000
+# Пакетов на страницу (пакет голосового сообщения обычно занимает 1-2 сегмента)
+_PACKETS_PER_PAGE = 50
+# Размер таблицы сегментов страницы - один байт
+_MAX_SEGMENTS = 255
+
+
+def _crc_table() -> List[int]:
+    table = []
+    for i in range(256):
+        crc = i << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else (crc << 1)
+        table.append(crc & 0xFFFFFFFF)
+    return table
+
+
+_CRC_TABLE = _crc_table()
+
+
+def ogg_crc(data: bytes) -> int:
+    """CRC-32 страницы Ogg (полином 0x04C11DB7, без отражения, начальное значение 0)"""
+    crc = 0
+    table = _CRC_TABLE
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ table[(crc >> 24) ^ byte]
+    return crc
+
+
+def _lacing(packet: bytes) -> List[int]:
+    """Сегменты пакета в таблице страницы"""
+    return [255] * (len(packet) // 255) + [len(packet) % 255]
+
+
+def _page(packets: List[bytes], granule: int, serial: int, sequence: int, header_type: int) -> bytes:
+    segments = []
+    for packet in packets:
+        segments.extend(_lacing(packet))
+    if len(segments) > _MAX_SEGMENTS:
+        raise ValueError(f"Страница Ogg не вмещает {len(segments)} сегментов")
+    header = _PAGE_HEADER.pack(OGG_CAPTURE, 0, header_type, granule, serial, sequence, 0, len(segments))
+    page = bytearray(header + bytes(segments) + b"".join(packets))
+    struct.pack_into("<I", page, 22, ogg_crc(page))
+    return bytes(page)
+
+
+def write_opus(stream: OpusStream, packets: List[OpusPacket]) -> bytes:
+    """
+    Сборка самостоятельного файла Ogg/Opus из части пакетов потока
+
+    Гранулы отсчитываются заново от начала части, заголовки берутся из
+    исходного потока.
+    """
+    pre_skip = struct.unpack_from("<H", stream.head, 10)[0] if len(stream.head) >= 12 else 0
+    pages = [
+        _page([stream.head], 0, stream.serial, 0, 0x02),
+        _page([stream.tags], 0, stream.serial, 1, 0x00)
+    ]
+    # Пакеты по страницам: не больше _PACKETS_PER_PAGE и не больше 255 сегментов на страницу
+    batches: List[List[OpusPacket]] = []
+    segments = 0
+    for packet in packets:
+        size = len(_lacing(packet.data))
+        if size > _MAX_SEGMENTS:
+            # Пакет через границу страницы не переносим: у Opus таких пакетов не бывает
+            raise ValueError(f"Пакет Opus слишком большой для одной страницы: {len(packet.data)} байт")
+        if not batches or len(batches[-1]) >= _PACKETS_PER_PAGE or segments + size > _MAX_SEGMENTS:
+            batches.append([])
+            segments = 0
+        batches[-1].append(packet)
+        segments += size
+
+    granule = pre_skip
+    for index, batch in enumerate(batches):
+        granule += round(sum(packet.duration for packet in batch) * OPUS_GRANULE_RATE)
+        last = index == len(batches) - 1
+        pages.append(_page([packet.data for packet in batch], granule, stream.serial, len(pages), 0x04 if last else 0x00))
+    return b"".join(pages)
+
+
+def split_opus(stream: OpusStream, chunk_seconds: float, overlap_seconds: float,
+               boundary_window: float) -> List[List[OpusPacket]]:
+    """
+    Разбиение потока на части около chunk_seconds с перекрытием
+
+    Граница ищется в окне +-boundary_window вокруг целевой точки в самом
+    тихом месте: там, где суммарный размер пакетов за ~100 мс минимален.
+    Каждая следующая часть начинается на overlap_seconds раньше границы.
+    """
+    packets = stream.packets
+    if not packets:
+        return []
+
+    # Время начала каждого пакета и префиксные суммы размеров
+    starts = [0.0]
+    sizes = [0]
+    for packet in packets:
+        starts.append(starts[-1] + packet.duration)
+        sizes.append(sizes[-1] + len(packet.data))
+    total = starts[-1]
+
+    def loudness(index: int, span: int = 5) -> float:
+        end = min(len(packets), index + span)
+        return (sizes[end] - sizes[index]) / max(starts[end] - starts[index], 1e-6)
+
+    boundaries = []
+    target = chunk_seconds
+    while target < total - chunk_seconds / 2:
+        candidates = [i for i in range(1, len(packets)) if abs(starts[i] - target) <= boundary_window]
+        if not candidates:
+            break
+        boundary = min(candidates, key=loudness)
+        boundaries.append(boundary)
+        target = starts[boundary] + chunk_seconds
+
+    chunks = []
+    begin = 0
+    for boundary in boundaries + [len(packets)]:
+        first = begin
+        while first > 0 and starts[begin] - starts[first - 1] <= overlap_seconds:
+            first -= 1
+        chunks.append(packets[first:boundary])
+        begin = boundary
+    return chunks
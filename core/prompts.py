@@ -0,0 +1,97 @@
+"""
+Сборка промптов для GPT
+
+OpenAI кэширует общий префикс запросов (от 1024 токенов), поэтому в
+начале запроса идут только неизменные инструкции (побайтно одинаковые
+между вызовами), затем история, а меняющийся контекст - дата, профиль,
+пересказ, текст сна - в самом конце.
+"""
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from core.config import DEFAULT_SYSTEM_PROMPT, CONVERSATION_SUMMARY
+from core.tokens import token_counter
+
+CLARIFICATION_PROMPT = """#Instructions: Answer the user's question about the previous interpretation thoroughly & warmly. Keep supportive tone. Use ❓ emoji. Be helpful & empathetic. Don't rewrite dream interpretation. Give useful advice if relevant. Russian language, informal 'ты'. Use the full context provided to give accurate and relevant answers."""
+
+ASTROLOGY_PROMPT = """#Role You are an experienced astrologer; #Task Give ONLY an astrological analysis of the dream, without repeating or retelling any previous interpretation; #Rules Start with 🔮 emoji and immediately begin astrological analysis; use astrological approach: planets, zodiac signs, houses, aspects; link dream symbols with astrological archetypes; if dream date is given, use it; be thorough & supportive; structure analysis with emojis; NO greetings or introductory phrases; #Usercontext End by inviting reflection/response; write in Russian using informal 'ты'."""
+
+SUMMARY_PROMPT = """#Role You maintain a running summary of a conversation between a user and a dream interpreter; #Task Merge the previous summary with the new messages into one updated summary; #Rules Keep what matters for future interpretations: recurring dream symbols and themes, the user's emotions, life circumstances and events they mentioned, questions they asked, key conclusions of past interpretations; drop greetings and repetition; no more than 250 words; plain text without Markdown; write in Russian."""
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def dream_context(profile_info: str = "", summary: str = "") -> str:
+    """Меняющийся контекст толкования: дата, профиль, пересказ переписки"""
+    context = f"# Current date\nToday is {_today()}."
+
+    if profile_info:
+        context += f"\n\n# User context\n{profile_info.strip()}"
+
+    if summary:
+        context += f"\n\n# Earlier conversation (summary)\n{summary.strip()}"
+
+    return context
+
+
+def fit_history(history: List[Dict], budget: int) -> List[Dict]:
+    """
+    Последние сообщения истории, помещающиеся в бюджет токенов
+
+    История заполняется от новых сообщений к старым и обрывается на
+    первом не поместившемся, чтобы не было пропусков в середине.
+    """
+    fitted = []
+    for message in reversed(history):
+        tokens = token_counter.count_message(message)
+        if tokens > budget:
+            break
+        budget -= tokens
+        fitted.append({"role": message["role"], "content": message["content"]})
+    fitted.reverse()
+    return fitted
+
+
+def dream_messages(dream_text: str, history: List[Dict], profile_info: str, summary: str,
+                   max_input_tokens: int) -> List[Dict]:
+    """Запрос толкования: инструкции, история, контекст, сон (история обрезается по бюджету)"""
+    system = {"role": "system", "content": DEFAULT_SYSTEM_PROMPT}
+    context = {"role": "system", "content": dream_context(profile_info, summary)}
+    # Добавляем дату сна (по умолчанию сегодня)
+    dream = {"role": "user", "content": f"Сон от {_today()}:\n{dream_text}"}
+
+    budget = max_input_tokens - token_counter.count_messages([system, context, dream])
+    return [system] + fit_history(history, budget) + [context, dream]
+
+
+def clarification_messages(question: str, context_summary: str) -> List[Dict]:
+    """Уточняющий вопрос к предыдущему толкованию"""
+    return [
+        {"role": "system", "content": CLARIFICATION_PROMPT},
+        {"role": "system", "content": f"Previous context: {context_summary}"},
+        {"role": "user", "content": question}
+    ]
+
+
+def astrology_messages(dream_text: str, dream_date: str = None) -> List[Dict]:
+    """Астрологическое толкование сна"""
+    date_info = f"Дата сна: {dream_date}" if dream_date else "Дата сна: не указана"
+    return [
+        {"role": "system", "content": ASTROLOGY_PROMPT},
+        {"role": "user", "content": f"{date_info}\nСон: {dream_text}\n\nПроанализируй мой сон астрологически."}
+    ]
+
+
+def summary_messages(previous_summary: str, messages: List[Dict]) -> List[Dict]:
+    """Обновление пересказа переписки"""
+    limit = CONVERSATION_SUMMARY["message_chars"]
+    transcript = "\n\n".join(
+        f"{'User' if message['role'] == 'user' else 'Interpreter'}: {message['content'][:limit]}"
+        for message in messages
+    )
+    return [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": f"PREVIOUS SUMMARY:\n{previous_summary or '(нет)'}\n\nNEW MESSAGES:\n{transcript}"}
+    ]
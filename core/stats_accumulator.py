@@ -0,0 +1,115 @@
+"""
+Агрегатор счетчиков user_stats с отложенной записью
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from core.background import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StatsDelta:
+    """Накопленные изменения статистики одного чата"""
+    username: Optional[str] = None
+    messages_sent: int = 0
+    audio_sent: int = 0
+    symbols_sent: int = 0
+    starts_count: int = 0
+    dreams_saved: int = 0
+    latest_activity: Optional[datetime] = None
+
+    def merge(self, other: "StatsDelta"):
+        """Слияние с другой дельтой того же чата"""
+        self.username = other.username or self.username
+        self.messages_sent += other.messages_sent
+        self.audio_sent += other.audio_sent
+        self.symbols_sent += other.symbols_sent
+        self.starts_count += other.starts_count
+        self.dreams_saved += other.dreams_saved
+        if other.latest_activity and (not self.latest_activity or other.latest_activity > self.latest_activity):
+            self.latest_activity = other.latest_activity
+
+
+class StatsAccumulator:
+    """
+    Копит приращения счетчиков user_stats по чатам и сбрасывает их
+    одним upsert на чат за интервал.
+
+    Несколько событий одного пользователя (нажатия кнопок, сообщения,
+    старты) складываются в памяти, latest_activity берется максимальным.
+    """
+
+    def __init__(self, write_batch: Callable[[List[tuple]], Awaitable], flush_interval: float,
+                 max_pending_chats: int):
+        self.write_batch = write_batch
+        self.max_pending_chats = max_pending_chats
+        self._pending: Dict[str, StatsDelta] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flusher = PeriodicTask("user_stats_flush", flush_interval, self.flush, run_on_stop=True)
+
+        # Счетчики для мониторинга
+        self.recorded = 0
+        self.flushed_rows = 0
+        self.failed_flushes = 0
+
+    def add(self, chat_id: str, username: Optional[str] = None, **increments):
+        """Учет события: приращения счетчиков и обновление последней активности"""
+        delta = StatsDelta(username=username, latest_activity=datetime.now(timezone.utc), **increments)
+
+        pending = self._pending.get(chat_id)
+        if pending:
+            pending.merge(delta)
+        else:
+            self._pending[chat_id] = delta
+        self.recorded += 1
+
+        if len(self._pending) >= self.max_pending_chats:
+            self._flusher.trigger()
+
+    async def flush(self):
+        """Запись накопленных дельт: одна строка на чат"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+
+            pending, self._pending = self._pending, {}
+            # Сортировка по chat_id дает одинаковый порядок блокировок строк у всех реплик
+            rows = [
+                (chat_id, d.username, d.messages_sent, d.audio_sent, d.symbols_sent,
+                 d.starts_count, d.dreams_saved, d.latest_activity)
+                for chat_id, d in sorted(pending.items())
+            ]
+
+            try:
+                await self.write_batch(rows)
+                self.flushed_rows += len(rows)
+            except Exception as e:
+                self.failed_flushes += 1
+                # Возвращаем дельты обратно, объединяя с накопленными за время записи
+                for chat_id, delta in pending.items():
+                    if chat_id in self._pending:
+                        delta.merge(self._pending[chat_id])
+                    self._pending[chat_id] = delta
+                logger.error(f"❌ Не удалось записать статистику ({len(rows)} чатов): {e}")
+
+    def start(self):
+        """Запуск фонового сброса"""
+        self._flusher.start()
+
+    async def stop(self):
+        """Остановка фонового сброса с финальной записью"""
+        await self._flusher.stop()
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики агрегатора для мониторинга"""
+        return {
+            "pending_chats": len(self._pending),
+            "recorded": self.recorded,
+            "flushed_rows": self.flushed_rows,
+            "failed_flushes": self.failed_flushes
+        }
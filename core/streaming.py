@@ -0,0 +1,162 @@
+"""
+Потоковый вывод ответа GPT в сообщение Telegram (постепенное редактирование)
+"""
+import logging
+import time
+from contextlib import aclosing
+from typing import AsyncIterator, Dict
+
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from core.config import STREAMING, PAGINATION
+
+logger = logging.getLogger(__name__)
+
+# Парные маркеры разметки Telegram Markdown (legacy)
+_CODE_BLOCK = "```"
+_INLINE_MARKERS = ("*", "_")
+
+
+def balance_markdown(text: str) -> str:
+    """
+    Закрытие незакрытой разметки Markdown в обрезанном тексте
+
+    Пока ответ генерируется, в тексте могут оставаться открытые *, _,
+    ` или ```, а также недописанная ссылка [текст](url) - такой текст
+    Telegram отклоняет. Недописанная ссылка отрезается, остальные
+    маркеры закрываются в обратном порядке.
+    """
+    open_markers = []
+    link_start = None
+    i = 0
+    while i < len(text):
+        char = text[i]
+        top = open_markers[-1] if open_markers else None
+
+        if top == _CODE_BLOCK:
+            if text.startswith(_CODE_BLOCK, i):
+                open_markers.pop()
+                i += len(_CODE_BLOCK)
+                continue
+        elif top == "`":
+            if char == "`":
+                open_markers.pop()
+        elif char == "\\":
+            # Экранированный символ не является разметкой
+            i += 2
+            continue
+        elif text.startswith(_CODE_BLOCK, i):
+            open_markers.append(_CODE_BLOCK)
+            i += len(_CODE_BLOCK)
+            continue
+        elif char == "`":
+            open_markers.append("`")
+        elif char in _INLINE_MARKERS:
+            if top == char:
+                open_markers.pop()
+            elif char not in open_markers:
+                open_markers.append(char)
+        elif char == "[" and link_start is None:
+            link_start = i
+        elif char == ")" and link_start is not None:
+            link_start = None
+        elif char == "]" and link_start is not None and not text.startswith("(", i + 1):
+            # Квадратные скобки без ссылки - обычный текст
+            link_start = None
+        i += 1
+
+    if link_start is not None:
+        return balance_markdown(text[:link_start])
+
+    return text + "".join(reversed(open_markers))
+
+
+class EditRateLimiter:
+    """Ограничение частоты редактирования сообщений в одном чате"""
+
+    def __init__(self, min_interval: float, max_chats: int = 10000):
+        self.min_interval = min_interval
+        self.max_chats = max_chats
+        self._last_edit: Dict[str, float] = {}
+
+    def ready(self, chat_id: str) -> bool:
+        """Можно ли редактировать сообщение в чате прямо сейчас"""
+        return time.monotonic() - self._last_edit.get(chat_id, 0.0) >= self.min_interval
+
+    def mark(self, chat_id: str, delay: float = 0.0):
+        """Отметка о выполненном редактировании (delay - дополнительная пауза от Telegram)"""
+        if len(self._last_edit) >= self.max_chats:
+            # Старые отметки уже не ограничивают редактирование
+            threshold = time.monotonic() - self.min_interval
+            self._last_edit = {k: v for k, v in self._last_edit.items() if v > threshold}
+        self._last_edit[chat_id] = time.monotonic() + delay
+
+
+# Общий для всех потоков лимитер: несколько ответов в одном чате делят лимит Telegram
+edit_limiter = EditRateLimiter(STREAMING["edit_interval"])
+
+
+async def stream_to_message(message, chunks: AsyncIterator[str]) -> str:
+    """
+    Вывод потока фрагментов ответа в сообщение с постепенным редактированием
+
+    Промежуточные правки делаются не чаще edit_interval на чат и только
+    при заметном приросте текста. Финальную правку (полный текст,
+    клавиатура) делает вызывающий код.
+
+    Returns:
+        Полный текст ответа
+    """
+    chat_id = str(message.chat_id)
+    max_length = PAGINATION["max_message_length"]
+    parts = []
+    length = 0
+    shown_length = 0
+
+    # Генератор закрывается и при ошибке или отмене: он держит слот планировщика и соединение
+    async with aclosing(chunks):
+        async for chunk in chunks:
+            parts.append(chunk)
+            length += len(chunk)
+
+            if length < STREAMING["first_edit_chars"] or length - shown_length < STREAMING["min_chars_delta"]:
+                continue
+            if not edit_limiter.ready(chat_id):
+                continue
+
+            text = "".join(parts)
+            shown_length = length
+            preview = balance_markdown(text[:max_length]) + STREAMING["cursor"]
+            try:
+                await message.edit_text(preview, parse_mode='Markdown')
+                edit_limiter.mark(chat_id)
+            except BadRequest as e:
+                # Разметку не удалось разобрать - промежуточный вариант показываем без нее
+                edit_limiter.mark(chat_id)
+                logger.debug(f"Промежуточная правка с разметкой отклонена: {e}")
+                await _preview_edit(message, chat_id, text[:max_length] + STREAMING["cursor"])
+            except TelegramError as e:
+                _preview_failed(chat_id, e)
+
+    return "".join(parts)
+
+
+async def _preview_edit(message, chat_id: str, text: str):
+    """Промежуточная правка без разметки; ее ошибка не прерывает поток"""
+    try:
+        await message.edit_text(text)
+    except TelegramError as e:
+        _preview_failed(chat_id, e)
+
+
+def _preview_failed(chat_id: str, error: TelegramError):
+    """
+    Ошибка промежуточной правки
+
+    Промежуточные правки - только индикация прогресса: при любой ошибке
+    Telegram (лимит, таймаут, сеть) ответ продолжает собираться, а
+    следующая правка откладывается.
+    """
+    delay = float(error.retry_after) if isinstance(error, RetryAfter) else 0.0
+    edit_limiter.mark(chat_id, delay)
+    logger.debug(f"Промежуточная правка не удалась: {error}")
@@ -0,0 +1,88 @@
+"""
+Фоновый пересказ старой части переписки
+"""
+import logging
+from typing import Dict
+
+from core.ai_service import ai_service
+from core.background import PeriodicTask
+from core.config import CONVERSATION_SUMMARY
+from core.database import get_db
+from core.error_handler import AIServiceError
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationSummarizer:
+    """
+    Периодически сворачивает старые сообщения активных чатов в пересказ.
+
+    Чат попадает в очередь, когда в него записано refresh_every новых
+    сообщений. Пересказ обновляется инкрементально: в GPT уходят прежний
+    пересказ и еще не пересказанные сообщения, кроме keep_recent последних.
+    """
+
+    def __init__(self):
+        self.task = PeriodicTask("conversation_summarizer", CONVERSATION_SUMMARY["interval"], self.run)
+
+        # Счетчики для мониторинга
+        self.summarized = 0
+        self.skipped = 0
+        self.errors = 0
+
+    def start(self):
+        if CONVERSATION_SUMMARY["enabled"]:
+            self.task.start()
+
+    async def stop(self):
+        await self.task.stop()
+
+    async def run(self):
+        """Один проход по чатам, накопившим новые сообщения"""
+        db = get_db()
+        if not db.ready:
+            return
+
+        for chat_id in db.summary_due_chats(CONVERSATION_SUMMARY["max_chats_per_run"]):
+            try:
+                if await self.summarize_chat(chat_id):
+                    # Свернута только часть накопленного - продолжим в следующий проход
+                    db.requeue_summary(chat_id)
+            except AIServiceError as e:
+                self.errors += 1
+                logger.warning(f"⚠️ Пересказ чата {chat_id} не обновлен: {e.message}")
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"❌ Ошибка пересказа чата {chat_id}: {e}")
+
+    async def summarize_chat(self, chat_id: str) -> bool:
+        """
+        Обновление пересказа одного чата
+
+        Returns:
+            True, если сообщений больше, чем свернуто за один раз
+        """
+        db = get_db()
+        summary, messages = await db.get_unsummarized_messages(
+            chat_id, CONVERSATION_SUMMARY["keep_recent"], CONVERSATION_SUMMARY["batch_size"]
+        )
+        if len(messages) < CONVERSATION_SUMMARY["refresh_every"]:
+            self.skipped += 1
+            return False
+
+        new_summary = await ai_service.summarize_conversation(summary, messages)
+        await db.save_conversation_summary(chat_id, new_summary, messages[-1]["id"])
+        self.summarized += 1
+        return len(messages) == CONVERSATION_SUMMARY["batch_size"]
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики для мониторинга"""
+        return {
+            "summarized": self.summarized,
+            "skipped": self.skipped,
+            "errors": self.errors
+        }
+
+
+# Глобальный экземпляр
+summarizer = ConversationSummarizer()
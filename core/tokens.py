@@ -0,0 +1,85 @@
+"""
+Подсчет токенов для бюджета контекста GPT
+"""
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from core.config import AI_SETTINGS
+
+try:
+    import tiktoken
+except ImportError:  # Без tiktoken бюджет считается по приблизительной оценке
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Служебные токены на каждое сообщение чата (роль, разделители)
+MESSAGE_OVERHEAD = 4
+
+
+class TokenCounter:
+    """
+    Локальный подсчет токенов словарем модели.
+
+    Словарь tiktoken загружается только через warm_up (при отсутствии
+    локального кэша - скачивается), которое вызывается при старте в
+    отдельном потоке. Пока словаря нет, используется оценка по длине
+    текста; count никогда не ждет загрузки.
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        self._encoding = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        """Загрузка словаря модели (блокирующая)"""
+        with self._lock:
+            if self._loaded:
+                return
+            if tiktoken is not None:
+                try:
+                    try:
+                        self._encoding = tiktoken.encoding_for_model(self.model)
+                    except KeyError:
+                        # Модель неизвестна этой версии tiktoken - словарь семейства gpt-4o
+                        self._encoding = tiktoken.get_encoding("o200k_base")
+                except Exception as e:
+                    logger.warning(f"⚠️ Словарь токенов для {self.model} не загружен, используется оценка: {e}")
+            self._loaded = True
+
+    def count(self, text: str) -> int:
+        """Число токенов в тексте"""
+        # Словарь грузит только warm_up в фоне: загрузка здесь заблокировала бы event loop
+        if not self._loaded or self._encoding is None:
+            # Для русского текста в среднем около 3 символов на токен
+            return len(text) // 3 + 1
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    @property
+    def ready(self) -> bool:
+        """Словарь загружен: count считает точно, а не оценивает"""
+        return self._encoding is not None
+
+    def count_exact(self, message: Dict) -> Optional[int]:
+        """Число токенов сообщения для сохранения в поле tokens; None, пока словарь не загружен"""
+        if not self.ready:
+            # Оценку не запоминаем: после загрузки словаря сообщение посчитается точно
+            return None
+        return self.count(message["content"]) + MESSAGE_OVERHEAD
+
+    def count_message(self, message: Dict) -> int:
+        """Число токенов сообщения чата (посчитанное ранее берется из поля tokens)"""
+        tokens = message.get("tokens")
+        if tokens is None:
+            tokens = self.count(message["content"]) + MESSAGE_OVERHEAD
+        return tokens
+
+    def count_messages(self, messages: List[Dict]) -> int:
+        return sum(self.count_message(message) for message in messages)
+
+
+# Глобальный счетчик для модели толкований
+token_counter = TokenCounter(AI_SETTINGS["model"])
@@ -0,0 +1,194 @@
+"""
+Проверка расшифровок Whisper на галлюцинации
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+
+from core.config import WHISPER_SETTINGS
+
+# Фразы, по которым расшифровка отклоняется при любой длительности
+EXPLICIT_PHRASES = frozenset({"редактор субтитров", "подписывайтесь на канал", "ставьте лайки"})
+
+# Текст только из этих слов считается шумом
+INTERJECTIONS = frozenset({"ммм", "хмм", "эм", "ага", "угу", "ой", "ах", "ох", "эх", "ух"})
+
+
+# Разделитель слов внутри токена, полученного разбиением по пробелам ("ой-ой-ой", "блин!!!")
+_NON_WORD = re.compile(r"\W+")
+
+
+def _is_word_char(char: str) -> bool:
+    """Символ слова в смысле \\w регулярных выражений"""
+    return char.isalnum() or char == "_"
+
+
+def _word_tokens(words: Iterable[str]) -> Set[str]:
+    """
+    Слова текста в смысле \\w+ по токенам, разделенным пробелами
+
+    Большинство токенов - чистые слова и проверяются isalnum на уровне C;
+    регулярным выражением делятся только токены с пунктуацией.
+    """
+    tokens = set()
+    for token in set(words):
+        if token.isalnum():
+            tokens.add(token)
+        else:
+            tokens.update(_NON_WORD.split(token))
+    tokens.discard("")
+    return tokens
+
+
+class PhraseMatcher:
+    """
+    Поиск фраз из списка, стоящих отдельно от других слов.
+
+    Совпадение - как у (?<!\\w)фраза(?!\\w): "ой" находится в "ой-ой-ой",
+    "ой?.." и "«ой»", но не в "мой", "бит" - не в "обитатель".
+
+    - фраза из одного слова найдена, если это слово есть среди слов текста
+      (\\w+), - пересечение множеств;
+    - фразы из нескольких слов и символы (♪) проверяются поиском подстроки,
+      и то только если в тексте есть их первое слово; границу слова
+      проверяет заранее скомпилированное выражение.
+
+    Общее выражение вида (?<!\\w)(?:a|b|...)(?!\\w) в CPython проверяет
+    каждую позицию текста в интерпретаторе и медленнее (см. benchmarks).
+    """
+
+    def __init__(self, phrases: Iterable[str]):
+        self.phrases = sorted({phrase.lower() for phrase in phrases if phrase})
+        # Фразы из одного слова
+        self._words: Set[str] = set()
+        # (первое слово или None, фраза, выражение с проверкой конца слова)
+        self._long: List[Tuple[Optional[str], str, "re.Pattern"]] = []
+
+        for phrase in self.phrases:
+            if all(_is_word_char(char) for char in phrase):
+                self._words.add(phrase)
+            else:
+                first = phrase.split()[0]
+                gate = first if all(_is_word_char(char) for char in first) else None
+                # Выражение начинается с литерала - re ищет его быстрым поиском подстроки
+                self._long.append((gate, phrase, re.compile(re.escape(phrase) + r"(?!\w)")))
+
+    def find_all(self, text_lower: str, words: Sequence[str] = None) -> List[str]:
+        """
+        Найденные фразы (каждая один раз, в порядке списка)
+
+        Args:
+            text_lower: текст в нижнем регистре
+            words: text_lower.split(), если уже посчитан
+        """
+        tokens = _word_tokens(text_lower.split() if words is None else words)
+        found = tokens & self._words
+
+        for gate, phrase, pattern in self._long:
+            if gate is not None and gate not in tokens:
+                continue
+            if phrase not in text_lower:
+                continue
+            for match in pattern.finditer(text_lower):
+                start = match.start()
+                if start == 0 or not _is_word_char(text_lower[start - 1]):
+                    found.add(phrase)
+                    break
+
+        return [phrase for phrase in self.phrases if phrase in found]
+
+
+@dataclass
+class TranscriptAnalysis:
+    """Результаты всех проверок расшифровки"""
+    duration: float
+    words: List[str] = field(default_factory=list)
+    suspicious_phrases: List[str] = field(default_factory=list)
+    too_short_text: bool = False
+    only_interjections: bool = False
+    repetitive_chars: List[str] = field(default_factory=list)
+
+    @property
+    def empty_text(self) -> bool:
+        return not self.words
+
+    def verdict(self) -> Tuple[bool, str]:
+        """(подозрительна ли расшифровка, причина) - первая сработавшая проверка"""
+        if self.empty_text:
+            return True, "empty_text"
+
+        # 1. Подозрительные фразы: для коротких аудио любые, для длинных - только явные
+        for phrase in self.suspicious_phrases:
+            if self.duration < 3 or phrase in EXPLICIT_PHRASES:
+                return True, f"suspicious_phrase: {phrase}"
+
+        # 2. Слишком мало слов для длинного аудио
+        if self.too_short_text:
+            return True, f"too_short_text: {len(self.words)} words for {self.duration}s"
+
+        # 3. Только междометия
+        if self.only_interjections:
+            return True, "only_interjections"
+
+        # 4. Повторяющиеся символы
+        if self.repetitive_chars:
+            return True, f"repetitive_chars: {self.repetitive_chars[0]}"
+
+        return False, ""
+
+
+# Собирается один раз при импорте
+suspicious_phrase_matcher = PhraseMatcher(WHISPER_SETTINGS["suspicious_phrases"])
+
+
+def analyze_transcript(text: str, duration: float, matcher: PhraseMatcher = None) -> TranscriptAnalysis:
+    """Все проверки расшифровки за один проход по тексту"""
+    analysis = TranscriptAnalysis(duration)
+    if not text:
+        return analysis
+
+    text_lower = text.lower()
+    words = text_lower.split()
+    analysis.words = words
+    analysis.suspicious_phrases = (matcher or suspicious_phrase_matcher).find_all(text_lower, words)
+    analysis.too_short_text = duration > 6 and len(words) < duration / 3
+    analysis.only_interjections = len(words) <= 2 and all(word in INTERJECTIONS for word in words) and duration > 3
+    analysis.repetitive_chars = [word for word in words if len(word) > 5 and len(set(word)) == 1]
+    return analysis
+
+
+def segment_rejection(segment) -> str:
+    """
+    Причина отбросить сегмент verbose-расшифровки Whisper или пустая строка
+
+    Пороги - из WHISPER_SETTINGS; сегмент с явной фразой-галлюцинацией
+    ("редактор субтитров") тоже отбрасывается сам, без всего сообщения.
+    """
+    if (segment.no_speech_prob > WHISPER_SETTINGS["max_no_speech_prob"]
+            and segment.avg_logprob < WHISPER_SETTINGS["no_speech_max_logprob"]):
+        return "no_speech"
+    if segment.avg_logprob < WHISPER_SETTINGS["min_avg_logprob"]:
+        return "low_logprob"
+    if segment.compression_ratio > WHISPER_SETTINGS["max_compression_ratio"]:
+        return "repetitive"
+    if any(phrase in EXPLICIT_PHRASES for phrase in suspicious_phrase_matcher.find_all(segment.text.lower())):
+        return "suspicious_phrase"
+    return ""
+
+
+def filter_segments(segments: Sequence) -> Tuple[str, List[Tuple[str, str]]]:
+    """
+    Текст из сегментов, прошедших проверку
+
+    Returns:
+        (текст, [(причина, текст отброшенного сегмента), ...])
+    """
+    kept = []
+    dropped = []
+    for segment in segments:
+        reason = segment_rejection(segment)
+        if reason:
+            dropped.append((reason, segment.text.strip()))
+        else:
+            kept.append(segment.text.strip())
+    return " ".join(text for text in kept if text), dropped
@@ -0,0 +1,83 @@
+"""
+Отсев голосовых сообщений до скачивания и транскрипции
+"""
+import asyncio
+from collections import Counter
+from typing import Dict, Optional
+
+from core.config import VOICE_GATE, WHISPER_SETTINGS
+from core.ogg_opus import parse_opus
+
+# Ответ пользователю по причине отказа
+REJECTION_MESSAGES = {
+    "too_short": "🤔 Сообщение слишком короткое. Расскажи свой сон подробнее или напиши текстом.",
+    "too_large": "❌ Голосовое сообщение слишком длинное. Попробуйте записать покороче или написать текстом.",
+    "silence": "🤔 Не удалось расслышать речь. Попробуйте записать сообщение четче или написать текстом."
+}
+
+
+class VoiceGate:
+    """
+    Дешевые проверки голосового сообщения перед платной транскрипцией.
+
+    check_metadata смотрит на длительность и размер из Telegram и
+    вызывается до скачивания файла; check_audio оценивает долю речи по
+    пакетам Opus и вызывается после скачивания, до запроса к Whisper.
+    """
+
+    def __init__(self):
+        # Счетчики для мониторинга
+        self.passed = 0
+        self.unparsed = 0
+        self.rejected: Counter = Counter()
+
+    def check_metadata(self, duration: Optional[float], file_size: Optional[int]) -> Optional[str]:
+        """Причина отказа по данным Telegram или None"""
+        if not VOICE_GATE["enabled"]:
+            return None
+        if duration is not None and duration < WHISPER_SETTINGS["min_duration"]:
+            return self._reject("too_short")
+        if file_size and file_size > WHISPER_SETTINGS["max_upload_bytes"]:
+            return self._reject("too_large")
+        return None
+
+    async def check_audio(self, data) -> Optional[str]:
+        """Причина отказа по содержимому файла или None (неизвестный формат пропускается)"""
+        if not VOICE_GATE["enabled"]:
+            self.passed += 1
+            return None
+        if len(data) > WHISPER_SETTINGS["max_upload_bytes"]:
+            return self._reject("too_large")
+
+        # Разбор на чистом Python (до 20 МБ) - в отдельном потоке, чтобы не останавливать другие чаты
+        stream = await asyncio.to_thread(parse_opus, data)
+        if stream is None or not stream.packets:
+            self.unparsed += 1
+            self.passed += 1
+            return None
+
+        speech = sum(
+            packet.duration for packet in stream.packets
+            if packet.bitrate >= VOICE_GATE["speech_bitrate"]
+        )
+        if speech < VOICE_GATE["min_speech_seconds"] or speech < stream.duration * VOICE_GATE["min_speech_ratio"]:
+            return self._reject("silence")
+
+        self.passed += 1
+        return None
+
+    def _reject(self, reason: str) -> str:
+        self.rejected[reason] += 1
+        return reason
+
+    def stats(self) -> Dict:
+        """Счетчики для мониторинга"""
+        return {
+            "passed": self.passed,
+            "unparsed": self.unparsed,
+            "rejected": dict(self.rejected)
+        }
+
+
+# Глобальный экземпляр
+voice_gate = VoiceGate()
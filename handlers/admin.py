@@ -4,7 +4,7 @@
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes
 from telegram.error import Forbidden, BadRequest, NetworkError
-from core.database import db
+from core.database import get_db
 from core.models import AdminBroadcastState, BroadcastResult
 from core.config import ADMIN_CHAT_IDS
 
@@ -41,7 +41,7 @@ async def admin_panel_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     print(f"✅ Доступ разрешен для chat_id: {chat_id}")
     
     # Получаем статистику
-    all_users = db.get_all_users()
+    all_users = await get_db().get_all_users()
     total_users = len(all_users)
     
     keyboard = [
@@ -133,7 +133,7 @@ async def handle_admin_broadcast_confirmation(update: Update, context: ContextTy
     state = admin_broadcast_states[chat_id]
     
     # Получаем количество пользователей
-    all_users = db.get_all_users()
+    all_users = await get_db().get_all_users()
     user_count = len(all_users)
     
     # Формируем превью сообщения
@@ -174,7 +174,7 @@ async def handle_broadcast_confirm_yes(update: Update, context: ContextTypes.DEF
     state = admin_broadcast_states[chat_id]
     
     # Получаем всех пользователей
-    all_users = db.get_all_users()
+    all_users = await get_db().get_all_users()
     
     await query.edit_message_text(
         f"📢 *Рассылка запущена*\n\n"
@@ -318,7 +318,7 @@ async def show_admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     
     # Получаем детальную статистику
-    stats = db.get_user_stats_summary()
+    stats = await get_db().get_user_stats_summary()
     
     await query.edit_message_text(
         f"📊 *Статистика бота*\n\n"
@@ -339,7 +339,7 @@ async def show_admin_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     
     # Получаем детальную статистику по пользователям
-    user_details = db.get_user_stats_details(limit=10)
+    user_details = await get_db().get_user_stats_details(limit=10)
     
     if not user_details:
         await query.edit_message_text(
@@ -371,7 +371,7 @@ async def show_admin_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"   💾 {dreams or 0} снов, активность: {activity_str}\n\n"
         )
     
-    total_users = len(db.get_all_users())
+    total_users = len(await get_db().get_all_users())
     users_text += f"📊 Всего пользователей: {total_users}"
     
     await query.edit_message_text(
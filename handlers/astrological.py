@@ -5,10 +5,15 @@ import logging
 from datetime import datetime, timezone, timedelta
 from telegram import InlineKeyboardMarkup, InlineKeyboardButton
 
+from core.error_handler import AIServiceError
 from core.utils import cleanup_astrological_interface, cleanup_astrological_interface_by_ids, remove_message_buttons_by_id, log_error_and_notify
 
 logger = logging.getLogger(__name__)
 
+# Короткий префикс кнопок выбора даты: callback_data целиком пишется в action лога (VARCHAR(50))
+DATE_CALLBACK_PREFIX = "astro_d:"
+DATE_TYPES = {"t": "today", "y": "yesterday", "c": "custom"}
+
 
 async def handle_astrological_callback(update, context, callback_data):
     """Обработчик кнопки 'Астрологическое толкование'"""
@@ -17,15 +22,20 @@ async def handle_astrological_callback(update, context, callback_data):
     user = update.effective_user
     
     try:
+        # callback_data: astrological:<source_type>[:<ID сообщения с толкованием>]
+        parts = callback_data.split(":")
+        source_type = parts[1]
+        # Без ID в callback кнопка находится на самом сообщении с толкованием
+        interpretation_msg_id = int(parts[2]) if len(parts) > 2 else query.message.message_id
+        
         # Получаем данные сна из временного хранилища в БД
-        from core.database import db
-        pending_dream = db.get_pending_dream(chat_id)
+        from core.database import get_db
+        db = get_db()
+        pending_dream = await db.get_pending_dream(chat_id, interpretation_msg_id)
         if not pending_dream:
             await query.answer("❌ Данные сна не найдены. Попробуйте еще раз.")
             return
         
-        # Извлекаем source_type из callback_data
-        source_type = callback_data.split(":")[1]
         logger.info(f"🔍 DEBUG: handle_astrological_callback - callback_data = {callback_data}, source_type = {source_type}")
         
         # Показываем уточнение даты
@@ -35,21 +45,21 @@ async def handle_astrological_callback(update, context, callback_data):
         date_msg = await query.message.reply_text(
             "Когда тебе приснился этот сон?",
             reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("Сегодня", callback_data=f"astrological_date:today:{source_type}")],
-                [InlineKeyboardButton("Вчера", callback_data=f"astrological_date:yesterday:{source_type}")],
-                [InlineKeyboardButton("Ввести дату", callback_data=f"astrological_date:custom:{source_type}")]
+                [InlineKeyboardButton("Сегодня", callback_data=f"{DATE_CALLBACK_PREFIX}t:{source_type}:{interpretation_msg_id}")],
+                [InlineKeyboardButton("Вчера", callback_data=f"{DATE_CALLBACK_PREFIX}y:{source_type}:{interpretation_msg_id}")],
+                [InlineKeyboardButton("Ввести дату", callback_data=f"{DATE_CALLBACK_PREFIX}c:{source_type}:{interpretation_msg_id}")]
             ])
         )
         
         # Сохраняем ID сообщений для последующего удаления
         context.user_data['date_selection_msg_id'] = date_msg.message_id
-        # Используем ID сообщения с толкованием из предыдущего шага
-        original_message_id = context.user_data.get('dream_interpretation_msg_id', query.message.message_id)
-        context.user_data['original_message_id'] = original_message_id
+        # ID сообщения с толкованием, к которому относится выбор даты
+        context.user_data['original_message_id'] = interpretation_msg_id
         
     except Exception as e:
         await query.answer("❌ Произошла ошибка при выборе даты.")
-        from core.database import db
+        from core.database import get_db
+        db = get_db()
         log_error_and_notify(db, user, chat_id, "astrological_date_error", str(e))
 
 
@@ -60,14 +70,17 @@ async def handle_astrological_date_callback(update, context, callback_data):
     user = update.effective_user
     
     try:
-        # Парсим callback_data: astrological_date:date_type:source_type
+        # Парсим callback_data: astro_d:t|y|c:source_type:ID сообщения с толкованием
+        # (в старых сообщениях - astrological_date:today|yesterday|custom:source_type[:ID])
         parts = callback_data.split(":")
-        date_type = parts[1]
+        date_type = DATE_TYPES.get(parts[1], parts[1])
         source_type = parts[2]
+        interpretation_msg_id = int(parts[3]) if len(parts) > 3 else context.user_data.get('original_message_id')
         
         # Получаем данные сна из временного хранилища в БД
-        from core.database import db
-        pending_dream = db.get_pending_dream(chat_id)
+        from core.database import get_db
+        db = get_db()
+        pending_dream = await db.get_pending_dream(chat_id, interpretation_msg_id)
         if not pending_dream:
             await query.answer("❌ Данные сна не найдены. Попробуйте еще раз.")
             return
@@ -109,7 +122,8 @@ async def handle_astrological_date_callback(update, context, callback_data):
         
     except Exception as e:
         await query.answer("❌ Произошла ошибка при выборе даты.")
-        from core.database import db
+        from core.database import get_db
+        db = get_db()
         log_error_and_notify(db, user, chat_id, "astrological_date_error", str(e))
 
 
@@ -118,6 +132,7 @@ async def perform_astrological_analysis(update, context, pending_dream, source_t
     query = update.callback_query
     chat_id = str(query.message.chat_id)
     user = update.effective_user
+    interpretation_msg_id = pending_dream['message_id'] or context.user_data.get('original_message_id')
     
     try:
         # Показываем "размышляет"
@@ -136,9 +151,10 @@ async def perform_astrological_analysis(update, context, pending_dream, source_t
         )
         
         # Логируем астрологическое толкование
-        from core.database import db
+        from core.database import get_db
+        db = get_db()
         db.log_activity(user, chat_id, "astrological_interpretation", f"date:{date_str}, reply:{astrological_reply[:300]}")
-        db.save_message(chat_id, "assistant", astrological_reply)
+        await db.save_message(chat_id, "assistant", astrological_reply)
         
         # Определяем тип ответа для создания соответствующей клавиатуры
         message_type = ai_service.extract_message_type(astrological_reply)
@@ -146,16 +162,16 @@ async def perform_astrological_analysis(update, context, pending_dream, source_t
         if message_type == 'dream':
             # Для астрологических толкований добавляем кнопку "Сохранить в дневник"
             keyboard = InlineKeyboardMarkup([
-                [InlineKeyboardButton("📖 Сохранить в дневник снов", callback_data=f"save_dream:{source_type}")]
+                [InlineKeyboardButton("📖 Сохранить в дневник снов", callback_data=f"save_dream:{source_type}:{interpretation_msg_id}")]
             ])
             
             # Обновляем временные данные для астрологического толкования
             # Сохраняем ОБА толкования: обычное и астрологическое
-            db.update_pending_dream_astrological(chat_id, astrological_reply)
+            await db.update_pending_dream_astrological(chat_id, pending_dream['message_id'], astrological_reply)
             logger.info(f"🔍 DEBUG: perform_astrological_analysis - обновлен pending_dream в БД")
             
             # Убираем кнопки из обычного толкования и удаляем сообщение с выбором даты
-            original_message_id = context.user_data.get('original_message_id')
+            original_message_id = interpretation_msg_id
             date_message_id = context.user_data.get('date_selection_msg_id')
             
             if original_message_id or date_message_id:
@@ -178,9 +194,14 @@ async def perform_astrological_analysis(update, context, pending_dream, source_t
         else:
             await thinking_msg.edit_text(astrological_reply, parse_mode='Markdown')
         
+    except AIServiceError as e:
+        from core.database import get_db
+        get_db().log_activity(user, chat_id, "astrological_error", f"{type(e).__name__}: {e.message}")
+        await thinking_msg.edit_text(e.user_message)
     except Exception as e:
         await query.answer("❌ Произошла ошибка при астрологическом анализе.")
-        from core.database import db
+        from core.database import get_db
+        db = get_db()
         log_error_and_notify(db, user, chat_id, "astrological_error", str(e))
         await thinking_msg.edit_text(f"❌ Ошибка при астрологическом анализе: {e}")
 
@@ -189,6 +210,7 @@ async def perform_astrological_analysis_from_date_input(update, context, pending
     """Выполнение астрологического анализа с введенной датой"""
     chat_id = str(update.effective_chat.id)
     user = update.effective_user
+    interpretation_msg_id = pending_dream['message_id'] or context.user_data.get('original_message_id')
     
     try:
         # Показываем "размышляет"
@@ -205,9 +227,10 @@ async def perform_astrological_analysis_from_date_input(update, context, pending
         )
         
         # Логируем астрологическое толкование
-        from core.database import db
+        from core.database import get_db
+        db = get_db()
         db.log_activity(user, chat_id, "astrological_interpretation", f"date:{date_str}, reply:{astrological_reply[:300]}")
-        db.save_message(chat_id, "assistant", astrological_reply)
+        await db.save_message(chat_id, "assistant", astrological_reply)
         
         # Определяем тип ответа для создания соответствующей клавиатуры
         message_type = ai_service.extract_message_type(astrological_reply)
@@ -215,15 +238,15 @@ async def perform_astrological_analysis_from_date_input(update, context, pending
         if message_type == 'dream':
             # Для астрологических толкований добавляем кнопку "Сохранить в дневник"
             keyboard = InlineKeyboardMarkup([
-                [InlineKeyboardButton("📖 Сохранить в дневник снов", callback_data=f"save_dream:{source_type}")]
+                [InlineKeyboardButton("📖 Сохранить в дневник снов", callback_data=f"save_dream:{source_type}:{interpretation_msg_id}")]
             ])
             
             # Обновляем временные данные для астрологического толкования
             # Сохраняем ОБА толкования: обычное и астрологическое
-            db.update_pending_dream_astrological(chat_id, astrological_reply)
+            await db.update_pending_dream_astrological(chat_id, pending_dream['message_id'], astrological_reply)
             
             # Убираем кнопки из исходного сообщения с толкованием и удаляем сообщение с выбором даты
-            original_message_id = context.user_data.get('original_message_id')
+            original_message_id = interpretation_msg_id
             date_message_id = context.user_data.get('date_selection_msg_id')
             
             if original_message_id or date_message_id:
@@ -246,9 +269,14 @@ async def perform_astrological_analysis_from_date_input(update, context, pending
         else:
             await thinking_msg.edit_text(astrological_reply, parse_mode='Markdown')
         
+    except AIServiceError as e:
+        from core.database import get_db
+        get_db().log_activity(user, chat_id, "astrological_error", f"{type(e).__name__}: {e.message}")
+        await thinking_msg.edit_text(e.user_message)
     except Exception as e:
         await thinking_msg.edit_text(f"❌ Ошибка при астрологическом анализе: {e}")
-        from core.database import db
+        from core.database import get_db
+        db = get_db()
         log_error_and_notify(db, user, chat_id, "astrological_error", str(e))
 
 
@@ -271,7 +299,8 @@ async def handle_cancel_date_input(update, context):
         
     except Exception as e:
         await query.answer("❌ Ошибка при отмене ввода даты")
-        from core.database import db
+        from core.database import get_db
+        db = get_db()
         log_error_and_notify(db, user, chat_id, "cancel_date_error", str(e))
 
 
@@ -356,5 +385,6 @@ async def handle_date_input(update, context):
         
     except Exception as e:
         await update.message.reply_text("❌ Произошла ошибка при обработке даты.")
-        from core.database import db
+        from core.database import get_db
+        db = get_db()
         log_error_and_notify(db, user, chat_id, "date_input_error", str(e))
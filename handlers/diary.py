@@ -4,52 +4,56 @@
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes
 from telegram.error import BadRequest
-from core.database import db
+from core.database import get_db
 from core.models import PaginationHelper, MessageFormatter
 from core.config import PAGINATION
 
 
-async def show_dream_diary(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 0):
-    """Показать дневник снов пользователя"""
-    from core.config import IMAGE_PATHS
-    
-    chat_id = str(update.effective_chat.id)
-    user = update.effective_user
-    
+async def build_diary_page(chat_id: str, page: int = 0, direction: str = None, cursor=None):
+    """
+    Формирование подписи и клавиатуры страницы дневника (keyset-пагинация)
+    
+    Args:
+        chat_id: ID чата
+        page: Номер страницы (для отображения)
+        direction: "next"/"prev" относительно курсора или None для первой страницы
+        cursor: (created_at, id) граничного сна соседней страницы
+    
+    Returns:
+        tuple: (caption, keyboard)
+    """
     # Получаем общее количество снов
-    total_dreams = db.count_user_dreams(chat_id)
+    total_dreams = await get_db().count_user_dreams(chat_id)
     
     if total_dreams == 0:
-        keyboard = [[InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]]
-        
         caption = (
             "Здесь хранятся все твои сны и их толкования. Ты можешь сохранять свои сны сюда вместе с моей интерпретацией.\n\n"
             "У тебя пока нет записанных снов. Расскажи мне свой сон, и он появится здесь!"
         )
-        
-        try:
-            with open(IMAGE_PATHS["diary"], "rb") as photo:
-                await update.message.reply_photo(
-                    photo=photo,
-                    caption=caption,
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode='Markdown'
-                )
-        except FileNotFoundError:
-            await update.message.reply_text(
-                caption,
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode='Markdown'
-            )
-        return
+        return caption, [[InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]]
+    
+    # Получаем превью снов для текущей страницы
+    dreams, has_more = await get_db().get_user_dream_previews(
+        chat_id, PAGINATION["dreams_per_page"], cursor, direction or "next"
+    )
     
-    # Вычисляем пагинацию
+    if not dreams and cursor:
+        # Страница опустела (например, сны удалены) - показываем первую
+        page, direction, cursor = 0, None, None
+        dreams, has_more = await get_db().get_user_dream_previews(chat_id, PAGINATION["dreams_per_page"])
+    
+    # Номер страницы нужен только для подписи
     pagination = PaginationHelper.calculate_pagination(
         total_dreams, page, PAGINATION["dreams_per_page"]
     )
+    current_page = pagination["current_page"]
     
-    # Получаем сны для текущей страницы
-    dreams = db.get_user_dreams(chat_id, pagination["items_per_page"], pagination["offset"])
+    if direction == "prev":
+        has_prev, has_next = has_more, True
+    elif direction == "next":
+        has_prev, has_next = True, has_more
+    else:
+        has_prev, has_next = False, has_more
     
     # Формируем caption с описанием
     caption = (
@@ -57,13 +61,11 @@ async def show_dream_diary(update: Update, context: ContextTypes.DEFAULT_TYPE, p
     )
     
     if pagination["total_pages"] > 1:
-        caption += f"\n\nСтр. {pagination['current_page'] + 1} из {pagination['total_pages']}"
+        caption += f"\n\nСтр. {current_page + 1} из {pagination['total_pages']}"
     
     keyboard = []
     
-    for i, dream in enumerate(dreams):
-        dream_id, dream_text, interpretation, astrological_interpretation, source_type, created_at, dream_date = dream
-        
+    for dream_id, created_at, source_type, dream_text in dreams:
         # Краткое описание для кнопки
         dream_preview = MessageFormatter.format_dream_preview(dream_text, 35)
         source_icon = MessageFormatter.get_source_icon(source_type)
@@ -76,18 +78,35 @@ async def show_dream_diary(update: Update, context: ContextTypes.DEFAULT_TYPE, p
             callback_data=f"dream_view:{dream_id}"
         )])
     
-    # Кнопки навигации
+    # Кнопки навигации: курсор - граничный сон текущей страницы
     nav_buttons = []
-    if pagination["has_prev"]:
-        nav_buttons.append(InlineKeyboardButton("◀️ Назад", callback_data=f"diary_page:{pagination['current_page']-1}"))
-    if pagination["has_next"]:
-        nav_buttons.append(InlineKeyboardButton("Вперед ▶️", callback_data=f"diary_page:{pagination['current_page']+1}"))
+    if has_prev:
+        if current_page <= 1:
+            prev_callback = "diary_page:0"
+        else:
+            first_cursor = PaginationHelper.encode_cursor(dreams[0][1], dreams[0][0])
+            prev_callback = f"diary_page:{current_page - 1}:prev:{first_cursor}"
+        nav_buttons.append(InlineKeyboardButton("◀️ Назад", callback_data=prev_callback))
+    if has_next:
+        last_cursor = PaginationHelper.encode_cursor(dreams[-1][1], dreams[-1][0])
+        nav_buttons.append(InlineKeyboardButton("Вперед ▶️", callback_data=f"diary_page:{current_page + 1}:next:{last_cursor}"))
     
     if nav_buttons:
         keyboard.append(nav_buttons)
     
     keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")])
     
+    return caption, keyboard
+
+
+async def show_dream_diary(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показать дневник снов пользователя"""
+    from core.config import IMAGE_PATHS
+    
+    chat_id = str(update.effective_chat.id)
+    
+    caption, keyboard = await build_diary_page(chat_id)
+    
     try:
         with open(IMAGE_PATHS["diary"], "rb") as photo:
             await update.message.reply_photo(
@@ -104,92 +123,15 @@ async def show_dream_diary(update: Update, context: ContextTypes.DEFAULT_TYPE, p
         )
 
 
-async def show_dream_diary_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 0):
+async def show_dream_diary_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 0,
+                                    direction: str = None, cursor=None):
     """Показать дневник снов через callback (с редактированием)"""
     from core.config import IMAGE_PATHS
     
     query = update.callback_query
     chat_id = str(update.effective_chat.id)
     
-    # Получаем общее количество снов
-    total_dreams = db.count_user_dreams(chat_id)
-    
-    if total_dreams == 0:
-        keyboard = [[InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]]
-        
-        caption = (
-            "Здесь хранятся все твои сны и их толкования. Ты можешь сохранять свои сны сюда вместе с моей интерпретацией.\n\n"
-            "У тебя пока нет записанных снов. Расскажи мне свой сон, и он появится здесь!"
-        )
-        
-        # Удаляем старое сообщение и отправляем новое с фото
-        try:
-            await query.delete_message()
-        except Exception:
-            pass
-        
-        try:
-            with open(IMAGE_PATHS["diary"], "rb") as photo:
-                await context.bot.send_photo(
-                    chat_id=chat_id,
-                    photo=photo,
-                    caption=caption,
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode='Markdown'
-                )
-        except FileNotFoundError:
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=caption,
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode='Markdown'
-            )
-        return
-    
-    # Вычисляем пагинацию
-    pagination = PaginationHelper.calculate_pagination(
-        total_dreams, page, PAGINATION["dreams_per_page"]
-    )
-    
-    # Получаем сны для текущей страницы
-    dreams = db.get_user_dreams(chat_id, pagination["items_per_page"], pagination["offset"])
-    
-    # Формируем caption с описанием
-    caption = (
-        "Здесь хранятся все твои сны и их толкования. Нажми на любой сон, чтобы прочитать его полностью."
-    )
-    
-    if pagination["total_pages"] > 1:
-        caption += f"\n\nСтр. {pagination['current_page'] + 1} из {pagination['total_pages']}"
-    
-    keyboard = []
-    
-    for i, dream in enumerate(dreams):
-        dream_id, dream_text, interpretation, astrological_interpretation, source_type, created_at, dream_date = dream
-        
-        # Краткое описание для кнопки
-        dream_preview = MessageFormatter.format_dream_preview(dream_text, 35)
-        source_icon = MessageFormatter.get_source_icon(source_type)
-        date_str = MessageFormatter.format_date(created_at)
-        
-        button_text = f"{source_icon} {date_str} • {dream_preview}"
-        
-        keyboard.append([InlineKeyboardButton(
-            button_text, 
-            callback_data=f"dream_view:{dream_id}"
-        )])
-    
-    # Кнопки навигации
-    nav_buttons = []
-    if pagination["has_prev"]:
-        nav_buttons.append(InlineKeyboardButton("◀️ Назад", callback_data=f"diary_page:{pagination['current_page']-1}"))
-    if pagination["has_next"]:
-        nav_buttons.append(InlineKeyboardButton("Вперед ▶️", callback_data=f"diary_page:{pagination['current_page']+1}"))
-    
-    if nav_buttons:
-        keyboard.append(nav_buttons)
-    
-    keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")])
+    caption, keyboard = await build_diary_page(chat_id, page, direction, cursor)
     
     # Удаляем старое сообщение и отправляем новое с фото
     try:
@@ -221,7 +163,7 @@ async def show_dream_detail(update: Update, context: ContextTypes.DEFAULT_TYPE,
     chat_id = str(update.effective_chat.id)
     
     # Получаем сон из БД
-    dream = db.get_dream_by_id(chat_id, dream_id)
+    dream = await get_db().get_dream_by_id(chat_id, dream_id)
     
     if not dream:
         await query.answer("❌ Сон не найден")
@@ -285,7 +227,7 @@ async def delete_dream_confirm(update: Update, context: ContextTypes.DEFAULT_TYP
     chat_id = str(update.effective_chat.id)
     
     # Получаем сон для отображения превью
-    dream = db.get_dream_by_id(chat_id, dream_id)
+    dream = await get_db().get_dream_by_id(chat_id, dream_id)
     
     if not dream:
         await query.answer("❌ Сон не найден")
@@ -323,10 +265,10 @@ async def delete_dream_execute(update: Update, context: ContextTypes.DEFAULT_TYP
     user = update.effective_user
     
     # Удаляем сон
-    success = db.delete_dream(chat_id, dream_id)
+    success = await get_db().delete_dream(chat_id, dream_id)
     
     if success:
-        db.log_activity(user, chat_id, "dream_deleted", f"dream_id:{dream_id}")
+        get_db().log_activity(user, chat_id, "dream_deleted", f"dream_id:{dream_id}")
         await query.answer("✅ Сон удален")
         # Возвращаемся к дневнику
         await show_dream_diary_callback(update, context, 0)
@@ -338,8 +280,15 @@ async def handle_diary_callbacks(update: Update, context: ContextTypes.DEFAULT_T
     """Обработка всех callback'ов дневника снов"""
     
     if callback_data.startswith("diary_page:"):
-        page = int(callback_data.split(":")[1])
-        await show_dream_diary_callback(update, context, page)
+        # diary_page:<page> - первая страница; diary_page:<page>:<next|prev>:<микросекунды>:<id> - по курсору
+        parts = callback_data.split(":")
+        page = int(parts[1])
+        if len(parts) == 5:
+            cursor = PaginationHelper.decode_cursor(parts[3], parts[4])
+            await show_dream_diary_callback(update, context, page, parts[2], cursor)
+        else:
+            # Старые кнопки с номером страницы без курсора ведут на первую страницу
+            await show_dream_diary_callback(update, context, 0)
     
     elif callback_data.startswith("dream_view:"):
         dream_id = int(callback_data.split(":")[1])
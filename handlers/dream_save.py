@@ -4,7 +4,7 @@
 import logging
 from telegram import InlineKeyboardMarkup, InlineKeyboardButton
 from core.utils import cleanup_astrological_interface, cleanup_astrological_interface_by_ids, remove_message_buttons_by_id
-from core.error_handler import handle_errors, validate_pending_dream, safe_callback_data_split, DatabaseError
+from core.error_handler import handle_errors, validate_pending_dream, safe_callback_data_split, safe_int_conversion, DatabaseError
 
 logger = logging.getLogger(__name__)
 
@@ -17,14 +17,17 @@ async def handle_save_dream_callback(update, context, callback_data):
     user = update.effective_user
     
     # Получаем данные сна из временного хранилища в БД
-    from core.database import db
+    from core.database import get_db
+    db = get_db()
     
-    # Валидируем входные данные
+    # Валидируем входные данные: save_dream:<source_type>[:<ID сообщения с толкованием>]
     parts = safe_callback_data_split(callback_data, 2)
     source_type = parts[1]
+    # Без ID в callback кнопка находится на самом сообщении с толкованием
+    interpretation_msg_id = safe_int_conversion(parts[2]) if len(parts) > 2 else query.message.message_id
     
     # Валидируем существование pending_dream
-    pending_dream = await validate_pending_dream(db, chat_id)
+    pending_dream = await validate_pending_dream(db, chat_id, interpretation_msg_id)
     logger.info(f"🔍 DEBUG: pending_dream из БД = {pending_dream}")
     
     # Проверяем, есть ли астрологическое толкование
@@ -51,12 +54,15 @@ async def handle_save_dream_callback(update, context, callback_data):
     await query.answer(save_message)
     
     # Убираем кнопки - логика зависит от наличия астрологического толкования
-    await cleanup_interface_after_save(context, chat_id, query.message.text, query.message.message_id, has_astrological)
+    await cleanup_interface_after_save(
+        context, chat_id, query.message.text, query.message.message_id, has_astrological,
+        pending_dream['message_id'], source_type
+    )
     
     # Очищаем временные данные только если есть астрологическое толкование
     # Если нет - оставляем pending_dream для возможного создания астрологического толкования
     if has_astrological:
-        db.delete_pending_dream(chat_id)
+        await db.delete_pending_dream(chat_id, pending_dream['message_id'])
         logger.info(f"🔍 DEBUG: Удален pending_dream после сохранения с астрологическим толкованием")
 
 
@@ -77,7 +83,7 @@ async def save_dream_to_diary(db, chat_id, pending_dream, source_type, has_astro
     try:
         if has_astrological:
             # Сохраняем ОДИН сон с ОБОИМИ толкованиями
-            return db.save_dream(
+            return await db.save_dream(
                 chat_id=chat_id,
                 dream_text=pending_dream['dream_text'],
                 interpretation=pending_dream['interpretation'],  # Обычное толкование
@@ -86,7 +92,7 @@ async def save_dream_to_diary(db, chat_id, pending_dream, source_type, has_astro
             )
         else:
             # Сохраняем сон только с обычным толкованием
-            return db.save_dream(
+            return await db.save_dream(
                 chat_id=chat_id,
                 dream_text=pending_dream['dream_text'],
                 interpretation=pending_dream['interpretation'],
@@ -113,7 +119,8 @@ def _get_save_confirmation_message(has_astrological):
         return "✅ Сон сохранен в дневник!"
 
 
-async def cleanup_interface_after_save(context, chat_id, current_message_text, current_message_id, has_astrological):
+async def cleanup_interface_after_save(context, chat_id, current_message_text, current_message_id, has_astrological,
+                                       interpretation_msg_id=None, source_type='text'):
     """
     Очищает интерфейс после сохранения сна
     
@@ -123,6 +130,8 @@ async def cleanup_interface_after_save(context, chat_id, current_message_text, c
         current_message_text: Текст текущего сообщения
         current_message_id: ID текущего сообщения
         has_astrological: Есть ли астрологическое толкование
+        interpretation_msg_id: ID сообщения с обычным толкованием
+        source_type: Тип источника сна
     """
     try:
         if has_astrological:
@@ -132,8 +141,8 @@ async def cleanup_interface_after_save(context, chat_id, current_message_text, c
             # Убираем кнопки из текущего сообщения (астрологическое толкование)
             await remove_message_buttons_by_id(context, chat_id, current_message_id)
             
-            # Получаем ID других сообщений из context для очистки
-            dream_interpretation_msg_id = context.user_data.get('dream_interpretation_msg_id')
+            # ID сообщения с толкованием берем из сохраненного сна, выбор даты - из context
+            dream_interpretation_msg_id = interpretation_msg_id or context.user_data.get('dream_interpretation_msg_id')
             date_message_id = context.user_data.get('date_selection_msg_id')
             
             if dream_interpretation_msg_id or date_message_id:
@@ -153,29 +162,23 @@ async def cleanup_interface_after_save(context, chat_id, current_message_text, c
             logger.info(f"🔍 DEBUG: Нет астрологического толкования - убираем только кнопку сохранения")
             
             # Заменяем кнопки в исходном сообщении, оставляя только кнопку "Астрологическое толкование"
-            dream_interpretation_msg_id = context.user_data.get('dream_interpretation_msg_id')
+            dream_interpretation_msg_id = interpretation_msg_id or context.user_data.get('dream_interpretation_msg_id')
             
             if dream_interpretation_msg_id:
                 # Создаем новую клавиатуру только с кнопкой астрологического толкования
-                from core.database import db
+                new_keyboard = InlineKeyboardMarkup([
+                    [InlineKeyboardButton("🔮 Астрологическое толкование", callback_data=f"astrological:{source_type}")]
+                ])
                 
-                # Получаем source_type из pending_dream для создания правильного callback_data
-                pending_dream = db.get_pending_dream(chat_id)
-                if pending_dream:
-                    source_type = pending_dream.get('source_type', 'text')
-                    new_keyboard = InlineKeyboardMarkup([
-                        [InlineKeyboardButton("🔮 Астрологическое толкование", callback_data=f"astrological:{source_type}")]
-                    ])
-                    
-                    try:
-                        await context.bot.edit_message_reply_markup(
-                            chat_id=chat_id,
-                            message_id=dream_interpretation_msg_id,
-                            reply_markup=new_keyboard
-                        )
-                        logger.info(f"🔍 DEBUG: Заменили кнопки в сообщении {dream_interpretation_msg_id}")
-                    except Exception as e:
-                        logger.warning(f"🔍 DEBUG: Не удалось заменить кнопки в исходном сообщении: {e}")
+                try:
+                    await context.bot.edit_message_reply_markup(
+                        chat_id=chat_id,
+                        message_id=dream_interpretation_msg_id,
+                        reply_markup=new_keyboard
+                    )
+                    logger.info(f"🔍 DEBUG: Заменили кнопки в сообщении {dream_interpretation_msg_id}")
+                except Exception as e:
+                    logger.warning(f"🔍 DEBUG: Не удалось заменить кнопки в исходном сообщении: {e}")
             
             # НЕ очищаем dream_interpretation_msg_id, так как кнопка астрологического толкования остается активной
         
@@ -3,7 +3,7 @@
 """
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes
-from core.database import db
+from core.database import get_db
 from core.config import IMAGE_PATHS
 
 
@@ -55,8 +55,8 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
 
     # Логируем событие и увеличиваем счётчик стартов
-    db.log_activity(user, str(chat_id), "start")
-    db.increment_start_count(user, str(chat_id))
+    get_db().log_activity(user, str(chat_id), "start")
+    get_db().increment_start_count(user, str(chat_id))
 
     # Отправляем полное стартовое меню
     await send_start_menu(chat_id, context, user)
@@ -144,7 +144,7 @@ async def handle_profile_callbacks(update: Update, context: ContextTypes.DEFAULT
         context.user_data['profile_step'] = None
 
         # Сохраняем профиль в БД
-        db.save_user_profile(
+        await get_db().save_user_profile(
             chat_id=chat_id,
             username=f"@{user.username}" if user.username else None,
             gender=context.user_data.get('gender'),
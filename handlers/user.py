@@ -2,13 +2,18 @@
 Обработчики для пользовательских взаимодействий (сны, голосовые сообщения)
 """
 import os
+import asyncio
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes
 from telegram.error import BadRequest
-from core.database import db
+from core.database import get_db
 from core.ai_service import ai_service
+from core.error_handler import AIServiceError
 import re
-from core.config import MAIN_MENU, AI_SETTINGS, IMAGE_PATHS
+from core.config import MAIN_MENU, AI_SETTINGS, IMAGE_PATHS, STREAMING
+from core.streaming import balance_markdown, stream_to_message
+from core.voice_gate import voice_gate, REJECTION_MESSAGES
+from core.transcript_filter import analyze_transcript
 
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -32,7 +37,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_message = update.message.caption
     
     # Обновляем последнюю активность пользователя
-    db.update_latest_activity(user, chat_id)
+    get_db().update_latest_activity(user, chat_id)
     
     # Проверяем, является ли это ответом на сообщение (Reply)
     if update.message.reply_to_message:
@@ -62,8 +67,8 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Логирование и обработка сна
-    db.log_activity(user, chat_id, "message", user_message)
-    db.log_activity(user, chat_id, "gpt_request", f"model={AI_SETTINGS['model']}, temp={AI_SETTINGS['temperature']}, max_tokens={AI_SETTINGS['max_tokens']}")
+    get_db().log_activity(user, chat_id, "message", user_message)
+    get_db().log_activity(user, chat_id, "gpt_request", f"model={AI_SETTINGS['model']}, temp={AI_SETTINGS['temperature']}, max_tokens={AI_SETTINGS['max_tokens']}")
     
     # Отправка "размышляет"
     await context.bot.send_chat_action(chat_id=chat_id, action="typing")
@@ -114,29 +119,18 @@ async def process_clarification_question(update: Update, context: ContextTypes.D
     user = update.effective_user
     
     # Логируем уточняющий вопрос
-    db.log_activity(user, chat_id, "clarification_question", question)
+    get_db().log_activity(user, chat_id, "clarification_question", question)
     
     # Отправляем "размышляет"
     await context.bot.send_chat_action(chat_id=chat_id, action="typing")
     thinking_msg = await update.message.reply_text("〰️ Размышляю над твоим вопросом...")
     
     try:
-        # Создаем специальный промпт для уточняющего вопроса
-        clarification_prompt = f"""User asks: {question}
-
-Previous context: {context_summary}
-
-#Instructions: Answer the question thoroughly & warmly. Keep supportive tone. Use ❓ emoji. Be helpful & empathetic. Don't rewrite dream interpretation. Give useful advice if relevant. Russian language, informal 'ты'. Use the full context provided to give accurate and relevant answers."""
-
         # Получаем ответ от AI
-        reply = await ai_service.analyze_clarification_question(question, clarification_prompt)
+        reply = await ai_service.analyze_clarification_question(question, context_summary)
         
         # Логируем ответ
-        db.log_activity(user, chat_id, "clarification_answered", reply[:300])
-        
-        # Сохраняем сообщения
-        db.save_message(chat_id, "user", question)
-        db.save_message(chat_id, "assistant", reply)
+        get_db().log_activity(user, chat_id, "clarification_answered", reply[:300])
         
         # Определяем тип ответа для создания соответствующей клавиатуры
         message_type = ai_service.extract_message_type(reply)
@@ -147,19 +141,27 @@ Previous context: {context_summary}
                 [InlineKeyboardButton("📖 Сохранить в дневник снов", callback_data="save_dream:clarification")],
                 [InlineKeyboardButton("🔮 Астрологическое толкование", callback_data="astrological:clarification")]
             ])
-            # Сохраняем данные сна во временное хранилище для последующего сохранения
-            db.save_pending_dream(chat_id, question, reply, 'clarification')
+            # Сохраняем сообщения и данные сна, привязанные к сообщению с ответом (один round trip)
+            await get_db().commit_dream_interpretation(
+                chat_id, reply, dream_text=question, source_type='clarification', user_message=question,
+                message_id=thinking_msg.message_id
+            )
             print(f"🔍 DEBUG: Сохранен pending_dream для clarification в БД")
         else:
+            # Сохраняем сообщения
+            await get_db().commit_dream_interpretation(chat_id, reply, user_message=question)
             # Для других типов сообщений без кнопок
             keyboard = None
         
         # Отправляем ответ
         await thinking_msg.edit_text(reply, parse_mode='Markdown', reply_markup=keyboard)
         
+    except AIServiceError as e:
+        get_db().log_activity(user, chat_id, "clarification_error", f"{type(e).__name__}: {e.message}")
+        await thinking_msg.edit_text(e.user_message)
     except Exception as e:
         error_msg = f"❌ Ошибка при ответе на вопрос: {e}"
-        db.log_activity(user, chat_id, "clarification_error", str(e))
+        get_db().log_activity(user, chat_id, "clarification_error", str(e))
         # Для ошибок без кнопок
         await thinking_msg.edit_text(error_msg)
 
@@ -170,47 +172,43 @@ async def handle_voice_message(update: Update, context: ContextTypes.DEFAULT_TYP
     user = update.effective_user
     voice = update.message.voice
     
-    db.log_activity(user, chat_id, "voice_message", f"duration: {voice.duration}s")
+    get_db().log_activity(user, chat_id, "voice_message", f"duration: {voice.duration}s")
     
     # Обновляем последнюю активность пользователя
-    db.update_latest_activity(user, chat_id)
+    get_db().update_latest_activity(user, chat_id)
+    
+    # Слишком короткие и слишком длинные сообщения отсекаем, не скачивая
+    rejection = voice_gate.check_metadata(voice.duration, voice.file_size)
+    if rejection:
+        get_db().log_activity(user, chat_id, "voice_rejected", f"reason: {rejection}, size: {voice.file_size}")
+        await update.message.reply_text(REJECTION_MESSAGES[rejection])
+        return
     
     # Отправляем сообщение о начале обработки
     processing_msg = await update.message.reply_text("🎤 Получил голосовое сообщение, расшифровываю...")
     
     try:
-        # Скачиваем файл
-        file = await context.bot.get_file(voice.file_id)
-        file_content = await file.download_as_bytearray()
-        
-        # Транскрибируем через Whisper
-        transcribed_text = await ai_service.transcribe_voice(bytes(file_content), "ogg")
+        # Пересланное или повторно отправленное сообщение не скачиваем и не расшифровываем заново
+        cached = await get_db().get_transcription(voice.file_unique_id)
+        if cached is not None:
+            transcribed_text, rejection = cached
+            get_db().log_activity(user, chat_id, "voice_cache_hit", f"rejection: {rejection}")
+        else:
+            try:
+                transcribed_text, rejection = await _transcribe_voice_file(user, chat_id, context, voice)
+            except AIServiceError as e:
+                get_db().log_activity(user, chat_id, "voice_error", f"{type(e).__name__}: {e.message}")
+                await processing_msg.edit_text(e.user_message)
+                return
         
-        if not transcribed_text:
-            await processing_msg.edit_text(
-                "❌ Не удалось распознать речь. Попробуйте записать сообщение заново или написать текстом."
-            )
+        if rejection:
+            await processing_msg.edit_text(_voice_rejection_message(rejection))
             return
         
-        # Проверяем на подозрительность (галлюцинации Whisper)
-        should_reject, rejection_reason = ai_service.should_reject_voice_message(transcribed_text, voice.duration)
-        
-        # Детальное логирование для диагностики
-        db.log_activity(user, chat_id, "voice_analysis", 
-                       f"duration: {voice.duration}s, words: {len(transcribed_text.split())}, "
-                       f"text: '{transcribed_text[:100]}', should_reject: {should_reject}, reason: {rejection_reason}")
-        
-        if should_reject:
-            db.log_activity(user, chat_id, "voice_rejected", f"reason: {rejection_reason}, text: {transcribed_text}")
-            await processing_msg.edit_text(
-                "🤔 Не удалось распознать речь. Попробуйте записать сообщение четче или написать текстом."
-            )
-            return
-        
-        db.log_activity(user, chat_id, "voice_transcribed", transcribed_text[:100])
+        get_db().log_activity(user, chat_id, "voice_transcribed", transcribed_text[:100])
         
         # Обновляем статистику для голосовых сообщений
-        db.update_user_stats_audio(user, chat_id, transcribed_text)
+        get_db().update_user_stats_audio(user, chat_id, transcribed_text)
         
         try:
             # Показываем полную расшифровку и оставляем её видимой
@@ -233,84 +231,198 @@ async def handle_voice_message(update: Update, context: ContextTypes.DEFAULT_TYP
             await process_dream_text(update, context, transcribed_text, thinking_msg, 'voice')
         
     except Exception as e:
-        db.log_activity(user, chat_id, "voice_error", str(e))
+        get_db().log_activity(user, chat_id, "voice_error", str(e))
         await processing_msg.edit_text(
             f"❌ Ошибка при обработке голосового сообщения: {e}\n\nПопробуйте отправить текстом."
         )
 
 
-async def process_dream_text(update: Update, context: ContextTypes.DEFAULT_TYPE, dream_text: str, message_to_edit=None, source_type: str = 'text'):
-    """Обработка текста сна через OpenAI (используется для текста и голосовых)"""
-    chat_id = str(update.effective_chat.id)
-    user = update.effective_user
-    
-    # Обновляем статистику пользователя
-    db.update_user_stats(user, chat_id, dream_text)
-    
-    # Сохраняем сообщение пользователя
-    db.save_message(chat_id, "user", dream_text)
-    
-    # Загружаем историю сообщений
-    history = db.get_message_history(chat_id, AI_SETTINGS["max_history"])
-    
-    # Получаем профиль пользователя
-    profile = db.get_user_profile(chat_id)
-    profile_info = ai_service.format_profile_info(profile)
+async def _transcribe_voice_file(user, chat_id: str, context: ContextTypes.DEFAULT_TYPE, voice):
+    """
+    Скачивание и расшифровка голосового сообщения с проверками
+    
+    Результат - (текст, причина отказа) - сохраняется в кэш расшифровок;
+    ошибки AI пробрасываются и не кэшируются, чтобы повтор мог пройти.
+    """
+    # Скачиваем файл (в память, без временных файлов)
+    file = await context.bot.get_file(voice.file_id)
+    file_content = await file.download_as_bytearray()
+    
+    transcribed_text = None
+    # Тишину отсекаем до платного запроса к Whisper
+    rejection = await voice_gate.check_audio(file_content)
+    if rejection:
+        get_db().log_activity(user, chat_id, "voice_rejected", f"reason: {rejection}")
+    else:
+        # Транскрибируем через Whisper
+        transcribed_text = await ai_service.transcribe_voice(file_content, "ogg")
+        
+        if not transcribed_text:
+            rejection = "empty_text"
+        else:
+            # Проверяем на подозрительность (галлюцинации Whisper); разбор текста общий для вердикта и лога
+            analysis = analyze_transcript(transcribed_text, voice.duration)
+            should_reject, rejection_reason = ai_service.should_reject_voice_message(
+                transcribed_text, voice.duration, analysis
+            )
+            
+            # Детальное логирование для диагностики
+            get_db().log_activity(user, chat_id, "voice_analysis", 
+                           f"duration: {voice.duration}s, words: {len(analysis.words)}, "
+                           f"phrases: {analysis.suspicious_phrases}, "
+                           f"text: '{transcribed_text[:100]}', should_reject: {should_reject}, reason: {rejection_reason}")
+            
+            if should_reject:
+                get_db().log_activity(user, chat_id, "voice_rejected", f"reason: {rejection_reason}, text: {transcribed_text}")
+                rejection = rejection_reason or "suspicious"
+    
+    await _guarded_write(
+        get_db().save_transcription(voice.file_unique_id, transcribed_text, rejection),
+        user, chat_id, "save_transcription"
+    )
+    return transcribed_text, rejection
+
+
+def _voice_rejection_message(rejection: str) -> str:
+    """Ответ пользователю на отклоненное голосовое сообщение"""
+    if rejection in REJECTION_MESSAGES:
+        return REJECTION_MESSAGES[rejection]
+    if rejection == "empty_text":
+        return "❌ Не удалось распознать речь. Попробуйте записать сообщение заново или написать текстом."
+    # Подозрение на галлюцинации Whisper
+    return "🤔 Не удалось распознать речь. Попробуйте записать сообщение четче или написать текстом."
+
+
+async def _interpret_dream(user, chat_id: str, dream_text: str, history: list, profile_info: str, summary: str,
+                           message_to_edit=None):
+    """
+    Запрос толкования у AI; ошибки превращаются в ответ пользователю, а не в исключение
     
+    Если есть сообщение-заглушка, ответ выводится в него по мере генерации.
+    """
     try:
         # Анализируем сон через AI
-        reply = await ai_service.analyze_dream(dream_text, history, profile_info)
-        db.log_activity(user, chat_id, "dream_interpreted", reply[:300])
+        if message_to_edit and STREAMING["enabled"]:
+            reply = await stream_to_message(
+                message_to_edit, ai_service.stream_dream_analysis(dream_text, history, profile_info, summary)
+            )
+        else:
+            reply = await ai_service.analyze_dream(dream_text, history, profile_info, summary)
+        get_db().log_activity(user, chat_id, "dream_interpreted", reply[:300])
         
         # Классифицируем ответ для определения типа сообщения
-        message_type = ai_service.extract_message_type(reply)
+        return reply, ai_service.extract_message_type(reply)
     
+    except AIServiceError as e:
+        get_db().log_activity(user, chat_id, "dream_interpretation_error", f"{type(e).__name__}: {e.message}")
+        return e.user_message, 'error'
     except Exception as e:
-        reply = f"❌ Ошибка, повторите ещё раз: {e}"
-        db.log_activity(user, chat_id, "dream_interpretation_error", str(e))
+        get_db().log_activity(user, chat_id, "dream_interpretation_error", str(e))
+        return f"❌ Ошибка, повторите ещё раз: {e}", 'error'
+
+
+async def _guarded_write(write, user, chat_id: str, action: str):
+    """Запись в БД, ошибка которой логируется, но не ломает ответ пользователю"""
+    try:
+        await write
+    except Exception as e:
+        print(f"❌ Ошибка записи в БД ({action}): {e}")
+        get_db().log_activity(user, chat_id, f"{action}_error", str(e))
+
+
+async def process_dream_text(update: Update, context: ContextTypes.DEFAULT_TYPE, dream_text: str, message_to_edit=None, source_type: str = 'text'):
+    """Обработка текста сна через OpenAI (используется для текста и голосовых)"""
+    chat_id = str(update.effective_chat.id)
+    user = update.effective_user
     
-    # Сохраняем ответ ассистента
-    db.save_message(chat_id, "assistant", reply)
+    # Обновляем статистику пользователя
+    get_db().update_user_stats(user, chat_id, dream_text)
+    
+    # Ждем только то, что нужно GPT: историю, профиль и пересказ переписки (один round trip)
+    history, profile_info, summary = await get_db().load_dream_context(chat_id, AI_SETTINGS["max_history"])
+    
+    # Сообщение пользователя сохраняется параллельно с запросом к AI
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(_guarded_write(get_db().save_message(chat_id, "user", dream_text), user, chat_id, "save_user_message"))
+        interpretation = tg.create_task(_interpret_dream(
+            user, chat_id, dream_text, history, profile_info, summary, message_to_edit
+        ))
+    reply, message_type = interpretation.result()
     
     # Создаем клавиатуру в зависимости от типа сообщения
     if message_type == 'dream':
-        # Для толкований снов добавляем две кнопки
+        # Для толкований снов добавляем две кнопки (данные сна ищутся по сообщению с кнопкой)
         keyboard = InlineKeyboardMarkup([
             [InlineKeyboardButton("📖 Сохранить в дневник снов", callback_data=f"save_dream:{source_type}")],
             [InlineKeyboardButton("🔮 Астрологическое толкование", callback_data=f"astrological:{source_type}")]
         ])
-        # Сохраняем данные сна во временное хранилище для последующего сохранения
-        db.save_pending_dream(chat_id, dream_text, reply, source_type)
-        print(f"🔍 DEBUG: Сохранен pending_dream для {source_type} в БД")
     else:
         # Для других типов сообщений без кнопок
         keyboard = None
     
     # Отправляем или редактируем сообщение с результатом
+    sent_msg = None
     if message_to_edit:
+        # Редактируем сообщение "Размышляю..." на толкование (финальная правка при потоковом выводе)
+        sent_msg = await _edit_reply(message_to_edit, reply, keyboard)
+    if sent_msg is None:
+        # Сообщения для правки больше нет - отправляем новое
         try:
-            # Редактируем сообщение "Размышляю..." на толкование
-            if keyboard:
-                await message_to_edit.edit_text(reply, parse_mode='Markdown', reply_markup=keyboard)
-                # Сохраняем ID сообщения с толкованием для будущих операций
-                context.user_data['dream_interpretation_msg_id'] = message_to_edit.message_id
-            else:
-                await message_to_edit.edit_text(reply, parse_mode='Markdown')
-        except BadRequest:
-            # Если не удается редактировать, отправляем новое сообщение
-            if keyboard:
-                sent_msg = await update.message.reply_text(reply, parse_mode='Markdown', reply_markup=keyboard)
-                # Сохраняем ID сообщения с толкованием
-                context.user_data['dream_interpretation_msg_id'] = sent_msg.message_id
-            else:
-                await update.message.reply_text(reply, parse_mode='Markdown')
-    else:
-        if keyboard:
             sent_msg = await update.message.reply_text(reply, parse_mode='Markdown', reply_markup=keyboard)
-            # Сохраняем ID сообщения с толкованием
-            context.user_data['dream_interpretation_msg_id'] = sent_msg.message_id
-        else:
-            await update.message.reply_text(reply, parse_mode='Markdown')
+        except BadRequest as e:
+            if not _is_parse_error(e):
+                raise
+            sent_msg = await update.message.reply_text(reply, reply_markup=keyboard)
+    
+    if keyboard:
+        # Сохраняем ID сообщения с толкованием для будущих операций
+        context.user_data['dream_interpretation_msg_id'] = sent_msg.message_id
+        # Сохраняем ответ ассистента и данные сна, привязанные к этому сообщению (один round trip)
+        await _guarded_write(
+            get_db().commit_dream_interpretation(
+                chat_id, reply, dream_text=dream_text, source_type=source_type, message_id=sent_msg.message_id
+            ),
+            user, chat_id, "commit_interpretation"
+        )
+        print(f"🔍 DEBUG: Сохранен pending_dream для {source_type} в БД")
+    elif message_type != 'error':
+        # Сохраняем ответ ассистента (сообщения об ошибках в историю не попадают)
+        await _guarded_write(get_db().commit_dream_interpretation(chat_id, reply), user, chat_id, "commit_interpretation")
+
+
+def _is_parse_error(error: BadRequest) -> bool:
+    """Telegram не смог разобрать Markdown в тексте"""
+    return "can't parse" in str(error).lower()
+
+
+async def _edit_reply(message, reply: str, keyboard):
+    """
+    Финальная правка сообщения с ответом
+
+    Если Telegram не разбирает разметку, правка повторяется с закрытой
+    разметкой, затем без нее.
+
+    Returns:
+        Отредактированное сообщение или None, если править его уже нельзя
+    """
+    attempts = [(reply, 'Markdown')]
+    balanced = balance_markdown(reply)
+    if balanced != reply:
+        attempts.append((balanced, 'Markdown'))
+    attempts.append((reply, None))
+
+    for text, parse_mode in attempts:
+        try:
+            await message.edit_text(text, parse_mode=parse_mode, reply_markup=keyboard)
+            return message
+        except BadRequest as e:
+            # Текст и клавиатура уже совпадают с последней потоковой правкой
+            if "not modified" in str(e):
+                return message
+            if not _is_parse_error(e):
+                print(f"⚠️ Не удалось отредактировать сообщение с ответом: {e}")
+                return None
+    return None
 
 
 async def start_first_dream_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -0,0 +1,8 @@
+"""
+Общие настройки тестов
+"""
+import os
+
+# Модули core читают ключи при импорте; сетевых запросов тесты не делают
+os.environ.setdefault("TELEGRAM_TOKEN", "123:test")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
@@ -0,0 +1,37 @@
+"""
+Курсор keyset-пагинации дневника снов в callback_data
+"""
+from datetime import datetime, timezone
+
+import pytest
+
+from core.models import PaginationHelper
+
+
+@pytest.mark.parametrize("created_at, item_id", [
+    (datetime(2024, 3, 15, 23, 59, 59, 999999), 1),
+    (datetime(2025, 1, 1), 42),
+    (datetime(1970, 1, 1, 0, 0, 0, 1), 7),
+    (datetime(2099, 12, 31, 12, 30, 0, 123456), 2 ** 31 - 1),
+])
+def test_cursor_roundtrip(created_at, item_id):
+    cursor = PaginationHelper.encode_cursor(created_at, item_id)
+    assert PaginationHelper.decode_cursor(*cursor.split(":")) == (created_at, item_id)
+
+
+def test_cursor_drops_timezone():
+    # Время из БД сравнивается без часового пояса, микросекунды сохраняются
+    created_at = datetime(2024, 6, 1, 8, 15, 30, 500, tzinfo=timezone.utc)
+    cursor = PaginationHelper.encode_cursor(created_at, 5)
+    assert PaginationHelper.decode_cursor(*cursor.split(":")) == (created_at.replace(tzinfo=None), 5)
+
+
+def test_cursor_fits_callback_data():
+    cursor = PaginationHelper.encode_cursor(datetime(2099, 12, 31, 23, 59, 59, 999999), 2 ** 63 - 1)
+    callback_data = f"diary_page:9999:next:{cursor}"
+    # Ограничение Telegram на callback_data - 64 байта
+    assert len(callback_data.encode()) <= 64
+
+    parts = callback_data.split(":")
+    assert len(parts) == 5
+    assert PaginationHelper.decode_cursor(parts[3], parts[4])[1] == 2 ** 63 - 1
@@ -0,0 +1,152 @@
+"""
+Ogg/Opus: сборка файла из пакетов, обратный разбор и разбиение на части
+"""
+import struct
+
+import pytest
+
+from core.ogg_opus import (
+    OPUS_GRANULE_RATE, OpusPacket, OpusStream, iter_pages, ogg_crc, parse_opus, split_opus, write_opus
+)
+
+# TOC: конфигурация 1 (SILK, 20 мс), один кадр
+TOC_20MS = 0x08
+PRE_SKIP = 312
+
+
+def make_packet(size: int) -> OpusPacket:
+    data = bytes([TOC_20MS]) + bytes((i * 7) % 256 for i in range(size - 1))
+    return OpusPacket(data, 0.02, 0)
+
+
+def make_stream(packets) -> OpusStream:
+    head = b"OpusHead" + bytes([1, 1]) + struct.pack("<HIhB", PRE_SKIP, 48000, 0, 0)
+    tags = b"OpusTags" + struct.pack("<I", 4) + b"test" + struct.pack("<I", 0)
+    return OpusStream(head, tags, 0x1234, list(packets))
+
+
+def roundtrip(packets):
+    stream = make_stream(packets)
+    data = write_opus(stream, stream.packets)
+    return data, parse_opus(data)
+
+
+def test_roundtrip_keeps_headers_and_packets():
+    sizes = [1, 2, 60, 254, 255, 256, 300, 510, 765, 1000]
+    data, parsed = roundtrip([make_packet(size) for size in sizes])
+
+    assert parsed is not None
+    stream = make_stream([])
+    assert parsed.head == stream.head
+    assert parsed.tags == stream.tags
+    assert parsed.serial == stream.serial
+    assert [len(packet.data) for packet in parsed.packets] == sizes
+    assert parsed.duration == pytest.approx(0.02 * len(sizes))
+
+
+@pytest.mark.parametrize("size", [255, 510, 255 * 10])
+def test_packet_multiple_of_255_ends_with_empty_segment(size):
+    packet = make_packet(size)
+    _, parsed = roundtrip([packet, make_packet(10)])
+
+    # Без завершающего нулевого сегмента пакет слился бы со следующим
+    assert [p.data for p in parsed.packets] == [packet.data, make_packet(10).data]
+
+
+def test_pages_respect_segment_limit():
+    # 2000 байт = 8 сегментов: в страницу помещается 31 пакет, а не _PACKETS_PER_PAGE
+    packets = [make_packet(2000) for _ in range(100)]
+    data, parsed = roundtrip(packets)
+
+    pages = list(iter_pages(data))
+    audio_pages = pages[2:]
+    assert len(audio_pages) > 2
+    assert all(len(page.segments) <= 255 for page in pages)
+    assert [page.sequence for page in pages] == list(range(len(pages)))
+    assert pages[0].header_type == 0x02
+    assert audio_pages[-1].header_type == 0x04
+    assert all(page.header_type == 0 for page in audio_pages[:-1])
+    assert [p.data for p in parsed.packets] == [p.data for p in packets]
+
+
+def test_granule_and_crc():
+    packets = [make_packet(40) for _ in range(120)]
+    data, _ = roundtrip(packets)
+
+    pages = list(iter_pages(data))
+    assert pages[-1].granule == PRE_SKIP + round(120 * 0.02 * OPUS_GRANULE_RATE)
+
+    offset = 0
+    for page in pages:
+        size = 27 + len(page.segments) + sum(page.segments)
+        raw = bytearray(data[offset:offset + size])
+        crc = struct.unpack_from("<I", raw, 22)[0]
+        struct.pack_into("<I", raw, 22, 0)
+        assert ogg_crc(bytes(raw)) == crc
+        offset += size
+    assert offset == len(data)
+
+
+def test_packet_larger_than_page_is_rejected():
+    with pytest.raises(ValueError):
+        roundtrip([make_packet(255 * 255)])
+
+
+def test_parse_rejects_non_opus():
+    assert parse_opus(b"") is None
+    assert parse_opus(b"RIFF" + bytes(100)) is None
+
+
+# === РАЗБИЕНИЕ ===
+
+def speech_with_pauses(seconds: float, pauses):
+    """Пакеты по 20 мс: речь - 80 байт, в паузах [(начало, конец), ...] - 3 байта"""
+    packets = []
+    for i in range(round(seconds / 0.02)):
+        t = i * 0.02
+        quiet = any(start <= t < end for start, end in pauses)
+        packets.append(make_packet(3 if quiet else 80))
+    return make_stream(packets)
+
+
+def packet_indexes(stream, chunks):
+    index = {id(packet): i for i, packet in enumerate(stream.packets)}
+    return [[index[id(packet)] for packet in chunk] for chunk in chunks]
+
+
+def test_split_cuts_in_pauses_with_overlap():
+    stream = speech_with_pauses(30, [(9.0, 9.5), (19.4, 19.9)])
+    chunks = packet_indexes(stream, split_opus(stream, chunk_seconds=10, overlap_seconds=1.0, boundary_window=2.0))
+
+    assert len(chunks) == 3
+    # Части идут подряд, без пропусков, и вместе покрывают весь поток
+    assert chunks[0][0] == 0
+    assert chunks[-1][-1] == len(stream.packets) - 1
+    for chunk in chunks:
+        assert chunk == list(range(chunk[0], chunk[-1] + 1))
+
+    boundaries = [chunk[-1] + 1 for chunk in chunks[:-1]]
+    # Граница - внутри паузы (все пять пакетов окна громкости тихие)
+    assert 9.0 <= boundaries[0] * 0.02 <= 9.5 - 0.1
+    assert 19.4 <= boundaries[1] * 0.02 <= 19.9 - 0.1
+    # Следующая часть начинается на overlap_seconds раньше границы
+    for boundary, chunk in zip(boundaries, chunks[1:]):
+        assert (boundary - chunk[0]) * 0.02 == pytest.approx(1.0, abs=0.021)
+
+
+def test_split_boundary_stays_in_window():
+    # Паузы нет: граница все равно в пределах окна вокруг целевой точки
+    stream = speech_with_pauses(25, [])
+    chunks = split_opus(stream, chunk_seconds=10, overlap_seconds=0.5, boundary_window=1.0)
+    first = packet_indexes(stream, chunks)[0]
+    assert 9.0 <= len(first) * 0.02 <= 11.0
+
+
+def test_split_short_stream_is_one_chunk():
+    stream = speech_with_pauses(12, [])
+    chunks = split_opus(stream, chunk_seconds=10, overlap_seconds=1.0, boundary_window=2.0)
+    assert packet_indexes(stream, chunks) == [list(range(len(stream.packets)))]
+
+
+def test_split_empty_stream():
+    assert split_opus(make_stream([]), chunk_seconds=10, overlap_seconds=1.0, boundary_window=2.0) == []
@@ -0,0 +1,36 @@
+"""
+Порядок частей запроса толкования: неизменный префикс для кэша промптов
+"""
+from core.config import DEFAULT_SYSTEM_PROMPT
+from core.prompts import dream_messages, fit_history
+from core.tokens import token_counter
+
+HISTORY = [
+    {"role": "user" if i % 2 == 0 else "assistant", "content": f"сообщение {i} " + "текст " * 20}
+    for i in range(10)
+]
+
+
+def test_static_prefix_comes_first():
+    first = dream_messages("сон про море", HISTORY, "Пол: женский", "", 100000)
+    second = dream_messages("сон про лес", HISTORY, "Пол: мужской", "пересказ", 100000)
+
+    # Инструкции и история побайтно совпадают, меняется только хвост
+    assert first[0] == {"role": "system", "content": DEFAULT_SYSTEM_PROMPT}
+    assert first[:-2] == second[:-2]
+    assert first[1:-2] == [{"role": m["role"], "content": m["content"]} for m in HISTORY]
+
+
+def test_changing_context_goes_last():
+    messages = dream_messages("сон про море", HISTORY, "Пол: женский", "пересказ", 100000)
+    context, dream = messages[-2:]
+    assert context["role"] == "system"
+    assert "Пол: женский" in context["content"] and "пересказ" in context["content"]
+    assert dream["role"] == "user" and dream["content"].endswith("сон про море")
+
+
+def test_history_is_cut_from_the_oldest():
+    budget = token_counter.count_messages(HISTORY[-3:])
+    fitted = fit_history(HISTORY, budget)
+    assert [m["content"] for m in fitted] == [m["content"] for m in HISTORY[-3:]]
+    assert fit_history(HISTORY, 0) == []
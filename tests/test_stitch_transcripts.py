@@ -0,0 +1,55 @@
+"""
+Склейка расшифровок перекрывающихся частей голосового сообщения
+"""
+import pytest
+
+from core.ai_service import AIService
+
+stitch = AIService.stitch_transcripts
+
+
+@pytest.mark.parametrize("texts, expected", [
+    # Повтор на стыке удаляется
+    (["я шел по длинному коридору", "длинному коридору и увидел дверь"],
+     "я шел по длинному коридору и увидел дверь"),
+    # Регистр и пунктуация при сравнении не учитываются
+    (["Потом я открыл дверь, и там", "дверь. И там был сад"],
+     "Потом я открыл дверь, и там был сад"),
+    # Первое слово следующей части обрезано границей
+    (["мы пошли в старый дом у реки", "ом у реки и там"],
+     "мы пошли в старый дом у реки и там"),
+    # Одно длинное слово в самом начале - повтор
+    (["вокруг была темнота", "темнота и тишина"],
+     "вокруг была темнота и тишина"),
+    # Одно короткое слово может быть настоящим повтором речи
+    (["я видел кота", "кота и собаку"],
+     "я видел кота кота и собаку"),
+    # Без перекрытия части просто соединяются
+    (["первая часть", "вторая часть"],
+     "первая часть вторая часть"),
+])
+def test_stitch_removes_overlap(texts, expected):
+    assert stitch(texts, max_overlap_words=12) == expected
+
+
+def test_stitch_three_parts():
+    texts = [
+        "мне снилось море и большой корабль",
+        "и большой корабль уплывал на север",
+        "уплывал на север а я стоял на берегу",
+    ]
+    assert stitch(texts, max_overlap_words=12) == (
+        "мне снилось море и большой корабль уплывал на север а я стоял на берегу"
+    )
+
+
+def test_stitch_overlap_is_limited():
+    texts = ["раз два три четыре пять", "раз два три четыре пять шесть"]
+    # Перекрытие длиннее max_overlap_words не распознается
+    assert stitch(texts, max_overlap_words=2) == "раз два три четыре пять раз два три четыре пять шесть"
+    assert stitch(texts, max_overlap_words=5) == "раз два три четыре пять шесть"
+
+
+def test_stitch_empty_parts():
+    assert stitch([], max_overlap_words=12) == ""
+    assert stitch(["", "текст сна", ""], max_overlap_words=12) == "текст сна"
@@ -0,0 +1,95 @@
+"""
+Закрытие разметки Markdown в потоковом ответе и финальная правка сообщения
+"""
+import asyncio
+
+import pytest
+from telegram.error import BadRequest
+
+from core.streaming import balance_markdown
+from handlers.user import _edit_reply
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Разметка закрыта - текст не меняется
+    ("*Символ* сна - _вода_ и `код`", "*Символ* сна - _вода_ и `код`"),
+    ("", ""),
+    # Незакрытые маркеры закрываются
+    ("🌙 *Толкование сна", "🌙 *Толкование сна*"),
+    ("вода - символ _бессознательного", "вода - символ _бессознательного_"),
+    ("пример `кода", "пример `кода`"),
+    ("```\nблок кода", "```\nблок кода```"),
+    # Вложенные - в обратном порядке
+    ("*жирный и _курсив", "*жирный и _курсив_*"),
+    ("_курсив и *жирный", "_курсив и *жирный*_"),
+    # Внутри кода * и _ - обычные символы
+    ("`a*b_c", "`a*b_c`"),
+    ("*жирный `a_b", "*жирный `a_b`*"),
+    # Экранированный маркер не открывает разметку
+    ("цена 5\\* звезд", "цена 5\\* звезд"),
+])
+def test_balance_closes_markers(text, expected):
+    assert balance_markdown(text) == expected
+
+
+def test_balance_cuts_unfinished_link():
+    assert balance_markdown("*см.* [статью](https://exa") == "*см.* "
+    assert balance_markdown("_текст [ссылк") == "_текст _"
+    assert balance_markdown("[статья](https://example.com) и *далее") == "[статья](https://example.com) и *далее*"
+
+
+def test_balance_keeps_plain_brackets():
+    assert balance_markdown("[1] и *сон") == "[1] и *сон*"
+
+
+@pytest.mark.parametrize("text", [
+    "*Сон* о _море_ и `ключе`",
+    "Толкование: *страх _потери",
+    "```\nкод `внутри",
+])
+def test_balance_is_idempotent(text):
+    balanced = balance_markdown(text)
+    assert balance_markdown(balanced) == balanced
+
+
+# === ФИНАЛЬНАЯ ПРАВКА ===
+
+class FakeMessage:
+    """Сообщение, правка которого отклоняется заданными ошибками по очереди"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.edits = []
+
+    async def edit_text(self, text, parse_mode=None, reply_markup=None):
+        self.edits.append((text, parse_mode))
+        if self.errors:
+            raise BadRequest(self.errors.pop(0))
+
+
+def edit_reply(message, reply):
+    return asyncio.run(_edit_reply(message, reply, None))
+
+
+def test_final_edit_retries_with_balanced_markdown():
+    message = FakeMessage("Can't parse entities: can't find end of the entity")
+    assert edit_reply(message, "*Толкование") is message
+    assert message.edits == [("*Толкование", "Markdown"), ("*Толкование*", "Markdown")]
+
+
+def test_final_edit_falls_back_to_plain_text():
+    message = FakeMessage("Can't parse entities: a", "Can't parse entities: b")
+    assert edit_reply(message, "*Толкование") is message
+    assert message.edits[-1] == ("*Толкование", None)
+
+
+def test_final_edit_not_modified_is_success():
+    message = FakeMessage("Message is not modified: specified new message content is the same")
+    assert edit_reply(message, "текст") is message
+    assert len(message.edits) == 1
+
+
+def test_final_edit_of_deleted_message():
+    message = FakeMessage("Message to edit not found")
+    assert edit_reply(message, "*текст") is None
+    assert len(message.edits) == 1
@@ -0,0 +1,70 @@
+"""
+Поиск фраз-галлюцинаций Whisper: совпадение только целым словом
+"""
+import re
+
+import pytest
+
+from core.transcript_filter import PhraseMatcher, analyze_transcript
+
+PHRASES = ["ой", "блин", "тестирование", "бит", "последние новости", "новости", "пока пока", "♪", "YouTube"]
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    return PhraseMatcher(PHRASES)
+
+
+def reference(text: str):
+    """Эталон: (?<!\\w)фраза(?!\\w) для каждой фразы"""
+    text = text.lower()
+    return sorted(
+        phrase.lower() for phrase in PHRASES
+        if re.search(r"(?<!\w)" + re.escape(phrase.lower()) + r"(?!\w)", text)
+    )
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("ой", ["ой"]),
+    ("Ой-ой-ой", ["ой"]),
+    ("ой— ну и сон", ["ой"]),
+    ("ой?..", ["ой"]),
+    ("«Ой», сказал он", ["ой"]),
+    ("блин!!!!", ["блин"]),
+    ("тестирование;)", ["тестирование"]),
+    ("(бит)", ["бит"]),
+    ("Последние новости.", ["новости", "последние новости"]),
+    ("пока пока!", ["пока пока"]),
+    ("♪♪ ля-ля", ["♪"]),
+    ("смотри на youtube.", ["youtube"]),
+])
+def test_whole_word_positives(matcher, text, expected):
+    assert sorted(matcher.find_all(text.lower())) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "мой страх",
+    "обитатель леса",
+    "другой дом, где было плохо",
+    "блинчики на завтраке",
+    "новостной выпуск",
+    "пока покажу",
+    "",
+])
+def test_whole_word_negatives(matcher, text):
+    assert matcher.find_all(text.lower()) == []
+
+
+@pytest.mark.parametrize("text", [
+    "Ой-ой-ой, мой сон про обитателя... последние новости; блин!!!! ♪ пока пока",
+    "тестирование;) — новости: бит, YouTube?!",
+    "_ой_ ой_ой ой",
+])
+def test_matches_regex_reference(matcher, text):
+    assert sorted(matcher.find_all(text.lower())) == reference(text)
+
+
+def test_analysis_uses_whole_words():
+    # "ой" внутри "мой" не делает короткое сообщение подозрительным
+    assert analyze_transcript("Мой страх", 2).verdict() == (False, "")
+    assert analyze_transcript("Ой-ой-ой", 2).suspicious_phrases == ["ой"]